@@ -0,0 +1,92 @@
+# AnswerWithFollowupsBenchmark.py
+# Compares the two-call flow (ask_question, then generate_followups, which sends the answer back
+# as input) with ask_question_with_followups, which gets the answer and its follow-ups from one
+# structured completion. Reports wall time and the tokens sent and received per turn.
+# Runs against MockOpenAIServer, so no API key or network access is needed. The mock server's
+# generation time grows with the length of each reply, like a real model's.
+#
+#     % python AnswerWithFollowupsBenchmark.py
+
+import json
+import os
+import statistics
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+sys.path.append(os.path.abspath(os.path.join(current_dir, os.pardir)))
+
+from MockOpenAIServer import MockOpenAIServer
+
+INSTRUCTIONS = "You are a very helpful assistant."
+MODEL = "gpt-4o"
+NUM_FOLLOWUPS = 3
+MAX_WORDS = 25
+ROUNDS = 5
+ANSWER = ("Event-driven programming means the app waits for things to happen, such as a button click or a "
+          "timer firing, and runs the blocks attached to that event. Each screen component exposes events, "
+          "and you drag the matching event block onto the canvas and put the actions inside it.")
+FOLLOWUPS = ["How do I respond to a button click?", "Can one event trigger another event?",
+             "How do timers work in Thunkable?"]
+
+
+class TokenCounter:
+    """Mock reply function that also counts the tokens of every request and reply."""
+
+    def __init__(self, count_tokens):
+        self._count_tokens = count_tokens
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def __call__(self, body):
+        if body.get("response_format"):
+            followups = {f"item_{index}": followup for index, followup in enumerate(FOLLOWUPS, start=1)}
+            reply = json.dumps({"answer": ANSWER, "followups": followups})
+        elif "follow-up" in body["messages"][0]["content"]:
+            reply = "\n".join(FOLLOWUPS)
+        else:
+            reply = ANSWER
+        self.input_tokens += sum(self._count_tokens(message["content"], MODEL) for message in body["messages"])
+        self.output_tokens += self._count_tokens(reply, MODEL)
+        return reply
+
+
+def measure(label, counter, turn):
+    times = []
+    counter.input_tokens = counter.output_tokens = 0
+    for i in range(ROUNDS):
+        start = time.perf_counter()
+        turn(f"Question {i}: what is event-driven programming?")
+        times.append(time.perf_counter() - start)
+    print(f"{label:<32} median {statistics.median(times) * 1000:7.1f} ms   "
+          f"input {counter.input_tokens / ROUNDS:6.0f} tokens   output {counter.output_tokens / ROUNDS:5.0f} tokens")
+
+
+def main():
+    from PeopleCodeOpenAI import OpenAI_Conversation, count_tokens
+
+    counter = TokenCounter(count_tokens)
+    server = MockOpenAIServer(reply=counter).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    print(f"Per turn, median wall time of {ROUNDS} turns, each on a new conversation\n")
+
+    def two_calls(question):
+        conversation = OpenAI_Conversation(api_key="benchmark", model=MODEL)
+        answer = conversation.ask_question(INSTRUCTIONS, question)
+        conversation.generate_followups(question, answer, NUM_FOLLOWUPS, MAX_WORDS)
+
+    def one_call(question):
+        conversation = OpenAI_Conversation(api_key="benchmark", model=MODEL)
+        conversation.set_structured_output(True)
+        conversation.ask_question_with_followups(INSTRUCTIONS, question, NUM_FOLLOWUPS, MAX_WORDS)
+
+    measure("ask_question + generate_followups", counter, two_calls)
+    measure("ask_question_with_followups", counter, one_call)
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# AssistantRunBenchmark.py
+# Compares the latency of the original poll-based assistant flow (create_and_poll followed by
+# messages.list) with the event-streamed runs used by OpenAI_Conversation._ask_assistant.
+# Runs against MockOpenAIServer, so no API key or network access is needed.
+#
+#     % python AssistantRunBenchmark.py
+
+import os
+import statistics
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+sys.path.append(os.path.abspath(os.path.join(current_dir, os.pardir)))
+
+from openai import OpenAI
+from MockOpenAIServer import MockOpenAIServer
+
+ASSISTANT_ID = "asst_benchmark"
+INSTRUCTIONS = "You are a very helpful assistant."
+ROUNDS = 5
+
+
+def polled_ask_assistant(client, instructions, question, assistant_id):
+    """The assistant flow before event streaming: new thread, create_and_poll, then list all messages."""
+    thread = client.beta.threads.create()
+    client.beta.threads.messages.create(thread_id=thread.id, role="user", content=question)
+    run = client.beta.threads.runs.create_and_poll(thread_id=thread.id, assistant_id=assistant_id,
+                                                   instructions=instructions)
+    if run.status == 'completed':
+        messages = client.beta.threads.messages.list(thread_id=thread.id)
+        for message in messages.data:
+            if message.role == "assistant":
+                return message.content[0].text.value
+    return ""
+
+
+def measure(label, ask):
+    first_token, total = [], []
+    for i in range(ROUNDS):
+        start = time.perf_counter()
+        first = None
+        for _ in ask(f"Question {i}"):
+            if first is None:
+                first = time.perf_counter() - start
+        total.append(time.perf_counter() - start)
+        first_token.append(first)
+    print(f"{label:<28} first text {statistics.median(first_token) * 1000:8.1f} ms   "
+          f"complete {statistics.median(total) * 1000:8.1f} ms")
+
+
+def main():
+    server = MockOpenAIServer().start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    from PeopleCodeOpenAI import OpenAI_Conversation
+
+    print(f"Simulated generation time: {server.generation_time() * 1000:.0f} ms, "
+          f"poll interval: {server.poll_after_ms} ms, median of {ROUNDS} runs\n")
+
+    client = OpenAI(api_key="benchmark", base_url=server.base_url)
+    measure("create_and_poll + list", lambda q: [polled_ask_assistant(client, INSTRUCTIONS, q, ASSISTANT_ID)])
+
+    conversation = OpenAI_Conversation(api_key="benchmark")
+    measure("streamed run (complete)", lambda q: [conversation.ask_question(INSTRUCTIONS, q, ASSISTANT_ID)])
+    measure("streamed run (deltas)", lambda q: conversation.ask_question_stream(INSTRUCTIONS, q, ASSISTANT_ID))
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# MockOpenAIServer.py
+# A small local stand-in for the parts of the OpenAI REST API used by PeopleCodeOpenAI.
+# It simulates model latency so the benchmarks in this folder can compare request strategies
+# without an API key or network access.
+
+import base64
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIMENSIONS = 256
+
+
+class MockOpenAIServer:
+    def __init__(self, reply="This is a simulated answer from the mock server.", first_token_delay=0.3,
+                 token_delay=0.01, poll_after_ms=500, batch_delay=0.5, embedding_delay=0.05):
+        """
+        Initializes the mock server. Call start() to begin serving on a free local port.
+
+        Args:
+            reply: The text every chat completion and assistant run answers with, or a function that
+                   receives a chat completion request body and returns the answer.
+            first_token_delay: Seconds before the first token of an answer is available.
+            token_delay: Seconds between two streamed tokens.
+            poll_after_ms: Poll interval suggested to clients through the 'openai-poll-after-ms' header.
+            batch_delay: Seconds a batch stays in progress before it completes.
+            embedding_delay: Seconds an embeddings request takes, whatever the number of inputs.
+        """
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.poll_after_ms = poll_after_ms
+        self.batch_delay = batch_delay
+        self.embedding_delay = embedding_delay
+        self.request_count = 0
+        self._threads = {}
+        self._runs = {}
+        self._files = {}
+        self._batches = {}
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        """The base URL to pass to OpenAI(base_url=...)."""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        """Starts serving in a background thread and returns self."""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                mock._dispatch(self, "GET")
+
+            def do_POST(self):
+                mock._dispatch(self, "POST")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next(self, count=1, status=429, headers=None):
+        """
+        Makes the next requests fail, whatever their route, to simulate rate limits and outages.
+
+        Args:
+            count: The number of requests to fail.
+            status: The HTTP status of the failed responses.
+            headers: Extra response headers, such as {'retry-after-ms': '100'}.
+        """
+        with self._lock:
+            self._failures.extend([(status, dict(headers or {}))] * count)
+
+    def reply_text(self, body=None):
+        """Returns the answer to a chat completion request body."""
+        return self.reply(body or {}) if callable(self.reply) else self.reply
+
+    def tokens(self, text=None):
+        """Splits an answer into the pieces that are streamed one by one."""
+        words = (self.reply_text() if text is None else text).split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def generation_time(self, text=None):
+        """Seconds the simulated model needs to produce a whole answer."""
+        return self.first_token_delay + self.token_delay * len(self.tokens(text))
+
+    def _dispatch(self, handler, method):
+        with self._lock:
+            self.request_count += 1
+            failure = self._failures.pop(0) if self._failures else None
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw_body = handler.rfile.read(length) if length else b""
+        if failure is not None:
+            status, headers = failure
+            return self._send_json(handler, {"error": {"message": "Simulated failure", "type": "rate_limit_exceeded"
+                                                       if status == 429 else "server_error"}}, headers, status)
+        path, _, query = handler.path.partition("?")
+        params = dict(item.split("=", 1) for item in query.split("&") if "=" in item)
+        parts = path.strip("/").split("/")[1:]
+
+        if parts == ["files"] and method == "POST":
+            return self._upload_file(handler, raw_body)
+        if len(parts) == 3 and parts[0] == "files" and parts[2] == "content":
+            return self._send_bytes(handler, self._files[parts[1]]["content"])
+        if parts == ["batches"] and method == "POST":
+            return self._create_batch(handler, json.loads(raw_body))
+        if len(parts) == 2 and parts[0] == "batches" and method == "GET":
+            return self._send_json(handler, self._batch_state(parts[1]))
+
+        body = json.loads(raw_body) if raw_body else {}
+        if parts == ["chat", "completions"]:
+            return self._chat_completion(handler, body)
+        if parts == ["embeddings"]:
+            return self._embeddings(handler, body)
+        if parts == ["threads"] and method == "POST":
+            thread_id = "thread_" + uuid.uuid4().hex
+            self._threads[thread_id] = []
+            return self._send_json(handler, {"id": thread_id, "object": "thread", "created_at": int(time.time()),
+                                             "metadata": {}, "tool_resources": None})
+        if len(parts) >= 3 and parts[0] == "threads":
+            thread_id = parts[1]
+            if parts[2:] == ["messages"] and method == "POST":
+                message = self._message(thread_id, "user", body["content"])
+                self._threads[thread_id].append(message)
+                return self._send_json(handler, message)
+            if parts[2:] == ["messages"] and method == "GET":
+                return self._list_messages(handler, thread_id, params)
+            if parts[2:] == ["runs"] and method == "POST":
+                return self._create_run(handler, thread_id, body)
+            if len(parts) == 4 and parts[2] == "runs" and method == "GET":
+                return self._send_json(handler, self._run_state(parts[3]),
+                                       {"openai-poll-after-ms": str(self.poll_after_ms)})
+        self._send_json(handler, {"error": {"message": f"Unknown route {method} {path}"}}, status=404)
+
+    def _completion_object(self, body, text):
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        return {"id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "gpt-4"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(self.tokens(text)),
+                          "total_tokens": prompt_tokens + len(self.tokens(text))}}
+
+    def _chat_completion(self, handler, body):
+        model = body.get("model", "gpt-4")
+        text = self.reply_text(body)
+        completion = self._completion_object(body, text)
+        if not body.get("stream"):
+            time.sleep(self.generation_time(text))
+            return self._send_json(handler, completion)
+        usage = completion["usage"]
+        self._start_events(handler)
+        time.sleep(self.first_token_delay)
+        for token in self.tokens(text):
+            self._send_event(handler, None, {
+                "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+            time.sleep(self.token_delay)
+        self._send_event(handler, None, {
+            "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+        self._end_events(handler)
+
+    def _embeddings(self, handler, body):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        time.sleep(self.embedding_delay)
+        data = []
+        for index, text in enumerate(inputs):
+            vector = self.embedding(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode()
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        tokens = sum(len(str(text).split()) for text in inputs)
+        self._send_json(handler, {"object": "list", "data": data, "model": body.get("model"),
+                                  "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    @staticmethod
+    def embedding(text):
+        """A unit vector hashed from the words of a text, so texts sharing most words are similar."""
+        vector = [0.0] * EMBEDDING_DIMENSIONS
+        for word in re.findall(r"[a-z0-9']+", str(text).lower()):
+            digest = hashlib.md5(word.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % EMBEDDING_DIMENSIONS] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    def _message(self, thread_id, role, text):
+        return {"id": "msg_" + uuid.uuid4().hex, "object": "thread.message", "created_at": int(time.time()),
+                "thread_id": thread_id, "role": role, "status": "completed", "assistant_id": None, "run_id": None,
+                "attachments": [], "metadata": {}, "incomplete_details": None, "completed_at": None,
+                "incomplete_at": None, "content": [{"type": "text", "text": {"value": text, "annotations": []}}]}
+
+    def _list_messages(self, handler, thread_id, params):
+        messages = list(self._threads[thread_id])
+        if params.get("after"):
+            ids = [message["id"] for message in messages]
+            messages = messages[ids.index(params["after"]) + 1:]
+        if params.get("order", "desc") == "desc":
+            messages.reverse()
+        self._send_json(handler, {"object": "list", "data": messages, "has_more": False,
+                                  "first_id": messages[0]["id"] if messages else None,
+                                  "last_id": messages[-1]["id"] if messages else None})
+
+    def _run_object(self, run_id, thread_id, assistant_id, status):
+        return {"id": run_id, "object": "thread.run", "created_at": int(time.time()), "thread_id": thread_id,
+                "assistant_id": assistant_id, "status": status, "instructions": "", "model": "gpt-4", "tools": [],
+                "parallel_tool_calls": True}
+
+    def _create_run(self, handler, thread_id, body):
+        run_id = "run_" + uuid.uuid4().hex
+        run = {"thread_id": thread_id, "assistant_id": body["assistant_id"], "started": time.monotonic(), "done": False}
+        self._runs[run_id] = run
+        if not body.get("stream"):
+            return self._send_json(handler, self._run_object(run_id, thread_id, body["assistant_id"], "queued"))
+        message = self._message(thread_id, "assistant", "")
+        self._start_events(handler)
+        self._send_event(handler, "thread.run.created", self._run_object(run_id, thread_id, body["assistant_id"], "queued"))
+        self._send_event(handler, "thread.message.created", message)
+        time.sleep(self.first_token_delay)
+        for token in self.tokens():
+            self._send_event(handler, "thread.message.delta", {
+                "id": message["id"], "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token, "annotations": []}}]}})
+            time.sleep(self.token_delay)
+        message["content"][0]["text"]["value"] = self.reply_text()
+        self._threads[thread_id].append(message)
+        run["done"] = True
+        self._send_event(handler, "thread.message.completed", message)
+        self._send_event(handler, "thread.run.completed", self._run_object(run_id, thread_id, body["assistant_id"], "completed"))
+        self._end_events(handler, "done")
+
+    def _run_state(self, run_id):
+        run = self._runs[run_id]
+        finished = time.monotonic() - run["started"] >= self.generation_time()
+        if finished and not run["done"]:
+            run["done"] = True
+            self._threads[run["thread_id"]].append(self._message(run["thread_id"], "assistant", self.reply_text()))
+        return self._run_object(run_id, run["thread_id"], run["assistant_id"], "completed" if finished else "in_progress")
+
+    def _upload_file(self, handler, raw_body):
+        envelope = b"Content-Type: " + handler.headers["Content-Type"].encode() + b"\r\n\r\n" + raw_body
+        fields = {part.get_param("name", header="content-disposition"): part
+                  for part in BytesParser().parsebytes(envelope).get_payload()}
+        content = fields["file"].get_payload(decode=True)
+        file = {"id": "file-" + uuid.uuid4().hex, "object": "file", "bytes": len(content),
+                "created_at": int(time.time()), "filename": fields["file"].get_filename(),
+                "purpose": fields["purpose"].get_payload(), "status": "processed"}
+        self._files[file["id"]] = dict(file, content=content)
+        self._send_json(handler, file)
+
+    def _create_batch(self, handler, body):
+        batch = {"id": "batch_" + uuid.uuid4().hex, "object": "batch", "endpoint": body["endpoint"],
+                 "completion_window": body["completion_window"], "input_file_id": body["input_file_id"],
+                 "created_at": int(time.time()), "status": "validating", "output_file_id": None,
+                 "error_file_id": None, "started": time.monotonic()}
+        self._batches[batch["id"]] = batch
+        self._send_json(handler, self._public_batch(batch))
+
+    def _batch_state(self, batch_id):
+        batch = self._batches[batch_id]
+        if batch["status"] != "completed" and time.monotonic() - batch["started"] >= self.batch_delay:
+            output = []
+            for line in self._files[batch["input_file_id"]]["content"].decode().splitlines():
+                request = json.loads(line)
+                output.append(json.dumps({"id": "batch_req_" + uuid.uuid4().hex, "custom_id": request["custom_id"],
+                                          "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                                                       "body": self._completion_object(request["body"], self.reply_text(request["body"]))},
+                                          "error": None}))
+            content = "\n".join(output).encode()
+            file_id = "file-" + uuid.uuid4().hex
+            self._files[file_id] = {"id": file_id, "content": content}
+            batch.update(status="completed", output_file_id=file_id)
+        elif batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        return self._public_batch(batch)
+
+    def _public_batch(self, batch):
+        return {key: value for key, value in batch.items() if key != "started"}
+
+    def _send_bytes(self, handler, data):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_json(self, handler, payload, headers=None, status=200):
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _start_events(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+    def _send_event(self, handler, event, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        text = (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+        encoded = text.encode()
+        handler.wfile.write(f"{len(encoded):x}\r\n".encode() + encoded + b"\r\n")
+        handler.wfile.flush()
+
+    def _end_events(self, handler, event=None):
+        self._send_event(handler, event, "[DONE]")
+        handler.wfile.write(b"0\r\n\r\n")
@@ -0,0 +1,53 @@
+# SharedClientBenchmark.py
+# Measures request latency when every OpenAI_Conversation opens its own client (as the Streamlit
+# apps did on each script rerun) against conversations that share the process-wide client.
+# Runs against MockOpenAIServer with no simulated model latency, so only client and connection
+# overhead is measured. The mock server speaks plain HTTP; against the real API each new client
+# additionally pays a TLS handshake, so the savings there are larger.
+#
+#     % python SharedClientBenchmark.py
+
+import os
+import statistics
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+sys.path.append(os.path.abspath(os.path.join(current_dir, os.pardir)))
+
+from MockOpenAIServer import MockOpenAIServer
+
+INSTRUCTIONS = "You are a very helpful assistant."
+ROUNDS = 50
+
+
+def measure(label, shared_client):
+    from PeopleCodeOpenAI import OpenAI_Conversation
+
+    latencies = []
+    for i in range(ROUNDS):
+        start = time.perf_counter()
+        # A new conversation per request, like a Streamlit rerun
+        conversation = OpenAI_Conversation(api_key="benchmark", shared_client=shared_client)
+        conversation.ask_question(INSTRUCTIONS, f"Question {i}")
+        latencies.append(time.perf_counter() - start)
+    # Skip the first request, which opens the shared client's first connection
+    warm = latencies[1:]
+    print(f"{label:<32} median {statistics.median(warm) * 1000:7.2f} ms   "
+          f"p90 {statistics.quantiles(warm, n=10)[-1] * 1000:7.2f} ms")
+
+
+def main():
+    server = MockOpenAIServer(first_token_delay=0, token_delay=0).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    print(f"Warm request latency over {ROUNDS - 1} requests\n")
+    measure("new client per conversation", shared_client=False)
+    measure("shared client", shared_client=True)
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
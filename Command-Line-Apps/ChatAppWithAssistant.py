@@ -67,6 +67,8 @@ def main():
 
     # Initialize OpenAI_Conversation with selected model
     conversation_manager = OpenAI_Conversation(api_key=api_key, model=selected_model)
+    # Generate follow-ups in the background while the user reads each answer
+    conversation_manager.set_speculative_followups(3, 25, ASSISTANT_ID)
 
     print("How can I help you today?")
     while True:
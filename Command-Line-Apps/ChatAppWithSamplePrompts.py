@@ -34,6 +34,8 @@ except ValueError:
 
 # Initialize OpenAI_Conversation with selected model
 conversation_manager = OpenAI_Conversation(api_key=api_key, model=selected_model)
+# Start generating follow-ups as soon as each answer arrives
+conversation_manager.set_speculative_followups(3, 25)
 
 instructions = "You are a helpful assistant."
 conversation = conversation_manager.get_conversation()
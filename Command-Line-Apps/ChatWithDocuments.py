@@ -0,0 +1,50 @@
+# ChatWithDocuments.py
+# This lets the user ask questions about local text documents from the command line. The documents
+# are split into passages and embedded once into a local index, and the passages most relevant to
+# each question are added to the prompt, so no assistant or file upload is needed.
+#
+#     % python ChatWithDocuments.py notes.txt chapter1.txt chapter2.txt
+
+import sys
+import os
+
+sys.path.append("..")
+from PeopleCodeOpenAI import OpenAI_Conversation, DocumentIndex, EmbeddingCache
+
+INDEX_DIRECTORY = "document_index"
+EMBEDDING_CACHE = "embedding_cache.sqlite"
+
+if len(sys.argv) < 2:
+    print("Usage: python ChatWithDocuments.py <document> [<document> ...]")
+    sys.exit(-1)
+
+# Load API key from environment variable
+api_key = os.getenv('OPENAI_API_KEY')
+if not api_key:
+    print("Error: The API key is not set. Set the environment variable 'OPENAI_API_KEY'.")
+    sys.exit(-1)
+
+# Initialize OpenAI_Conversation with a local document index
+conversation_manager = OpenAI_Conversation(api_key=api_key, model="gpt-4o")
+conversation_manager.set_document_index(DocumentIndex(INDEX_DIRECTORY))
+conversation_manager.set_embedding_cache(EmbeddingCache(EMBEDDING_CACHE))
+
+# Only new or changed documents are embedded again
+added = conversation_manager.add_documents(sys.argv[1:])
+print(f"Indexed {added} new passages.")
+
+# Instructions for the assistant
+instructions = "You are a helpful assistant. Answer questions about the user's documents."
+
+print("Ask a question about your documents.")
+while True:
+    user_prompt = input("Enter a question. Type 'exit' to quit: ").strip()
+    if user_prompt.lower() == "exit":
+        print("Goodbye!")
+        sys.exit(0)
+
+    # Get response from OpenAI model, grounded in the retrieved passages
+    response = conversation_manager.ask_question(instructions, user_prompt)
+
+    # Display the response
+    print("Response:\n" + response)
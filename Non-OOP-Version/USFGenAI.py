@@ -1,5 +1,9 @@
+import io
+import json
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from openai import OpenAI
 
@@ -10,6 +14,9 @@ if not api_key:
 
 client = OpenAI(api_key=api_key)
 settings = {}
+cited_files = {}
+cited_files_path = None
+telemetry_hooks = []
 
 
 def set_model(model_name):
@@ -23,6 +30,45 @@ def set_model(model_name):
     settings = {"model": model_name}
 
 
+def add_telemetry_hook(hook):
+    """
+    Adds a function that is called with a record of every API call.
+
+    A record is a dict with the call's 'operation' (such as 'chat.completions.create'), 'model',
+    'started_at' (epoch seconds), 'wall_time' and 'time_to_first_token' (seconds),
+    'prompt_tokens', 'completion_tokens', HTTP 'status', 'retries', 'cache_hit' and 'error'.
+    Values that do not apply or are unknown are None. While no hook is added, API calls are made
+    directly, at the cost of one check of the empty hook list.
+
+    Args:
+        hook (callable): The function to call with each record.
+    """
+    telemetry_hooks.append(hook)
+
+
+def remove_telemetry_hook(hook):
+    """
+    Removes a function added with add_telemetry_hook.
+
+    Args:
+        hook (callable): The function to remove.
+    """
+    telemetry_hooks.remove(hook)
+
+
+def set_cited_files_path(path):
+    """
+    Sets a JSON file where the names of files cited by assistants are kept between runs.
+
+    Args:
+        path (str): The path of the JSON file. Names already saved in it are loaded.
+    """
+    global cited_files_path
+    cited_files_path = Path(path)
+    if cited_files_path.exists():
+        cited_files.update(json.loads(cited_files_path.read_text()))
+
+
 def ask_question(conversation, question, instructions, assistant_id=None):
     """
     Asks a question to the OpenAI Chat API.
@@ -80,13 +126,12 @@ def generate_sample_prompts(context, num_samples, max_words, assistant_id=None,
     if assistant_id is not None:
         return __generate_assistant_prompts(context, instructions, assistant_id)
     else:
-        response = client.chat.completions.create(model=settings["model"],
-                                                  messages=[
-                                                      {"role": "system", "content": instructions},
-                                                      {"role": "user", "content": context}
-                                                  ])
-        (dict(response).get('usage'))
-        (response.model_dump_json(indent=2))
+        response = __call_api("chat.completions.create",
+                              model=settings["model"],
+                              messages=[
+                                  {"role": "system", "content": instructions},
+                                  {"role": "user", "content": context}
+                              ])
         prompts = response.choices[0].message.content.strip().split('\n')
         return prompts
 
@@ -154,7 +199,8 @@ def text_to_speech(text, voice=None):
         voice = "alloy"
     try:
         speech_file_path = Path(__file__).parent / "speech.mp3"
-        response = client.audio.speech.create(
+        response = __call_api(
+            "audio.speech.create",
             model="tts-1",
             voice=voice,
             input=text
@@ -170,20 +216,117 @@ def speech_recognition(file):
     """
     Converts speech to text using OpenAI's Whisper model.
 
+    In-memory audio is uploaded straight from its buffer, without a temporary file or a copy.
+
     Args:
-        file (str): Path to the audio file.
+        file (str | bytes | memoryview | file object): Path to the audio file, the audio
+            as bytes, a bytearray or memoryview, or a readable binary file object.
 
     Returns:
         str: The transcribed text.
     """
+    if isinstance(file, (bytes, bytearray, memoryview)) or hasattr(file, "read"):
+        return __transcribe(__audio_upload(file))
     with open(file, "rb") as audio_file:
-        translation = client.audio.translations.create(
-            model="whisper-1",
-            file=audio_file
-        )
+        return __transcribe(audio_file)
+
+
+def __transcribe(upload):
+    """
+    Private function to send an audio upload to the Whisper model.
+
+    Args:
+        upload: An open audio file or a (filename, content) tuple.
+
+    Returns:
+        str: The transcribed text.
+    """
+    translation = __call_api(
+        "audio.translations.create",
+        model="whisper-1",
+        file=upload
+    )
     return translation.text
 
 
+class _BufferReader(io.RawIOBase):
+    """
+    Read-only file object over a buffer, so uploads stream from it without copying it whole.
+    """
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = (0, self._position, len(self._view))[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        chunk = self._view[self._position:end].tobytes()
+        self._position += len(chunk)
+        return chunk
+
+
+def __audio_upload(audio):
+    """
+    Private function to prepare in-memory audio for upload without copying it.
+
+    Args:
+        audio: The audio bytes, a bytearray or memoryview, or a readable binary file object.
+
+    Returns:
+        tuple: The upload filename, named after the detected format, and its content.
+    """
+    if hasattr(audio, "read"):
+        name = getattr(audio, "name", None)
+        if isinstance(name, str) and os.path.splitext(name)[1]:
+            return os.path.basename(name), audio
+        if getattr(audio, "seekable", lambda: False)():
+            start = audio.tell()
+            header = audio.read(12)
+            audio.seek(start)
+            return __audio_filename(header), audio
+        # A pipe or network body cannot be rewound after sniffing its format, so it is read whole
+        data = audio.read()
+        return __audio_filename(data), data
+    if isinstance(audio, bytes):
+        return __audio_filename(audio), audio
+    view = memoryview(audio).cast("B")
+    return __audio_filename(view), _BufferReader(view)
+
+
+def __audio_filename(header):
+    """
+    Private function to name audio after its format, detected from the file signature.
+
+    Args:
+        header: The first bytes of the audio file.
+
+    Returns:
+        str: A filename with the matching extension.
+    """
+    signatures = ((b"RIFF", "wav"), (b"ID3", "mp3"), (b"\xff\xfb", "mp3"), (b"\xff\xf3", "mp3"),
+                  (b"OggS", "ogg"), (b"fLaC", "flac"), (b"\x1a\x45\xdf\xa3", "webm"))
+    for signature, extension in signatures:
+        if header[:len(signature)] == signature:
+            return f"audio.{extension}"
+    if header[4:8] == b"ftyp":
+        return "audio.m4a"
+    return "audio.wav"
+
+
 def __ask_assistant(conversation, question, instructions, assistant_id):
     """
     Private function to ask a question to an OpenAI Assistant with a specified ID.
@@ -199,17 +342,19 @@ def __ask_assistant(conversation, question, instructions, assistant_id):
               containing the reply with citations and updated conversation.
     """
     # Create a new thread
-    thread = client.beta.threads.create()
+    thread = __call_api("beta.threads.create")
 
     # Add the user's question to the thread
-    client.beta.threads.messages.create(
+    __call_api(
+        "beta.threads.messages.create",
         thread_id=thread.id,
         role="user",
         content=question
     )
 
     # Run the assistant
-    run = client.beta.threads.runs.create_and_poll(
+    run = __call_api(
+        "beta.threads.runs.create_and_poll",
         thread_id=thread.id,
         assistant_id=assistant_id,
         instructions=instructions
@@ -217,7 +362,8 @@ def __ask_assistant(conversation, question, instructions, assistant_id):
 
     if run.status == 'completed':
         # List all messages in the thread
-        messages = client.beta.threads.messages.list(
+        messages = __call_api(
+            "beta.threads.messages.list",
             thread_id=thread.id
         )
 
@@ -227,11 +373,12 @@ def __ask_assistant(conversation, question, instructions, assistant_id):
             if message.role == "assistant":
                 latest_message = message.content[0].text.value
                 annotations = message.content[0].text.annotations
+                filenames = __cited_filenames(annotations)
                 for index, annotation in enumerate(annotations):
                     if file_citation := getattr(annotation, "file_citation", None):
-                        cited_file = client.files.retrieve(file_citation.file_id)
-                        latest_message = latest_message.replace(annotation.text, f"[{index}]({cited_file.filename})")
-                        latest_message += f"\n[{index}] {cited_file.filename}"
+                        filename = filenames.get(file_citation.file_id, file_citation.file_id)
+                        latest_message = latest_message.replace(annotation.text, f"[{index}]({filename})")
+                        latest_message += f"\n[{index}] {filename}"
 
         if latest_message:
             return {"reply": latest_message, "conversation": conversation}
@@ -241,6 +388,97 @@ def __ask_assistant(conversation, question, instructions, assistant_id):
         return {"reply": None, "conversation": conversation}
 
 
+def __call_api(operation, **params):
+    """
+    Private function to make an API call, recording it for the telemetry hooks if any are added.
+
+    Args:
+        operation (str): The client method to call, such as 'chat.completions.create'.
+        **params: The parameters of the call.
+
+    Returns:
+        The response of the call.
+    """
+    *path, method = operation.split(".")
+    resource = client
+    for name in path:
+        resource = getattr(resource, name)
+    if not telemetry_hooks:
+        return getattr(resource, method)(**params)
+
+    record = {"operation": operation, "model": params.get("model"), "started_at": time.time(), "wall_time": None,
+              "time_to_first_token": None, "prompt_tokens": None, "completion_tokens": None, "status": None,
+              "retries": None, "cache_hit": False, "error": None}
+    started = time.perf_counter()
+    try:
+        # The raw response tells how often the client retried; polling helpers have no raw form
+        raw_method = getattr(resource.with_raw_response, method, None)
+        if raw_method is None:
+            response = getattr(resource, method)(**params)
+        else:
+            raw_response = raw_method(**params)
+            record["status"], record["retries"] = raw_response.status_code, raw_response.retries_taken
+            response = raw_response.parse()
+        usage = getattr(response, "usage", None)
+        record["model"] = record["model"] or getattr(response, "model", None)
+        record["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+        record["completion_tokens"] = getattr(usage, "completion_tokens", None)
+        return response
+    except Exception as e:
+        record["status"] = getattr(e, "status_code", None)
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["wall_time"] = time.perf_counter() - started
+        for hook in telemetry_hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                print(f"Error recording telemetry: {e}")
+
+
+def __cited_filenames(annotations):
+    """
+    Private function to look up the names of the files cited by annotations.
+
+    Names are cached, and the files not yet cached are retrieved concurrently.
+
+    Args:
+        annotations (list): The annotations of an assistant message.
+
+    Returns:
+        dict: The filename of each cited file ID that could be retrieved.
+    """
+    file_ids = {annotation.file_citation.file_id for annotation in annotations
+                if getattr(annotation, "file_citation", None)}
+    missing = [file_id for file_id in file_ids if file_id not in cited_files]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), 8)) as executor:
+            for file_id, filename in zip(missing, executor.map(__retrieve_filename, missing)):
+                if filename:
+                    cited_files[file_id] = filename
+        if cited_files_path:
+            cited_files_path.write_text(json.dumps(cited_files))
+    return {file_id: cited_files[file_id] for file_id in file_ids if file_id in cited_files}
+
+
+def __retrieve_filename(file_id):
+    """
+    Private function to retrieve the name of an uploaded file.
+
+    Args:
+        file_id (str): The ID of the file.
+
+    Returns:
+        str: The filename, or None if the file could not be retrieved.
+    """
+    try:
+        return __call_api("files.retrieve", file_id=file_id).filename
+    except Exception as e:
+        print(f"Error retrieving file {file_id}: {e}")
+        return None
+
+
 def __ask_openai(conversation, instructions):
     """
     Private function to ask a question to the OpenAI Chat API.
@@ -253,12 +491,11 @@ def __ask_openai(conversation, instructions):
         dict: The response from the OpenAI Chat API,
               containing the reply and updated conversation.
     """
-    response = client.chat.completions.create(model=settings["model"],
-                                              messages=[
-                                                           {"role": "system", "content": instructions}
-                                                       ] + conversation)
-    (dict(response).get('usage'))
-    (response.model_dump_json(indent=2))
+    response = __call_api("chat.completions.create",
+                          model=settings["model"],
+                          messages=[
+                                       {"role": "system", "content": instructions}
+                                   ] + conversation)
     answer = response.choices[0].message.content.strip()
     conversation.append({"role": "assistant", "content": answer})
     return {"reply": answer, "conversation": conversation}
@@ -277,17 +514,19 @@ def __generate_assistant_prompts(context, instructions, assistant_id):
         list: A list of generated prompts.
     """
     # Create a new thread
-    thread = client.beta.threads.create()
+    thread = __call_api("beta.threads.create")
 
     # Add the user's question to the thread
-    client.beta.threads.messages.create(
+    __call_api(
+        "beta.threads.messages.create",
         thread_id=thread.id,
         role="user",
         content=context
     )
 
     # Run the assistant
-    run = client.beta.threads.runs.create_and_poll(
+    run = __call_api(
+        "beta.threads.runs.create_and_poll",
         thread_id=thread.id,
         assistant_id=assistant_id,
         instructions=instructions
@@ -295,7 +534,8 @@ def __generate_assistant_prompts(context, instructions, assistant_id):
 
     if run.status == 'completed':
         # List all messages in the thread
-        messages = client.beta.threads.messages.list(
+        messages = __call_api(
+            "beta.threads.messages.list",
             thread_id=thread.id
         )
 
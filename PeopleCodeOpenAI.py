@@ -1,33 +1,172 @@
+# PeopleCodeOpenAI.py
+# Conversations with OpenAI models and assistants, including speech, images and document search.
+# Caching, retrieval, telemetry, rate limiting, batch jobs and voice sessions live in the modules of
+# the peoplecode package, whose public names are imported here, so apps import everything from this module.
+#
+# The request methods are written once, in _BaseConversation, and shared by OpenAI_Conversation and
+# AsyncOpenAI_Conversation through a small trampoline:
+# - A request method is a generator, its "flow", decorated with _request_method. The flow yields each
+#   client call it makes, such as self._client.embeddings.create(...), or the result of another request
+#   method, such as self.embed(...), and gets the call's result back from the yield. Helper flows are
+#   called with yield from.
+# - _request_method makes the decorated method hand its flow to self._run. OpenAI_Conversation._run
+#   sends each yielded value straight back, because the sync call was made where it was yielded.
+#   AsyncOpenAI_Conversation._run awaits it first and throws any exception, cancellation included, back
+#   into the flow, so the same method returns a coroutine on the async class.
+# - A flow yields self._gather(flows, concurrency) to run several flows at once, on a thread pool in the
+#   sync class and as tasks under a semaphore in the async class, and gets their results in order.
+# - What differs by more than awaiting, such as streaming, speculative follow-ups and assistant runs, is
+#   implemented by each class on its own.
+
+import asyncio
+import base64
+import functools
+import json
+import queue
+import re
+import threading
+import time
+import warnings
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import aclosing, closing
 from pathlib import Path
-from openai import OpenAI
+import httpx
+import numpy as np
+from openai import BadRequestError, NOT_GIVEN
+
+from peoplecode import telemetry
+# The tuning constants stay importable from this module
+from peoplecode.constants import *
+from peoplecode.tokens import count_tokens, _truncate_tokens
+from peoplecode.history import ConversationHistory
+from peoplecode.telemetry import (TelemetryHistograms, JsonlTelemetrySink, OpenTelemetrySink, add_telemetry_sink,
+                                  remove_telemetry_sink, _record_cache_hit)
+from peoplecode.scheduling import RequestScheduler
+from peoplecode.clients import (configure_client_pool, set_request_scheduler, get_request_scheduler, get_shared_client,
+                                get_shared_async_client, close_shared_clients, _new_async_client, _new_client)
+from peoplecode.caches import (ResponseCache, SemanticCache, EmbeddingCache, AudioCache, ImageStore, FileMetadataCache,
+                               _ImageWriter, _file_cache)
+from peoplecode.retrieval import DocumentIndex, _read_documents
+from peoplecode.audio import _audio_upload, _is_audio_buffer, _read_audio, _split_wav, _stitch_transcripts
+from peoplecode.batch import BatchJob
+from peoplecode.voice import VoiceSession
+
+# Threads are only started when speculative follow-ups are first scheduled
+_speculation_executor = ThreadPoolExecutor(max_workers=DEFAULT_CONCURRENCY, thread_name_prefix="followups")
+# Shared by all conversations, so each model that rejects structured output is probed once per process
+_structured_unsupported = set(STRUCTURED_UNSUPPORTED_MODELS)
+_structured_warned = set()
+
 
-DEFAULT_MODEL = "gpt-4"
-DEFAULT_TEMPERATURE = 0.7
+def _request_method(flow):
+    """
+    Turns a request flow into a request method of both conversation classes.
 
+    A flow is a generator method holding the request logic. It yields each client call, or call of
+    another request method, and gets its result back: OpenAI_Conversation makes the call where it is
+    yielded, and AsyncOpenAI_Conversation awaits it. So each request method is written once, and
+    returns a coroutine on the async class.
+    """
+    @functools.wraps(flow)
+    def method(self, *args, **kwargs):
+        return self._run(flow(self, *args, **kwargs))
+    return method
 
-class OpenAI_Conversation:
-    def __init__(self, api_key, model=DEFAULT_MODEL, assistant=None, temperature=DEFAULT_TEMPERATURE):
+
+class _BaseConversation:
+    """
+    State, settings, request building and response parsing shared by the sync and async conversation classes.
+
+    The request methods are written here once, as flows run by _request_method. Subclasses supply the
+    client through _create_client, run flows through _run and _gather, and implement the streaming
+    methods, whose iteration differs between the two.
+    """
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, assistant=None, temperature=DEFAULT_TEMPERATURE,
+                 base_url=None, shared_client=True):
         """
-        Initializes the OpenAI_Conversation instance.
+        Initializes the conversation instance.
 
         Args:
             api_key: The API key for OpenAI.
             model: The model to use, default is 'gpt-4'.
             assistant: The assistant ID, default is None.
             temperature: The creativity level of the model output, ranging from 0 to 1.
+            base_url: The API base URL, default is the OPENAI_BASE_URL environment variable or the OpenAI API.
+            shared_client: Whether to use the process-wide client for this API key and base URL instead
+                           of opening a connection pool for this conversation alone.
         """
         self._api_key = api_key
         if not self._api_key:
             raise ValueError("API key is not set. Set the environment variable 'OPENAI_API_KEY'.")
-        self._client = OpenAI(api_key=self._api_key)
+        self._base_url = base_url
+        self._shared_client = shared_client
+        self._client = self._create_client()
         self._model = model
         self._assistant = assistant
-        self._prev_conversation = []
+        self._prev_conversation = ConversationHistory(model=model)
         self._temperature = temperature
+        self._thread_ttl = DEFAULT_THREAD_TTL
+        self._assistant_threads = {}
+        # Guards the thread cache, which ask_many workers and speculative follow-ups use concurrently
+        self._assistant_threads_lock = threading.Lock()
+        self._response_cache = None
+        self._audio_cache = None
+        self._image_store = None
+        self._structured_output = False
+        self._speculative_followups = None
+        self._speculation = None
+        self._semantic_cache = None
+        self._document_index = None
+        self._document_top_k = DEFAULT_RAG_TOP_K
+        self._embedding_cache = None
+        self._file_cache = _file_cache
+
+    def _create_client(self):
+        """Creates the OpenAI client used by this conversation."""
+        raise NotImplementedError
+
+    def _new_lock(self):
+        """Creates a lock that serializes runs on one assistant thread."""
+        raise NotImplementedError
+
+    def _run(self, flow):
+        """Runs a request flow, making or awaiting each call it yields, and returns its result."""
+        raise NotImplementedError
+
+    def _gather(self, flows, concurrency):
+        """Runs request flows concurrently, at most concurrency at once, and returns their results in order."""
+        raise NotImplementedError
+
+    def _start_speculation(self, flow):
+        """Starts a follow-up flow in the background and returns its future or task."""
+        raise NotImplementedError
+
+    def _speculated(self, job):
+        """Returns the result of a speculative follow-up job, or None if it was cancelled or failed."""
+        raise NotImplementedError
+
+    def _complete_assistant_run(self, content, instructions, assistant_id, purpose):
+        """Runs an assistant to completion and returns the outcome dict of _stream_assistant."""
+        raise NotImplementedError
+
+    def _new_download_client(self):
+        """Creates the HTTP client generate_images downloads images with."""
+        raise NotImplementedError
+
+    def _close_download_client(self, downloads):
+        """Closes a client from _new_download_client."""
+        raise NotImplementedError
+
+    def _download_image(self, downloads, url, key):
+        """Streams an image from its URL into the image store and returns its path."""
+        raise NotImplementedError
 
     def set_model(self, model_name):
         """Sets the model for the conversation."""
         self._model = model_name
+        self._prev_conversation.model = model_name
+        self._warn_structured_unsupported()
 
     def set_assistant(self, assistant_name):
         """Sets the assistant for the conversation."""
@@ -40,10 +179,717 @@ class OpenAI_Conversation:
         else:
             raise ValueError("Temperature must be between 0 and 1.")
 
+    def _ask_many_requests(self, questions, instructions, concurrency):
+        """Validates ask_many arguments and builds each question's chat messages from the current history."""
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+        return [self._chat_messages(instructions, question) for question in questions]
+
+    def _record_many(self, answers):
+        """Adds the successful answers of ask_many to the conversation history, in input order."""
+        for answer in answers:
+            if answer is not None:
+                self._prev_conversation.append({"role": "assistant", "content": answer})
+
+    def set_response_cache(self, cache):
+        """
+        Sets the ResponseCache used for ask_question and the prompt and list generators.
+
+        Args:
+            cache: A ResponseCache, or None to turn caching off.
+        """
+        self._response_cache = cache
+
+    def set_audio_cache(self, cache):
+        """
+        Sets the AudioCache used by text_to_speech and text_to_speech_stream.
+
+        Args:
+            cache: An AudioCache, or None to turn audio caching off.
+        """
+        self._audio_cache = cache
+
+    def _cached_audio(self, text, voice, chunk_size):
+        """
+        Looks up speech in the audio cache.
+
+        Returns:
+            A (key, chunks) tuple. The key is None when caching is off, and chunks is None on a miss.
+        """
+        if self._audio_cache is None:
+            return None, None
+        key = AudioCache.make_key(text, voice, DEFAULT_TTS_MODEL, "mp3")
+        chunks = self._audio_cache.iter_chunks(key, chunk_size)
+        if chunks is not None and telemetry._telemetry_sinks:
+            _record_cache_hit("audio_cache", DEFAULT_TTS_MODEL)
+        return key, chunks
+
+    def set_image_store(self, store):
+        """
+        Sets the ImageStore used by generate_images for 'bytes' and 'path' output.
+
+        Args:
+            store: An ImageStore, or None to turn image caching off.
+        """
+        self._image_store = store
+
+    def _plan_images(self, prompts, n, size, quality, model, output):
+        """
+        Works out which images of a generate_images call are already stored and which must be generated.
+
+        Identical prompts in one call are generated once.
+
+        Returns:
+            A (keys, stored, jobs) tuple: the request key of each prompt, a dict mapping each distinct
+            key to its stored image paths, and a list of (key, prompt) for each variant to generate.
+        """
+        if output not in IMAGE_OUTPUTS:
+            raise ValueError(f"Image output must be one of {', '.join(IMAGE_OUTPUTS)}.")
+        if output == "path" and self._image_store is None:
+            raise ValueError("Image output 'path' needs an image store. Call set_image_store first.")
+        keys = [ImageStore.make_key(prompt, size, quality, model) for prompt in prompts]
+        stored, jobs = {}, []
+        for prompt, key in zip(prompts, keys):
+            if key in stored:
+                continue
+            use_store = self._image_store is not None and output != "url"
+            stored[key] = self._image_store.get(key, n) if use_store else []
+            jobs.extend((key, prompt) for _ in range(n - len(stored[key])))
+        return keys, stored, jobs
+
+    @staticmethod
+    def _image_results(keys, stored, jobs, generated, output):
+        """Assembles the images of each prompt, stored ones first, from the planned jobs and their results."""
+        images = {key: [path.read_bytes() if output == "bytes" else path for path in paths]
+                  for key, paths in stored.items()}
+        for (key, _), image in zip(jobs, generated):
+            images[key].append(image)
+        return [list(images[key]) for key in keys]
+
+    def set_structured_output(self, enabled):
+        """
+        Turns structured output on or off for generate_sample_prompts, generate_followups, generate_list
+        and ask_question_with_followups.
+
+        When on, the chat model is asked for a JSON object with exactly the requested number of items,
+        and every reply, including assistant replies and models without structured output support,
+        goes through a validating parser that removes list markers, blank and duplicate items. Models
+        without structured output support, such as the default gpt-4, are asked for plain text instead,
+        and a warning is issued once per model.
+
+        Args:
+            enabled: Whether structured output is used.
+        """
+        self._structured_output = enabled
+        self._warn_structured_unsupported()
+
+    def _warn_structured_unsupported(self):
+        """Warns once per model when structured output is on for a model that does not support it."""
+        if not self._structured_output or self._model not in _structured_unsupported or \
+                self._model in _structured_warned:
+            return
+        _structured_warned.add(self._model)
+        warnings.warn(f"{self._model} does not support structured output, so its replies are requested as plain "
+                      f"text and parsed into items. Use a model such as gpt-4o for exact item counts.", stacklevel=3)
+
+    def _items_format(self, count):
+        """
+        Builds the response_format that makes the chat model return exactly count items.
+
+        Returns:
+            A JSON schema response_format, or None when structured output is off.
+        """
+        if not self._structured_output:
+            return None
+        return {"type": "json_schema", "json_schema": {"name": "items", "strict": True,
+                                                       "schema": self._items_schema(count)}}
+
+    @staticmethod
+    def _items_schema(count):
+        """Builds a strict JSON schema for an object holding exactly count string items."""
+        if count > STRUCTURED_MAX_ITEMS:
+            # Strict schemas allow at most 100 properties, so larger lists use an array of any length
+            properties = {"items": {"type": "array", "items": {"type": "string"}}}
+        else:
+            # One required property per item is the strict-schema way to force an exact count
+            properties = {f"item_{index}": {"type": "string"} for index in range(1, count + 1)}
+        return {"type": "object", "properties": properties, "required": list(properties),
+                "additionalProperties": False}
+
+    def _answer_format(self, num_samples):
+        """
+        Builds the response_format for an answer with num_samples follow-up questions.
+
+        Returns:
+            A JSON schema response_format, or None when structured output is off or the model does not support it.
+        """
+        if not self._structured_output or self._model in _structured_unsupported:
+            return None
+        schema = {"type": "object", "properties": {"answer": {"type": "string"},
+                                                   "followups": self._items_schema(num_samples)},
+                  "required": ["answer", "followups"], "additionalProperties": False}
+        return {"type": "json_schema", "json_schema": {"name": "answer_with_followups", "strict": True,
+                                                       "schema": schema}}
+
+    @staticmethod
+    def _answer_with_followups_instructions(instructions, num_samples, max_words, structured):
+        """Extends the instructions to ask for follow-up questions along with the answer."""
+        instructions = (f"{instructions}\n\nAfter answering, also suggest {num_samples} follow-up questions the user "
+                        f"might ask next. Each follow-up should be no more than {max_words} words.")
+        if not structured:
+            instructions += (f" Write the answer first. Then write a line containing only '{FOLLOWUPS_MARKER}' "
+                             f"and put each follow-up question on a separate line after it.")
+        return instructions
+
+    @classmethod
+    def _parse_answer_with_followups(cls, content, num_samples):
+        """
+        Splits a combined reply into the answer and its follow-up questions.
+
+        Args:
+            content: A JSON reply from the answer_with_followups schema, or a plain-text reply with the
+                follow-ups after the FOLLOWUPS_MARKER line.
+            num_samples: The number of follow-up questions requested.
+
+        Returns:
+            An (answer, followups) tuple.
+        """
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            data = None
+        if isinstance(data, dict) and isinstance(data.get("answer"), str):
+            return data["answer"].strip(), cls._parse_items(json.dumps(data.get("followups") or {}), num_samples)
+        parts = re.split(rf"^\W*{re.escape(FOLLOWUPS_MARKER)}\W*$", content or "", maxsplit=1,
+                         flags=re.IGNORECASE | re.MULTILINE)
+        followups = cls._parse_items(parts[1], num_samples) if len(parts) > 1 else []
+        return parts[0].strip(), followups
+
+    def _items_messages(self, instructions, content):
+        """Builds the chat messages for a list generator, with the user content if there is any."""
+        messages = [{"role": "system", "content": instructions}]
+        if content is not None:
+            messages.append({"role": "user", "content": content})
+        return messages
+
+    def _structured_request(self, count):
+        """Returns the response_format for a structured request, or None if it is off or the model rejected it."""
+        if self._model in _structured_unsupported:
+            return None
+        return self._items_format(count)
+
+    def _structured_rejected(self, error):
+        """Remembers that the model does not support structured output, if that is what the error says."""
+        if "response_format" not in str(error) and "json_schema" not in str(error):
+            return False
+        _structured_unsupported.add(self._model)
+        self._warn_structured_unsupported()
+        return True
+
+    @staticmethod
+    def _parse_items(content, count):
+        """
+        Parses a structured or plain-text list reply into at most count clean items.
+
+        JSON objects and arrays are read as they are. Plain text is split on '%%' if it is present and
+        on lines otherwise. List markers, numbering and surrounding quotes are removed, and blank and
+        duplicate items and lead-in lines ending in a colon are dropped.
+
+        Args:
+            content: The reply text.
+            count: The number of items requested.
+
+        Returns:
+            A list of up to count items.
+        """
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            data = None
+        if isinstance(data, dict):
+            data = data["items"] if isinstance(data.get("items"), list) else list(data.values())
+        if isinstance(data, list):
+            items = [str(item) for item in data if isinstance(item, (str, int, float))]
+        else:
+            content = content or ""
+            items = content.split('%%') if '%%' in content else content.split('\n')
+        cleaned = []
+        for item in items:
+            item = LIST_MARKER.sub("", item.strip()).strip().strip('"\'').strip()
+            if item and not item.endswith(':') and item not in cleaned:
+                cleaned.append(item)
+        return cleaned[:count]
+
+    def set_semantic_cache(self, cache):
+        """
+        Sets the SemanticCache used by ask_question and ask_question_stream.
+
+        A question similar enough to one already answered with the same instructions, model and
+        assistant gets the stored answer without a chat request. Answers are matched on the question
+        alone, so the cache suits standalone questions such as an FAQ rather than conversations whose
+        questions depend on earlier turns.
+
+        Args:
+            cache: A SemanticCache, or None to turn semantic caching off.
+        """
+        self._semantic_cache = cache
+
+    def _semantic_namespace(self, instructions, assistant_id):
+        return SemanticCache.make_namespace(instructions, self._model, assistant_id)
+
+    def _semantic_answer(self, lookup):
+        """
+        Returns the stored answer found by a semantic lookup, added to the conversation history.
+
+        Args:
+            lookup: A (namespace, vector, answer) tuple from _semantic_lookup, or None.
+
+        Returns:
+            The answer, or None on a miss or when semantic caching is off.
+        """
+        if lookup is None or lookup[2] is None:
+            return None
+        if telemetry._telemetry_sinks:
+            _record_cache_hit("semantic_cache", self._model)
+        self._prev_conversation.append({"role": "assistant", "content": lookup[2]})
+        return lookup[2]
+
+    def _semantic_store(self, lookup, question, answer):
+        """Stores a new answer under the namespace and vector of a semantic lookup that missed."""
+        if lookup is not None and answer and answer.strip():
+            self._semantic_cache.set(lookup[0], lookup[1], question, answer.strip())
+
+    def set_embedding_cache(self, cache):
+        """
+        Sets the EmbeddingCache used by embed, and so by the semantic cache and the document index.
+
+        Args:
+            cache: An EmbeddingCache, or None to stop caching embeddings.
+        """
+        self._embedding_cache = cache
+
+    def _plan_embeddings(self, texts, model):
+        """
+        Looks texts up in the embedding cache and packs the rest into batches for embed.
+
+        Repeated texts are embedded once. Texts over EMBEDDING_MAX_INPUT_TOKENS tokens, which the API
+        would reject along with the rest of their batch, are embedded from their first
+        EMBEDDING_MAX_INPUT_TOKENS tokens. A batch is closed when it reaches EMBEDDING_MAX_INPUTS texts
+        or when the next text would take it over EMBEDDING_MAX_BATCH_TOKENS tokens.
+
+        Returns:
+            A (keys, vectors, batches) tuple: the key of each text, a dict of the vectors already known
+            by key, and lists of (key, text) pairs to embed, one list per request.
+        """
+        keys = [EmbeddingCache.make_key(text, model) for text in texts]
+        vectors = self._embedding_cache.get_many(keys) if self._embedding_cache is not None else {}
+        if self._embedding_cache is not None and telemetry._telemetry_sinks:
+            # One record per distinct text, matching the cache's own hit and miss counts
+            for key in dict.fromkeys(keys):
+                _record_cache_hit("embedding_cache", model, key in vectors)
+        pending = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        batches, batch, batch_tokens = [], [], 0
+        for key, text in pending.items():
+            text, tokens = _truncate_tokens(text, EMBEDDING_MAX_INPUT_TOKENS, model)
+            if batch and (len(batch) == EMBEDDING_MAX_INPUTS or batch_tokens + tokens > EMBEDDING_MAX_BATCH_TOKENS):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append((key, text))
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return keys, vectors, batches
+
+    def _store_embeddings(self, batch, response, vectors):
+        """Decodes the base64 embeddings of a batch into vectors and adds them to vectors and the embedding cache."""
+        embedded = {key: np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+                    for (key, _), item in zip(batch, sorted(response.data, key=lambda item: item.index))}
+        if self._embedding_cache is not None:
+            self._embedding_cache.set_many(embedded)
+        vectors.update(embedded)
+
+    @staticmethod
+    def _stack_embeddings(keys, vectors):
+        """Returns the vectors of keys as one contiguous float32 matrix, one row per key."""
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys]).astype(np.float32, copy=False)
+
+    def set_file_cache(self, cache):
+        """
+        Sets the FileMetadataCache used to name the files cited in assistant answers.
+
+        By default, conversations share one in-memory cache.
+
+        Args:
+            cache: A FileMetadataCache.
+        """
+        self._file_cache = cache
+
+    @staticmethod
+    def _cited_file_ids(annotations):
+        """Returns the IDs of the files cited by annotations, without repeats, in order of first citation."""
+        return list(dict.fromkeys(annotation.file_citation.file_id for annotation in annotations or []
+                                  if getattr(annotation, "file_citation", None)))
+
+    @staticmethod
+    def _file_metadata(file):
+        return {"filename": file.filename, "bytes": file.bytes, "purpose": file.purpose, "created_at": file.created_at}
+
+    @staticmethod
+    def _render_citations(reply, annotations, files):
+        """
+        Replaces each file citation marker in a reply with a numbered link and lists the cited files after the reply.
+
+        Args:
+            reply: The assistant's reply.
+            annotations: The reply's annotations.
+            files: A dict mapping file IDs to their metadata. Files missing from it are named by ID.
+        """
+        for index, annotation in enumerate(annotations or []):
+            if file_citation := getattr(annotation, "file_citation", None):
+                filename = files.get(file_citation.file_id, {}).get("filename", file_citation.file_id)
+                reply = reply.replace(annotation.text, f"[{index}]({filename})")
+                reply += f"\n[{index}] {filename}"
+        return reply
+
+    def set_document_index(self, index, top_k=DEFAULT_RAG_TOP_K):
+        """
+        Sets the DocumentIndex that grounds answers from the chat model in local documents.
+
+        Each question asked without an assistant is embedded, and the top_k most similar passages are
+        added to the system instructions. This is an alternative to an assistant with file_search that
+        keeps the documents, their embeddings and the search on this machine.
+
+        Args:
+            index: A DocumentIndex, or None to stop retrieving passages.
+            top_k: The number of passages added to each question.
+        """
+        self._document_index = index
+        self._document_top_k = top_k
+
+    def _document_embedding_model(self):
+        return self._document_index.embedding_model or DEFAULT_EMBEDDING_MODEL
+
+    def _pending_documents(self, documents):
+        """Returns (source, digest, passages) for each document that is new or changed since it was indexed."""
+        if self._document_index is None:
+            raise ValueError("No document index is set. Call set_document_index first.")
+        pending = []
+        for source, text, digest in _read_documents(documents):
+            passages = self._document_index.split(text)
+            if passages and not self._document_index.is_current(source, digest):
+                pending.append((source, digest, passages))
+        return pending
+
+    @staticmethod
+    def _passages_instructions(instructions, passages):
+        """Adds retrieved passages, numbered and labelled with their sources, to the system instructions."""
+        if not passages:
+            return instructions
+        context = "\n\n".join(f"[{number}] ({passage['source']}) {passage['text']}"
+                               for number, passage in enumerate(passages, start=1))
+        return (f"{instructions}\n\nUse the following passages from the documents where they help answer "
+                f"the question, and cite them by number.\n\n{context}")
+
+    def set_speculative_followups(self, num_samples=None, max_words=None, assistant_id=None):
+        """
+        Turns speculative follow-up generation on or off.
+
+        When on, ask_question and ask_question_stream start generating follow-ups in the background as
+        soon as an answer arrives. A later generate_followups call for that answer with the same
+        num_samples, max_words and assistant_id returns the stored result, or waits for the request
+        still in flight, instead of making a new request. Only the latest answer is kept.
+
+        Args:
+            num_samples: The number of follow-up questions to precompute, or None to turn speculation off.
+            max_words: The maximum number of words per follow-up question.
+            assistant_id: The assistant ID generate_followups will be called with, if any.
+        """
+        self._speculative_followups = None if num_samples is None else (num_samples, max_words, assistant_id)
+        self._speculation = None
+
+    def _speculation_target(self, question, answer):
+        """
+        Works out the follow-up request to run speculatively for an answer.
+
+        Returns:
+            A (key, arguments) tuple for the background generate_followups call, or None if speculation
+            is off or there is no answer.
+        """
+        if self._speculative_followups is None or not answer or not answer.strip():
+            return None
+        num_samples, max_words, assistant_id = self._speculative_followups
+        key = self._speculation_key(answer, num_samples, max_words, assistant_id)
+        return key, (question, answer, num_samples, max_words, assistant_id)
+
+    @staticmethod
+    def _speculation_key(answer, num_samples, max_words, assistant_id):
+        """Identifies a turn's follow-up request by its answer, so callers may pass the question in another form."""
+        return answer.strip(), num_samples, max_words, assistant_id
+
+    def _speculative_result(self, response, num_samples, max_words, assistant_id):
+        """Returns the in-flight or finished speculative follow-up job for a request, or None if there is none."""
+        speculation = self._speculation
+        if speculation is None or response is None:
+            return None
+        key, job = speculation
+        return job if key == self._speculation_key(response, num_samples, max_words, assistant_id) else None
+
+    def set_thread_ttl(self, seconds):
+        """Sets how long an idle assistant thread is reused before a new one is started."""
+        if seconds < 0:
+            raise ValueError("Thread TTL must not be negative.")
+        self._thread_ttl = seconds
+
+    def reset_assistant_threads(self, assistant_id=None):
+        """
+        Forgets cached assistant threads so the next assistant call starts a new thread.
+
+        Args:
+            assistant_id: Only forget the threads of this assistant. Forgets all threads if None.
+        """
+        with self._assistant_threads_lock:
+            if assistant_id is None:
+                self._assistant_threads.clear()
+            else:
+                for key in [key for key in self._assistant_threads if key[0] == assistant_id]:
+                    del self._assistant_threads[key]
+
+    def set_history_budget(self, max_tokens, summarize=False):
+        """
+        Limits the tokens of conversation history sent with each question.
+
+        Args:
+            max_tokens: The token budget for the history, or None for no limit.
+            summarize: Whether messages dropped from the history are summarized by the model
+                       instead of being forgotten.
+        """
+        history = ConversationHistory(max_tokens, summarize, self._model)
+        for message in self._prev_conversation:
+            history.append(message)
+        history.set_summary(self._prev_conversation.summary)
+        self._prev_conversation = history
+
     def get_conversation(self):
-        """Returns the current conversation history."""
-        return self._prev_conversation
+        """Returns the current conversation history as a list of messages."""
+        return self._prev_conversation.messages
+
+    def _cached_thread(self, assistant_id, purpose):
+        """
+        Returns the cached thread entry for an assistant, evicting entries idle for longer than the TTL.
+
+        Args:
+            assistant_id: The assistant the thread belongs to.
+            purpose: 'ask' for the conversation's question thread, or None for a one-off thread that is never
+                     reused, so generated prompts and follow-ups never see earlier generations.
+
+        Returns:
+            The entry dict with 'thread_id', 'last_used' and 'lock', or None.
+        """
+        now = time.monotonic()
+        with self._assistant_threads_lock:
+            for key in [key for key, entry in self._assistant_threads.items() if now - entry["last_used"] > self._thread_ttl]:
+                del self._assistant_threads[key]
+            return self._assistant_threads.get((assistant_id, purpose))
+
+    def _cache_thread(self, assistant_id, purpose, thread_id):
+        """
+        Stores a new thread in the cache and returns its entry.
+
+        If another call cached a thread for the same assistant and purpose in the meantime, that
+        entry is returned instead, so concurrent calls keep sharing one conversation thread.
+        """
+        entry = {"thread_id": thread_id, "last_used": time.monotonic(), "lock": self._new_lock()}
+        if purpose is None:
+            return entry
+        with self._assistant_threads_lock:
+            return self._assistant_threads.setdefault((assistant_id, purpose), entry)
+
+    @staticmethod
+    def _apply_run_event(event, outcome):
+        """
+        Folds one assistant run stream event into outcome and returns the reply text it carries.
+
+        Args:
+            event: An event from a streamed run.
+            outcome: Dict collecting the run 'status', the final 'reply' and its 'annotations'.
+
+        Returns:
+            The text delta carried by the event, or an empty string.
+        """
+        if event.event == "thread.message.delta":
+            return "".join(part.text.value for part in event.data.delta.content or []
+                           if part.type == "text" and part.text and part.text.value)
+        if event.event == "thread.message.completed" and event.data.role == "assistant":
+            outcome["reply"] = "".join(part.text.value for part in event.data.content if part.type == "text")
+            outcome["annotations"] = [annotation for part in event.data.content if part.type == "text"
+                                      for annotation in part.text.annotations]
+        elif event.event in ("thread.run.completed", "thread.run.failed", "thread.run.cancelled", "thread.run.expired",
+                             "thread.run.incomplete", "thread.run.requires_action"):
+            outcome["status"] = event.data.status
+        elif event.event == "error":
+            outcome["status"] = "failed"
+        return ""
+
+    def _finish_thread_run(self, assistant_id, purpose, entry, outcome):
+        """Updates a thread entry after a streamed run, clearing the reply if the run did not complete."""
+        entry["last_used"] = time.monotonic()
+        if outcome.get("status") != 'completed':
+            # Start over on a clean thread rather than reusing one in an unknown state
+            with self._assistant_threads_lock:
+                if self._assistant_threads.get((assistant_id, purpose)) is entry:
+                    del self._assistant_threads[(assistant_id, purpose)]
+            outcome["reply"] = None
+
+    def _record_assistant_answer(self, question, answer):
+        """Adds an assistant's answer to the conversation history and returns it, or '' if there was none."""
+        if answer is not None:
+            self._prev_conversation.append({"role": "assistant", "content": answer})
+            return answer
+        # If no valid response, return an empty string and append question to history
+        self._prev_conversation.append({"role": "user", "content": question})
+        return ""
 
+    @staticmethod
+    def _sample_prompts_instructions(num_samples, max_words):
+        """Builds the system instructions for generate_sample_prompts."""
+        return f"Generate {num_samples} sample prompts based on the context. Put each generated question on a separate line with no text before or after. Each prompt should be no more than {max_words} words. "
+
+    @staticmethod
+    def _followups_request(question, response, num_samples, max_words):
+        """Builds the (recent_history, instructions) pair for generate_followups."""
+        recent_history = f"User: {question}\nAssistant: {response}\n"
+        instructions = f"Generate {num_samples} follow-up questions based on the conversation. Each follow-up should be no more than {max_words} words."
+        return recent_history, instructions
+
+    @staticmethod
+    def _list_instructions(list_description, num_items, max_words_per_item):
+        """Builds the system instructions for generate_list."""
+        return f"Generate a list of {num_items} items based on the description: {list_description}. Each item should be no more than {max_words_per_item} words. Use '%%' as the delimiter."
+
+    def _chat_messages(self, instructions, question):
+        """Builds the chat messages for a question, including the previous conversation."""
+        messages = [{"role": "system", "content": instructions}] + self._prev_conversation.for_request()
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def _cached_response(self, instructions, messages, assistant_id=None, response_format=None):
+        """
+        Looks up a response in the response cache.
+
+        Returns:
+            A (key, response) tuple. The key is None when caching is off, and the response is None on a miss.
+        """
+        if self._response_cache is None:
+            return None, None
+        key = ResponseCache.make_key(self._model, self._temperature, instructions, messages, assistant_id,
+                                     response_format)
+        response = self._response_cache.get(key)
+        if response is not None and telemetry._telemetry_sinks:
+            _record_cache_hit("response_cache", self._model)
+        return key, response
+
+    def _cache_response(self, key, response):
+        """Stores a non-empty response under a key from _cached_response."""
+        if key is not None and response:
+            self._response_cache.set(key, response)
+        return response
+
+    def _summary_messages(self, dropped):
+        """Builds the chat messages that fold dropped history messages into the running summary."""
+        transcript = "\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in dropped)
+        if self._prev_conversation.summary:
+            transcript = f"Earlier summary: {self._prev_conversation.summary}\n{transcript}"
+        instructions = f"Summarize the conversation below in no more than {SUMMARY_MAX_WORDS} words. Keep names, facts and open questions."
+        return [{"role": "system", "content": instructions}, {"role": "user", "content": transcript}]
+
+    @staticmethod
+    def _complete_sentences(buffer):
+        """
+        Splits streamed text into the sentences that are already finished and the unfinished tail.
+
+        Args:
+            buffer: The text received so far that has not been emitted yet.
+
+        Returns:
+            A (sentences, remainder) tuple. Sentences are stripped and blank ones are dropped.
+        """
+        sentences, start = [], 0
+        for match in SENTENCE_END.finditer(buffer):
+            sentence = buffer[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        return sentences, buffer[start:]
+
+    @staticmethod
+    def _write_audio(chunks, sink):
+        """Writes audio chunks to a file path or a writable binary file object."""
+        if isinstance(sink, (str, Path)):
+            with open(sink, "wb") as audio_file:
+                for chunk in chunks:
+                    audio_file.write(chunk)
+        else:
+            for chunk in chunks:
+                sink.write(chunk)
+
+    @staticmethod
+    def _parse_lines(content):
+        """Splits a chat completion into one item per line."""
+        return content.strip().split('\n')
+
+    @staticmethod
+    def _parse_list(content):
+        """Splits a '%%' delimited chat completion into stripped, non-empty items."""
+        list_items = content.strip().split('%%')
+        return [item.strip() for item in list_items if item.strip()]
+
+    @staticmethod
+    def _stream_options():
+        """Asks for token usage at the end of chat streams while telemetry is on, so streamed calls report tokens."""
+        return {"include_usage": True} if telemetry._telemetry_sinks else NOT_GIVEN
+
+    @staticmethod
+    def _delta_text(chunk):
+        """Returns the text carried by a streamed chat completion chunk, or an empty string."""
+        if chunk.choices and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content
+        return ""
+
+    @staticmethod
+    def _complete_lines(buffer):
+        """
+        Splits streamed text into the lines that are already finished and the unfinished tail.
+
+        Args:
+            buffer: The text received so far that has not been emitted yet.
+
+        Returns:
+            A (lines, remainder) tuple. Lines are stripped and blank lines are dropped.
+        """
+        *lines, remainder = buffer.split('\n')
+        return [line.strip() for line in lines if line.strip()], remainder
+
+    def _create_chat(self, messages, **options):
+        """Sends a chat completion request with this conversation's model and temperature."""
+        return self._client.chat.completions.create(
+            model=self._model,
+            messages=messages,
+            temperature=self._temperature,
+            **options
+        )
+
+    @staticmethod
+    def _message_content(response):
+        """Returns the text of the first choice of a chat completion."""
+        return response.choices[0].message.content
+
+    def _speech_request(self, text, voice):
+        """Builds the arguments of a text-to-speech request."""
+        return {"model": DEFAULT_TTS_MODEL, "voice": voice or DEFAULT_VOICE, "input": text}
+
+    @_request_method
     def ask_question(self, instructions, question, assistant_id=None):
         """
         Sends a question to the model and returns the model's reply.
@@ -56,11 +902,90 @@ class OpenAI_Conversation:
         Returns:
             A string containing the model's reply.
         """
+        lookup = yield from self._semantic_lookup(instructions, question, assistant_id)
+        answer = self._semantic_answer(lookup)
+        if answer is None:
+            if assistant_id:
+                answer = yield from self._ask_assistant(instructions, question, assistant_id)
+            else:
+                answer = yield from self._ask_openai(instructions, question)
+            self._semantic_store(lookup, question, answer)
+        self._speculate_followups(question, answer)
+        return answer
+
+    @_request_method
+    def ask_question_with_followups(self, instructions, question, num_samples, max_words, assistant_id=None):
+        """
+        Asks a question and generates follow-up questions to the answer in a single request.
+
+        This replaces ask_question followed by generate_followups, which sends the answer back to the
+        model as input for a second completion. With structured output on, models that support it
+        return the answer and exactly num_samples follow-ups as JSON. Otherwise, and for assistants,
+        the model is asked to list the follow-ups after a marker line, and the reply is split at it.
+
+        Args:
+            instructions: Instructions for the model.
+            question: The user's question.
+            num_samples: The number of follow-up questions to generate.
+            max_words: The maximum number of words per follow-up question.
+            assistant_id: The assistant ID to use, if any.
+
+        Returns:
+            An (answer, followups) tuple. Only the answer is added to the conversation history.
+        """
         if assistant_id:
-            return self._ask_assistant(instructions, question, assistant_id)
-        else:
-            return self._ask_openai(instructions, question)
+            merged = self._answer_with_followups_instructions(instructions, num_samples, max_words, False)
+            content = yield from self._run_assistant(question, merged, assistant_id)
+            answer, followups = self._parse_answer_with_followups(content, num_samples)
+            return self._record_assistant_answer(question, answer if content is not None else None), followups
+        yield from self._refresh_summary()
+        request = ((yield from self._grounded_instructions(instructions, question)), question, num_samples, max_words)
+        response_format = self._answer_format(num_samples)
+        try:
+            answer, followups = yield from self._complete_answer_with_followups(*request, response_format)
+        except BadRequestError as e:
+            if response_format is None or not self._structured_rejected(e):
+                raise
+            answer, followups = yield from self._complete_answer_with_followups(*request, None)
+        self._prev_conversation.append({"role": "assistant", "content": answer})
+        return answer, followups
+
+    @_request_method
+    def ask_many(self, questions, instructions, concurrency=DEFAULT_CONCURRENCY, assistant_id=None,
+                 update_conversation=True):
+        """
+        Asks several independent questions concurrently.
+
+        Every question is answered against the conversation history as it was when ask_many was called.
+
+        Args:
+            questions: The questions to ask.
+            instructions: Instructions for the model.
+            concurrency: The maximum number of requests in flight at once.
+            assistant_id: The assistant ID to use, if any. Each question then runs on its own thread.
+            update_conversation: Whether the answers are added to the conversation history, in input order.
+
+        Returns:
+            A list with the reply to each question, in input order. A question whose request failed has None.
+        """
+        yield from self._refresh_summary()
+        requests = self._ask_many_requests(questions, instructions, concurrency)
 
+        def ask(index):
+            try:
+                if assistant_id:
+                    return (yield from self._cited_assistant_reply(questions[index], instructions, assistant_id, None))
+                return (yield from self._complete_chat(instructions, requests[index]))
+            except Exception as e:
+                print(f"Error asking question {index + 1}: {e}")
+                return None
+
+        answers = yield self._gather(map(ask, range(len(questions))), concurrency)
+        if update_conversation:
+            self._record_many(answers)
+        return answers
+
+    @_request_method
     def generate_sample_prompts(self, context, num_samples, max_words, assistant_id=None):
         """
         Generates sample prompts based on the given context.
@@ -74,18 +999,20 @@ class OpenAI_Conversation:
         Returns:
             A list of generated sample prompts.
         """
-        instructions = f"Generate {num_samples} sample prompts based on the context. Put each generated question on a separate line with no text before or after. Each prompt should be no more than {max_words} words. "
+        instructions = self._sample_prompts_instructions(num_samples, max_words)
+        key, cached = self._cached_response(instructions, [{"role": "user", "content": context}], assistant_id,
+                                            self._items_format(num_samples))
+        if cached is not None:
+            return cached
         if assistant_id:
-            return self._generate_assistant_prompts(context, instructions, assistant_id)
+            prompts = yield from self._generate_assistant_prompts(context, instructions, assistant_id)
+            if self._structured_output:
+                prompts = self._parse_items('\n'.join(prompts), num_samples)
         else:
-            response = self._client.chat.completions.create(
-                model=self._model,
-                messages=[{"role": "system", "content": instructions}, {"role": "user", "content": context}],
-                temperature=self._temperature
-            )
-            prompts = response.choices[0].message.content.strip().split('\n')
-            return prompts
+            prompts = yield from self._complete_items(instructions, context, num_samples, self._parse_lines)
+        return self._cache_response(key, prompts)
 
+    @_request_method
     def generate_followups(self, question, response, num_samples, max_words, assistant_id=None):
         """
         Generates follow-up questions based on the previous question and response.
@@ -100,19 +1027,29 @@ class OpenAI_Conversation:
         Returns:
             A list of generated follow-up questions.
         """
-        recent_history = f"User: {question}\nAssistant: {response}\n"
-        instructions = f"Generate {num_samples} follow-up questions based on the conversation. Each follow-up should be no more than {max_words} words."
+        job = self._speculative_result(response, num_samples, max_words, assistant_id)
+        if job is not None:
+            followups = yield self._speculated(job)
+            if followups is not None:
+                return followups
+        return (yield from self._generate_followups(question, response, num_samples, max_words, assistant_id))
+
+    def _generate_followups(self, question, response, num_samples, max_words, assistant_id=None):
+        """Generates follow-up questions without looking at speculative results."""
+        recent_history, instructions = self._followups_request(question, response, num_samples, max_words)
+        key, cached = self._cached_response(instructions, [{"role": "user", "content": recent_history}], assistant_id,
+                                            self._items_format(num_samples))
+        if cached is not None:
+            return cached
         if assistant_id:
-            return self._generate_assistant_followups(recent_history, instructions, assistant_id)
+            followups = yield from self._generate_assistant_followups(recent_history, instructions, assistant_id)
+            if self._structured_output:
+                followups = self._parse_items('\n'.join(followups), num_samples)
         else:
-            response = self._client.chat.completions.create(
-                model=self._model,
-                messages=[{"role": "system", "content": instructions}, {"role": "user", "content": recent_history}],
-                temperature=self._temperature
-            )
-            followups = response.choices[0].message.content.strip().split('\n')
-            return followups
+            followups = yield from self._complete_items(instructions, recent_history, num_samples, self._parse_lines)
+        return self._cache_response(key, followups)
 
+    @_request_method
     def generate_list(self, list_description, num_items, max_words_per_item):
         """
         Generates a list of items based on the provided description.
@@ -125,163 +1062,950 @@ class OpenAI_Conversation:
         Returns:
             A list of generated items.
         """
-        instructions = f"Generate a list of {num_items} items based on the description: {list_description}. Each item should be no more than {max_words_per_item} words. Use '%%' as the delimiter."
-        response = self._client.chat.completions.create(
-            model=self._model,
-            messages=[{"role": "system", "content": instructions}],
-            temperature=self._temperature
-        )
-        raw_list = response.choices[0].message.content.strip()
-        list_items = raw_list.split('%%')
-        return [item.strip() for item in list_items if item.strip()]
+        instructions = self._list_instructions(list_description, num_items, max_words_per_item)
+        key, cached = self._cached_response(instructions, [], response_format=self._items_format(num_items))
+        if cached is not None:
+            return cached
+        items = yield from self._complete_items(instructions, None, num_items, self._parse_list)
+        return self._cache_response(key, items)
 
-    def text_to_speech(self, text, voice=None):
+    @_request_method
+    def speech_recognition(self, file):
         """
-        Converts text to speech using OpenAI's TTS model.
+        Converts speech to text using OpenAI's Whisper model.
+
+        In-memory audio is uploaded straight from its buffer, without a temporary file or a copy.
 
         Args:
-            text: The text to convert to speech.
-            voice: The voice to use.
+            file: Path to the audio file, the audio as bytes, a bytearray or memoryview,
+                or a readable binary file object.
 
         Returns:
-            The response content from OpenAI audio API.
+            The transcribed text.
         """
-        if not voice:
-            voice = "alloy"
-        try:
-            speech_file_path = Path(__file__).parent / "speech.mp3"
-            response = self._client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text
-            )
-            response.stream_to_file(speech_file_path)
-            return response.content
-        except Exception as e:
-            print(f"Error converting text to speech: {e}")
-            return None
+        if _is_audio_buffer(file) or hasattr(file, "read"):
+            return (yield from self._transcribe(_audio_upload(file)))
+        with open(file, "rb") as audio_file:
+            return (yield from self._transcribe(audio_file))
 
-    def speech_recognition(self, file):
+    @_request_method
+    def speech_recognition_long(self, file, chunk_seconds=DEFAULT_CHUNK_SECONDS,
+                                overlap_seconds=DEFAULT_CHUNK_OVERLAP_SECONDS, concurrency=DEFAULT_CONCURRENCY):
         """
-        Converts speech to text using OpenAI's Whisper model.
+        Converts a long recording to text by transcribing overlapping chunks concurrently.
+
+        WAV recordings are cut at the quietest moment near each chunk boundary and the chunk
+        transcripts are joined with their overlapping words removed. Other formats cannot be
+        split without decoding them and are transcribed in a single request.
 
         Args:
-            file: Path to the audio file.
+            file: Path to the audio file, the audio as bytes or a buffer, or a binary file object.
+            chunk_seconds: The longest chunk in seconds.
+            overlap_seconds: Seconds of audio shared by neighbouring chunks.
+            concurrency: The maximum number of chunks transcribed at once.
 
         Returns:
             The transcribed text.
         """
-        with open(file, "rb") as audio_file:
-            translation = self._client.audio.translations.create(
-                model="whisper-1",
-                file=audio_file
-            )
+        data = _read_audio(file)
+        chunks = _split_wav(data, chunk_seconds, overlap_seconds) or [data]
+        texts = yield self._gather((self._transcribe(_audio_upload(chunk)) for chunk in chunks), concurrency)
+        return _stitch_transcripts(texts)
+
+    def _transcribe(self, upload):
+        """Sends an audio upload to the Whisper model and returns the text."""
+        translation = yield self._client.audio.translations.create(
+            model="whisper-1",
+            file=upload
+        )
         return translation.text
 
-    def generate_image(self, prompt):
+    @_request_method
+    def embed(self, texts, model=DEFAULT_EMBEDDING_MODEL, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Embeds texts and returns their vectors.
+
+        Texts found in the embedding cache, if one is set, are not sent. The rest are deduplicated and
+        packed into as few requests as the per-request input and token limits allow, and the requests
+        run concurrently. Texts longer than the model's input limit are cut to it. Vectors are
+        transferred base64-encoded and decoded straight into float32.
+
+        Args:
+            texts: The texts to embed.
+            model: The embedding model to use.
+            concurrency: The maximum number of requests in flight at once.
+
+        Returns:
+            A contiguous float32 NumPy array with one row per text, in input order.
+        """
+        keys, vectors, batches = self._plan_embeddings(texts, model)
+
+        def embed_batch(batch):
+            response = yield self._client.embeddings.create(
+                model=model,
+                input=[text for _, text in batch],
+                encoding_format="base64"
+            )
+            self._store_embeddings(batch, response, vectors)
+
+        yield self._gather(map(embed_batch, batches), concurrency)
+        return self._stack_embeddings(keys, vectors)
+
+    @_request_method
+    def add_documents(self, documents):
+        """
+        Splits documents into passages, embeds them and stores them in the document index.
+
+        Documents already indexed with the same content are skipped, and changed documents replace
+        their earlier passages, so the same list can be passed every time an app starts.
+
+        Args:
+            documents: File paths of UTF-8 text documents, or (source, text) tuples.
+
+        Returns:
+            The number of passages added.
+        """
+        added = 0
+        for source, digest, passages in self._pending_documents(documents):
+            vectors = yield self.embed(passages, self._document_embedding_model())
+            self._document_index.add(source, digest, passages, vectors, self._document_embedding_model())
+            added += len(passages)
+        return added
+
+    @_request_method
+    def search_documents(self, query, top_k=None):
+        """
+        Finds the passages in the document index most similar to a query.
+
+        Args:
+            query: The text to search for.
+            top_k: The number of passages to return, default is the index's top_k.
+
+        Returns:
+            A list of dicts with the passage 'text', its 'source' and its cosine 'score', best first.
+        """
+        if self._document_index is None or not len(self._document_index):
+            return []
+        vectors = yield self.embed([query], self._document_index.embedding_model)
+        return self._document_index.search(vectors[0], top_k or self._document_top_k)
+
+    @_request_method
+    def generate_image(self, prompt, size=DEFAULT_IMAGE_SIZE, quality=DEFAULT_IMAGE_QUALITY,
+                       model=DEFAULT_IMAGE_MODEL, n=1):
         """
         Generates an image using the DALL-E model.
 
         Args:
             prompt: The text description of the image to generate.
+            size: The image size, such as '1024x1024'.
+            quality: 'standard' or 'hd'.
+            model: The image model to use.
+            n: The number of variants to generate.
 
         Returns:
             A list of URLs to the generated images.
         """
+        images = yield self.generate_images([prompt], n, size, quality, model)
+        urls = [url for url in images[0] if url]
+        return urls or None
+
+    @_request_method
+    def generate_images(self, prompts, n=1, size=DEFAULT_IMAGE_SIZE, quality=DEFAULT_IMAGE_QUALITY,
+                        model=DEFAULT_IMAGE_MODEL, output="url", concurrency=DEFAULT_IMAGE_CONCURRENCY):
+        """
+        Generates images for several prompts concurrently, one request per variant.
+
+        With an image store set, 'bytes' and 'path' output reuse the images stored for the same
+        (prompt, size, quality, model) and only generate the missing variants. URLs expire, so 'url'
+        output is never cached. Identical prompts in one call are generated once.
+
+        Args:
+            prompts: The text descriptions of the images to generate.
+            n: The number of variants per prompt.
+            size: The image size, such as '1024x1024'.
+            quality: 'standard' or 'hd'.
+            model: The image model to use.
+            output: 'url' for the temporary image URLs, 'bytes' for the image bytes, or 'path' to
+                stream each image into the image store and return its path.
+            concurrency: The maximum number of requests in flight at once.
+
+        Returns:
+            A list with, for each prompt, its list of n images. A variant that failed is None.
+        """
+        keys, stored, jobs = self._plan_images(prompts, n, size, quality, model, output)
+        downloads = self._new_download_client() if output == "path" and jobs else None
+
+        def generate(job):
+            try:
+                return (yield from self._generate_image_variant(job[1], job[0], size, quality, model, output, downloads))
+            except Exception as e:
+                print(f"Error generating image: {e}")
+                return None
+
         try:
-            response = self._client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1
-            )
-            return [image.url for image in response.data]
-        except Exception as e:
-            print(f"Error generating image: {e}")
-            return None
+            generated = yield self._gather(map(generate, jobs), concurrency)
+        finally:
+            if downloads is not None:
+                yield self._close_download_client(downloads)
+        return self._image_results(keys, stored, jobs, generated, output)
+
+    def _generate_image_variant(self, prompt, key, size, quality, model, output, downloads):
+        """Generates one image and returns its URL, its bytes or its path in the image store."""
+        response = yield self._client.images.generate(
+            model=model,
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            n=1,
+            response_format="b64_json" if output == "bytes" else "url"
+        )
+        image = response.data[0]
+        if output == "url":
+            return image.url
+        if output == "bytes":
+            data = base64.b64decode(image.b64_json)
+            if self._image_store is not None:
+                self._image_store.put(key, data)
+            return data
+        return (yield self._download_image(downloads, image.url, key))
+
+    def _run_assistant(self, content, instructions, assistant_id, purpose="ask"):
+        """Runs an assistant to completion and returns the text of its reply, or None if the run failed."""
+        outcome = yield self._complete_assistant_run(content, instructions, assistant_id, purpose)
+        return outcome.get("reply")
 
     def _ask_assistant(self, instructions, question, assistant_id):
-        """Handles asking a question to a specific assistant."""
-        # Prepare messages including previous conversation history
-        messages = [{"role": "system", "content": instructions}] + self._prev_conversation
-        messages.append({"role": "user", "content": question})
+        """Handles asking a question to a specific assistant, rendering the files its answer cites."""
+        reply = yield from self._cited_assistant_reply(question, instructions, assistant_id, "ask")
+        return self._record_assistant_answer(question, reply)
 
-        # Create a new thread for the assistant interaction
-        thread = self._client.beta.threads.create()
-        self._client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=question
-        )
-        run = self._client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant_id,
-            instructions=instructions
-        )
+    def _cited_assistant_reply(self, question, instructions, assistant_id, purpose):
+        """Runs an assistant to completion and returns its reply with the files it cites rendered, or None if the run failed."""
+        outcome = yield self._complete_assistant_run(question, instructions, assistant_id, purpose)
+        reply = outcome.get("reply")
+        if reply and outcome.get("annotations"):
+            files = yield from self._resolve_files(self._cited_file_ids(outcome["annotations"]))
+            reply = self._render_citations(reply, outcome["annotations"], files)
+        return reply
 
-        # Check if the run was successful
-        if run.status == 'completed':
-            messages = self._client.beta.threads.messages.list(thread_id=thread.id)
-            # Process assistant's response and update conversation history
-            for message in messages.data:
-                if message.role == "assistant":
-                    answer = message.content[0].text.value
-                    self._prev_conversation.append({"role": "assistant", "content": answer})
-                    return answer
-        # If no valid response, return an empty string and append question to history
-        self._prev_conversation.append({"role": "user", "content": question})
-        return ""
+    def _resolve_files(self, file_ids):
+        """Returns the metadata of files by ID from the file cache, retrieving the uncached files concurrently."""
+        files = self._file_cache.get_many(file_ids)
+        missing = [file_id for file_id in file_ids if file_id not in files]
+
+        def retrieve(file_id):
+            try:
+                return (yield self._client.files.retrieve(file_id))
+            except Exception as e:
+                print(f"Error retrieving file {file_id}: {e}")
+                return None
+
+        if missing:
+            retrieved = yield self._gather(map(retrieve, missing), DEFAULT_CONCURRENCY)
+            retrieved = {file.id: self._file_metadata(file) for file in retrieved if file}
+            self._file_cache.set_many(retrieved)
+            files.update(retrieved)
+        return files
+
+    def _refresh_summary(self):
+        """Summarizes history messages dropped under the token budget into the history summary."""
+        dropped = self._prev_conversation.take_dropped()
+        if dropped:
+            response = yield self._create_chat(self._summary_messages(dropped))
+            self._prev_conversation.set_summary(self._message_content(response).strip())
+
+    def _question_request(self, instructions, question):
+        """Refreshes the history summary and returns the grounded instructions and chat messages for a question."""
+        yield from self._refresh_summary()
+        instructions = yield from self._grounded_instructions(instructions, question)
+        return instructions, self._chat_messages(instructions, question)
 
     def _ask_openai(self, instructions, question):
         """Handles asking a question to the OpenAI model."""
-        messages = [{"role": "system", "content": instructions}] + self._prev_conversation
-        messages.append({"role": "user", "content": question})
-        response = self._client.chat.completions.create(
-            model=self._model,
-            messages=messages,
-            temperature=self._temperature
-        )
-        answer = response.choices[0].message.content.strip()
+        instructions, messages = yield from self._question_request(instructions, question)
+        answer = yield from self._complete_chat(instructions, messages)
         self._prev_conversation.append({"role": "assistant", "content": answer})
         return answer
 
+    def _complete_chat(self, instructions, messages):
+        """Returns the model's answer to chat messages, going through the response cache if one is set."""
+        key, answer = self._cached_response(instructions, messages)
+        if answer is None:
+            response = yield self._create_chat(messages)
+            answer = self._cache_response(key, self._message_content(response).strip())
+        return answer
+
+    def _speculate_followups(self, question, answer):
+        """Starts generating follow-ups for an answer in the background, replacing any earlier speculation."""
+        target = self._speculation_target(question, answer)
+        if target is None:
+            return
+        if self._speculation is not None:
+            self._speculation[1].cancel()
+        key, arguments = target
+        self._speculation = (key, self._start_speculation(self._generate_followups(*arguments)))
+
+    def _complete_answer_with_followups(self, instructions, question, num_samples, max_words, response_format):
+        """Requests an answer with follow-ups, structured if response_format is given, going through the response cache."""
+        merged = self._answer_with_followups_instructions(instructions, num_samples, max_words, response_format is not None)
+        messages = self._chat_messages(merged, question)
+        key, cached = self._cached_response(merged, messages, response_format=response_format)
+        if cached is not None:
+            return tuple(cached)
+        response = yield self._create_chat(messages, response_format=response_format or NOT_GIVEN)
+        answer, followups = self._parse_answer_with_followups(self._message_content(response), num_samples)
+        if answer:
+            self._cache_response(key, [answer, followups])
+        return answer, followups
+
+    def _semantic_lookup(self, instructions, question, assistant_id):
+        """
+        Embeds a question and looks it up in the semantic cache.
+
+        Returns:
+            A (namespace, vector, answer) tuple, with answer None on a miss, or None when semantic
+            caching is off or the question could not be embedded.
+        """
+        if self._semantic_cache is None:
+            return None
+        try:
+            vectors = yield self.embed([question], self._semantic_cache.embedding_model)
+        except Exception as e:
+            print(f"Error embedding question: {e}")
+            return None
+        namespace = self._semantic_namespace(instructions, assistant_id)
+        return namespace, vectors[0], self._semantic_cache.get(namespace, vectors[0])
+
+    def _grounded_instructions(self, instructions, question):
+        """Returns the instructions with the passages most relevant to the question, if a document index is set."""
+        try:
+            passages = yield self.search_documents(question)
+        except Exception as e:
+            print(f"Error searching documents: {e}")
+            passages = []
+        return self._passages_instructions(instructions, passages)
+
+    def _complete_items(self, instructions, content, count, parse):
+        """
+        Requests a list of items from the chat model and parses it.
+
+        With structured output on, the request carries a JSON schema for exactly count items. A model
+        that rejects the schema is remembered and asked in plain text, and the reply still goes through
+        the validating parser. With structured output off, the reply is split by parse.
+        """
+        messages = self._items_messages(instructions, content)
+        response_format = self._structured_request(count)
+        if response_format is not None:
+            try:
+                response = yield self._create_chat(messages, response_format=response_format)
+                return self._parse_items(self._message_content(response), count)
+            except BadRequestError as e:
+                if not self._structured_rejected(e):
+                    raise
+        response = yield self._create_chat(messages)
+        if self._structured_output:
+            return self._parse_items(self._message_content(response), count)
+        return parse(self._message_content(response))
+
     def _generate_assistant_prompts(self, context, instructions, assistant_id):
         """Generates sample prompts using a specific assistant."""
-        thread = self._client.beta.threads.create()
-        self._client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=context
-        )
-        run = self._client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant_id,
-            instructions=instructions
-        )
-        if run.status == 'completed':
-            messages = self._client.beta.threads.messages.list(thread_id=thread.id)
-            for message in messages.data:
-                if message.role == "assistant":
-                    return message.content[0].text.value.split('\n')
-        return []
+        content = yield from self._run_assistant(context, instructions, assistant_id, None)
+        return content.split('\n') if content is not None else []
 
     def _generate_assistant_followups(self, recent_history, instructions, assistant_id):
         """Generates follow-up questions using a specific assistant."""
-        thread = self._client.beta.threads.create()
-        self._client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=recent_history
-        )
-        run = self._client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant_id,
-            instructions=instructions
-        )
-        if run.status == 'completed':
-            messages = self._client.beta.threads.messages.list(thread_id=thread.id)
-            for message in messages.data:
-                if message.role == "assistant":
-                    return message.content[0].text.value.split('\n')
-        return []
+        content = yield from self._run_assistant(recent_history, instructions, assistant_id, None)
+        return content.split('\n') if content is not None else []
+
+
+class OpenAI_Conversation(_BaseConversation):
+    def _create_client(self):
+        """Returns the shared synchronous OpenAI client, or a new one if sharing is off."""
+        if self._shared_client:
+            return get_shared_client(self._api_key, self._base_url)
+        return _new_client(self._api_key, self._base_url)
+
+    def _new_lock(self):
+        """Creates a threading lock for an assistant thread."""
+        return threading.Lock()
+
+    def _run(self, flow):
+        """Runs a request flow. Each call it yields has already been made, so its result is sent straight back."""
+        result = None
+        while True:
+            try:
+                result = flow.send(result)
+            except StopIteration as stop:
+                return stop.value
+
+    def _gather(self, flows, concurrency):
+        """Runs request flows on a thread pool, at most concurrency at once, and returns their results in order."""
+        flows = list(flows)
+        if len(flows) <= 1:
+            return [self._run(flow) for flow in flows]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(self._run, flows))
+
+    def _start_speculation(self, flow):
+        """Starts a follow-up flow on the speculation thread pool and returns its future."""
+        return _speculation_executor.submit(self._run, flow)
+
+    def _speculated(self, job):
+        """Returns the result of a speculative follow-up future, or None if it was cancelled or failed."""
+        try:
+            return job.result()
+        except CancelledError:
+            return None  # A newer answer replaced the speculation before it started
+        except Exception:
+            return None  # Generate them again, so an error that persists reaches the caller
+
+    def _new_download_client(self):
+        """Creates the HTTP client generate_images downloads images with."""
+        return httpx.Client(timeout=DEFAULT_REQUEST_TIMEOUT)
+
+    def _close_download_client(self, downloads):
+        """Closes a client from _new_download_client."""
+        downloads.close()
+
+    def _download_image(self, downloads, url, key):
+        """Streams an image from its URL into the image store and returns its path."""
+        with downloads.stream("GET", url) as download:
+            download.raise_for_status()
+            return self._image_store.put_stream(key, download.iter_bytes(DEFAULT_AUDIO_CHUNK_SIZE))
+
+    def ask_question_stream(self, instructions, question, assistant_id=None):
+        """
+        Sends a question to the model and streams the reply as it is generated.
+
+        The assembled reply is added to the conversation history once the stream completes.
+
+        Args:
+            instructions: Instructions for the model.
+            question: The user's question.
+            assistant_id: The assistant ID to use, if any.
+
+        Yields:
+            Pieces of the model's reply, in order.
+        """
+        lookup = self._run(self._semantic_lookup(instructions, question, assistant_id))
+        answer = self._semantic_answer(lookup)
+        if answer is not None:
+            yield answer
+            self._speculate_followups(question, answer)
+            return
+        if assistant_id:
+            deltas = self._ask_assistant_stream(instructions, question, assistant_id)
+        else:
+            deltas = self._ask_openai_stream(instructions, question)
+        parts = []
+        with closing(deltas):
+            for delta in deltas:
+                parts.append(delta)
+                yield delta
+        self._semantic_store(lookup, question, "".join(parts))
+        self._speculate_followups(question, "".join(parts))
+
+    def generate_sample_prompts_stream(self, context, num_samples, max_words, assistant_id=None):
+        """
+        Generates sample prompts based on the given context, yielding each one as soon as its line is finished.
+
+        Args:
+            context: The context for generating prompts.
+            num_samples: The number of prompts to generate.
+            max_words: The maximum number of words per prompt.
+            assistant_id: The assistant ID to use, if any.
+
+        Yields:
+            Generated sample prompts, in order.
+        """
+        instructions = self._sample_prompts_instructions(num_samples, max_words)
+        if assistant_id:
+            yield from self._run(self._generate_assistant_prompts(context, instructions, assistant_id))
+        else:
+            yield from self._stream_lines(instructions, context)
+
+    def generate_followups_stream(self, question, response, num_samples, max_words, assistant_id=None):
+        """
+        Generates follow-up questions, yielding each one as soon as its line is finished.
+
+        Args:
+            question: The previous question.
+            response: The model's response to the previous question.
+            num_samples: The number of follow-up questions to generate.
+            max_words: The maximum number of words per follow-up question.
+            assistant_id: The assistant ID to use, if any.
+
+        Yields:
+            Generated follow-up questions, in order.
+        """
+        recent_history, instructions = self._followups_request(question, response, num_samples, max_words)
+        if assistant_id:
+            yield from self._run(self._generate_assistant_followups(recent_history, instructions, assistant_id))
+        else:
+            yield from self._stream_lines(instructions, recent_history)
+
+    def text_to_speech(self, text, voice=None, sink=None):
+        """
+        Converts text to speech using OpenAI's TTS model.
+
+        Args:
+            text: The text to convert to speech.
+            voice: The voice to use.
+            sink: Optional file path or writable binary file object to stream the audio into.
+
+        Returns:
+            The MP3 audio bytes, or the sink if one was given. None if the conversion failed.
+        """
+        try:
+            chunks = self.text_to_speech_stream(text, voice)
+            if sink is None:
+                return b"".join(chunks)
+            self._write_audio(chunks, sink)
+            return sink
+        except Exception as e:
+            print(f"Error converting text to speech: {e}")
+            return None
+
+    def text_to_speech_stream(self, text, voice=None, chunk_size=DEFAULT_AUDIO_CHUNK_SIZE):
+        """
+        Converts text to speech using OpenAI's TTS model, yielding the audio as it arrives.
+
+        Args:
+            text: The text to convert to speech.
+            voice: The voice to use.
+            chunk_size: The size in bytes of the yielded chunks.
+
+        Yields:
+            Chunks of MP3 audio bytes.
+        """
+        request = self._speech_request(text, voice)
+        key, cached = self._cached_audio(text, request["voice"], chunk_size)
+        if cached is not None:
+            yield from cached
+            return
+        chunks = []
+        with self._client.audio.speech.with_streaming_response.create(**request) as response:
+            for chunk in response.iter_bytes(chunk_size):
+                chunks.append(chunk)
+                yield chunk
+        if key is not None:
+            self._audio_cache.put(key, b"".join(chunks))
+
+    def speak_stream(self, text_chunks, voice=None, concurrency=DEFAULT_TTS_CONCURRENCY):
+        """
+        Converts streamed text to speech sentence by sentence.
+
+        Each sentence is sent to the TTS model as soon as it is complete, with up to 'concurrency'
+        sentences synthesized at once, and the audio is yielded in sentence order. Playback of the
+        first sentence can start while later sentences are still being generated and synthesized.
+
+        Args:
+            text_chunks: An iterable of text pieces, such as the result of ask_question_stream.
+            voice: The voice to use.
+            concurrency: The maximum number of TTS requests in flight at once.
+
+        Yields:
+            (sentence, audio) tuples in order. audio is None if the sentence could not be converted.
+        """
+        pending = queue.Queue()
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                buffer = ""
+                for chunk in text_chunks:
+                    if stopped.is_set():
+                        return
+                    sentences, buffer = self._complete_sentences(buffer + chunk)
+                    for sentence in sentences:
+                        pending.put((sentence, executor.submit(self.text_to_speech, sentence, voice)))
+                if buffer.strip() and not stopped.is_set():
+                    pending.put((buffer.strip(), executor.submit(self.text_to_speech, buffer.strip(), voice)))
+                pending.put(None)
+            except Exception as e:
+                pending.put(e)
+            finally:
+                # The generator is closed on this thread, since it may be running here when the consumer stops
+                if hasattr(text_chunks, "close"):
+                    text_chunks.close()
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while (item := pending.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                sentence, future = item
+                yield sentence, future.result()
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _stream_assistant(self, content, instructions, assistant_id, purpose, outcome):
+        """
+        Runs an assistant on this conversation's thread with event streaming, yielding its reply as it arrives.
+
+        The thread is created on first use and reused until it idles past the thread TTL. The final
+        message comes from the run's event stream, so no polling or message listing is needed.
+
+        Args:
+            content: The user message to add to the thread.
+            instructions: Instructions for the run.
+            assistant_id: The assistant to run.
+            purpose: 'ask' to reuse the question thread, or None for a one-off thread.
+            outcome: Dict that receives the run 'status' and the final 'reply' (None if the run failed).
+
+        Yields:
+            Text deltas of the assistant's reply.
+        """
+        entry = self._cached_thread(assistant_id, purpose)
+        if entry is None:
+            thread = self._client.beta.threads.create()
+            entry = self._cache_thread(assistant_id, purpose, thread.id)
+        with entry["lock"]:
+            self._client.beta.threads.messages.create(
+                thread_id=entry["thread_id"],
+                role="user",
+                content=content
+            )
+            stream = self._client.beta.threads.runs.create(
+                thread_id=entry["thread_id"],
+                assistant_id=assistant_id,
+                instructions=instructions,
+                stream=True
+            )
+            # A stream closed early, e.g. on barge-in, leaves its run unfinished and the thread is dropped
+            try:
+                with stream:
+                    for event in stream:
+                        delta = self._apply_run_event(event, outcome)
+                        if delta:
+                            yield delta
+            finally:
+                self._finish_thread_run(assistant_id, purpose, entry, outcome)
+
+    def _complete_assistant_run(self, content, instructions, assistant_id, purpose):
+        """Runs an assistant to completion and returns the outcome dict of _stream_assistant."""
+        outcome = {}
+        for _ in self._stream_assistant(content, instructions, assistant_id, purpose, outcome):
+            pass
+        return outcome
+
+    def _ask_assistant_stream(self, instructions, question, assistant_id):
+        """Streams an assistant's answer and records it in the conversation history when the run ends."""
+        outcome = {}
+        yield from self._stream_assistant(question, instructions, assistant_id, "ask", outcome)
+        self._record_assistant_answer(question, outcome.get("reply"))
+
+    def _ask_openai_stream(self, instructions, question):
+        """Streams a reply from the OpenAI model and records the assembled answer when it completes."""
+        _, messages = self._run(self._question_request(instructions, question))
+        stream = self._create_chat(messages, stream=True, stream_options=self._stream_options())
+        parts = []
+        with stream:
+            for chunk in stream:
+                delta = self._delta_text(chunk)
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        self._prev_conversation.append({"role": "assistant", "content": "".join(parts).strip()})
+
+    def _stream_lines(self, instructions, content):
+        """Streams a chat completion and yields each non-blank line of it as soon as it is finished."""
+        stream = self._create_chat(self._items_messages(instructions, content), stream=True,
+                                   stream_options=self._stream_options())
+        buffer = ""
+        with stream:
+            for chunk in stream:
+                lines, buffer = self._complete_lines(buffer + self._delta_text(chunk))
+                yield from lines
+        if buffer.strip():
+            yield buffer.strip()
+
+
+class AsyncOpenAI_Conversation(_BaseConversation):
+    """
+    Asynchronous twin of OpenAI_Conversation backed by AsyncOpenAI.
+
+    The request methods are shared with OpenAI_Conversation and return coroutines here, and the
+    streaming methods are async generators with the same arguments as their OpenAI_Conversation
+    counterparts, so a single event loop can drive many conversations at once.
+    """
+
+    @property
+    def _client(self):
+        """The client of this conversation, or the one shared within the running event loop."""
+        if self._own_client is None:
+            return get_shared_async_client(self._api_key, self._base_url)
+        return self._own_client
+
+    @_client.setter
+    def _client(self, client):
+        self._own_client = client
+
+    def _create_client(self):
+        """Creates the asynchronous OpenAI client, or returns None to use the shared one."""
+        if self._shared_client:
+            return None
+        return _new_async_client(self._api_key, self._base_url)
+
+    def _new_lock(self):
+        """Creates an asyncio lock for an assistant thread."""
+        return asyncio.Lock()
+
+    async def _run(self, flow):
+        """Runs a request flow, awaiting each call it yields and sending back its result or exception."""
+        send, value = flow.send, None
+        while True:
+            try:
+                call = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                send, value = flow.send, await call
+            except BaseException as e:
+                # Cancellation is thrown into the flow too, so its finally blocks can still make calls
+                send, value = flow.throw, e
+
+    async def _gather(self, flows, concurrency):
+        """Runs request flows as concurrent tasks, at most concurrency at once, and returns their results in order."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(flow):
+            async with semaphore:
+                return await self._run(flow)
+
+        return list(await asyncio.gather(*map(run, flows)))
+
+    def _start_speculation(self, flow):
+        """Starts a follow-up flow in a background task and returns the task."""
+        task = asyncio.create_task(self._run(flow))
+        # Retrieve the outcome so a failed speculation that is never awaited is not reported as unhandled
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
+
+    async def _speculated(self, job):
+        """Returns the result of a speculative follow-up task, or None if it was cancelled or failed."""
+        try:
+            return await asyncio.shield(job)
+        except asyncio.CancelledError:
+            # Only a cancelled speculation is regenerated; cancelling the caller still cancels it
+            if not job.cancelled():
+                raise
+        except Exception:
+            pass  # Generate them again, so an error that persists reaches the caller
+        return None
+
+    def _new_download_client(self):
+        """Creates the HTTP client generate_images downloads images with."""
+        return httpx.AsyncClient(timeout=DEFAULT_REQUEST_TIMEOUT)
+
+    async def _close_download_client(self, downloads):
+        """Closes a client from _new_download_client."""
+        await downloads.aclose()
+
+    async def _download_image(self, downloads, url, key):
+        """Streams an image from its URL into the image store and returns its path."""
+        async with downloads.stream("GET", url) as download:
+            download.raise_for_status()
+            writer = _ImageWriter(self._image_store, key)
+            try:
+                async for chunk in download.aiter_bytes(DEFAULT_AUDIO_CHUNK_SIZE):
+                    writer.write(chunk)
+            except BaseException:
+                writer.discard()
+                raise
+            return writer.commit()
+
+    async def ask_question_stream(self, instructions, question, assistant_id=None):
+        """Async generator version of OpenAI_Conversation.ask_question_stream."""
+        lookup = await self._run(self._semantic_lookup(instructions, question, assistant_id))
+        answer = self._semantic_answer(lookup)
+        if answer is not None:
+            yield answer
+            self._speculate_followups(question, answer)
+            return
+        if assistant_id:
+            deltas = self._ask_assistant_stream(instructions, question, assistant_id)
+        else:
+            deltas = self._ask_openai_stream(instructions, question)
+        parts = []
+        async with aclosing(deltas):
+            async for delta in deltas:
+                parts.append(delta)
+                yield delta
+        self._semantic_store(lookup, question, "".join(parts))
+        self._speculate_followups(question, "".join(parts))
+
+    async def generate_sample_prompts_stream(self, context, num_samples, max_words, assistant_id=None):
+        """Async generator version of OpenAI_Conversation.generate_sample_prompts_stream."""
+        instructions = self._sample_prompts_instructions(num_samples, max_words)
+        if assistant_id:
+            for prompt in await self._run(self._generate_assistant_prompts(context, instructions, assistant_id)):
+                yield prompt
+        else:
+            async with aclosing(self._stream_lines(instructions, context)) as prompts:
+                async for prompt in prompts:
+                    yield prompt
+
+    async def generate_followups_stream(self, question, response, num_samples, max_words, assistant_id=None):
+        """Async generator version of OpenAI_Conversation.generate_followups_stream."""
+        recent_history, instructions = self._followups_request(question, response, num_samples, max_words)
+        if assistant_id:
+            for prompt in await self._run(self._generate_assistant_followups(recent_history, instructions, assistant_id)):
+                yield prompt
+        else:
+            async with aclosing(self._stream_lines(instructions, recent_history)) as prompts:
+                async for prompt in prompts:
+                    yield prompt
+
+    async def text_to_speech(self, text, voice=None, sink=None):
+        """Coroutine version of OpenAI_Conversation.text_to_speech."""
+        try:
+            if sink is None:
+                return b"".join([chunk async for chunk in self.text_to_speech_stream(text, voice)])
+            if isinstance(sink, (str, Path)):
+                with open(sink, "wb") as audio_file:
+                    async for chunk in self.text_to_speech_stream(text, voice):
+                        audio_file.write(chunk)
+            else:
+                async for chunk in self.text_to_speech_stream(text, voice):
+                    sink.write(chunk)
+            return sink
+        except Exception as e:
+            print(f"Error converting text to speech: {e}")
+            return None
+
+    async def text_to_speech_stream(self, text, voice=None, chunk_size=DEFAULT_AUDIO_CHUNK_SIZE):
+        """Async generator version of OpenAI_Conversation.text_to_speech_stream."""
+        request = self._speech_request(text, voice)
+        key, cached = self._cached_audio(text, request["voice"], chunk_size)
+        if cached is not None:
+            for chunk in cached:
+                yield chunk
+            return
+        chunks = []
+        async with self._client.audio.speech.with_streaming_response.create(**request) as response:
+            async for chunk in response.iter_bytes(chunk_size):
+                chunks.append(chunk)
+                yield chunk
+        if key is not None:
+            self._audio_cache.put(key, b"".join(chunks))
+
+    async def speak_stream(self, text_chunks, voice=None, concurrency=DEFAULT_TTS_CONCURRENCY):
+        """
+        Async generator version of OpenAI_Conversation.speak_stream.
+
+        text_chunks is an async iterable, such as the result of ask_question_stream.
+        """
+        pending = asyncio.Queue()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def speak(sentence):
+            async with semaphore:
+                return await self.text_to_speech(sentence, voice)
+
+        async def produce():
+            try:
+                buffer = ""
+                async for chunk in text_chunks:
+                    sentences, buffer = self._complete_sentences(buffer + chunk)
+                    for sentence in sentences:
+                        await pending.put((sentence, asyncio.create_task(speak(sentence))))
+                if buffer.strip():
+                    await pending.put((buffer.strip(), asyncio.create_task(speak(buffer.strip()))))
+                await pending.put(None)
+            except Exception as e:
+                await pending.put(e)
+            finally:
+                if hasattr(text_chunks, "aclose"):
+                    await text_chunks.aclose()
+
+        producer = asyncio.create_task(produce())
+        tasks = []
+        try:
+            while (item := await pending.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                sentence, task = item
+                tasks.append(task)
+                yield sentence, await task
+        finally:
+            producer.cancel()
+            # Tasks queued but not yet taken are cancelled too, so no TTS request outlives the consumer
+            while not pending.empty():
+                item = pending.get_nowait()
+                if isinstance(item, tuple):
+                    tasks.append(item[1])
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def _stream_assistant(self, content, instructions, assistant_id, purpose, outcome):
+        """Async generator version of OpenAI_Conversation._stream_assistant, holding an asyncio lock on the thread."""
+        entry = self._cached_thread(assistant_id, purpose)
+        if entry is None:
+            thread = await self._client.beta.threads.create()
+            entry = self._cache_thread(assistant_id, purpose, thread.id)
+        async with entry["lock"]:
+            await self._client.beta.threads.messages.create(
+                thread_id=entry["thread_id"],
+                role="user",
+                content=content
+            )
+            stream = await self._client.beta.threads.runs.create(
+                thread_id=entry["thread_id"],
+                assistant_id=assistant_id,
+                instructions=instructions,
+                stream=True
+            )
+            # A stream closed early, e.g. on barge-in, leaves its run unfinished and the thread is dropped
+            try:
+                async with stream:
+                    async for event in stream:
+                        delta = self._apply_run_event(event, outcome)
+                        if delta:
+                            yield delta
+            finally:
+                self._finish_thread_run(assistant_id, purpose, entry, outcome)
+
+    async def _complete_assistant_run(self, content, instructions, assistant_id, purpose):
+        """Runs an assistant to completion and returns the outcome dict of _stream_assistant."""
+        outcome = {}
+        async for _ in self._stream_assistant(content, instructions, assistant_id, purpose, outcome):
+            pass
+        return outcome
+
+    async def _ask_assistant_stream(self, instructions, question, assistant_id):
+        """Streams an assistant's answer and records it in the conversation history when the run ends."""
+        outcome = {}
+        async with aclosing(self._stream_assistant(question, instructions, assistant_id, "ask", outcome)) as deltas:
+            async for delta in deltas:
+                yield delta
+        self._record_assistant_answer(question, outcome.get("reply"))
+
+    async def _ask_openai_stream(self, instructions, question):
+        """Streams a reply from the OpenAI model and records the assembled answer when it completes."""
+        _, messages = await self._run(self._question_request(instructions, question))
+        stream = await self._create_chat(messages, stream=True, stream_options=self._stream_options())
+        parts = []
+        async with stream:
+            async for chunk in stream:
+                delta = self._delta_text(chunk)
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        self._prev_conversation.append({"role": "assistant", "content": "".join(parts).strip()})
+
+    async def _stream_lines(self, instructions, content):
+        """Streams a chat completion and yields each non-blank line of it as soon as it is finished."""
+        stream = await self._create_chat(self._items_messages(instructions, content), stream=True,
+                                         stream_options=self._stream_options())
+        buffer = ""
+        async with stream:
+            async for chunk in stream:
+                lines, buffer = self._complete_lines(buffer + self._delta_text(chunk))
+                for line in lines:
+                    yield line
+        if buffer.strip():
+            yield buffer.strip()
@@ -11,7 +11,7 @@ current_dir = os.path.dirname(__file__)
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
 
-from PeopleCodeOpenAI import OpenAI_Conversation
+from PeopleCodeOpenAI import OpenAI_Conversation, ResponseCache, SemanticCache
 
 # Initialize OpenAI_Conversation instance
 API_KEY = os.getenv('OPENAI_API_KEY')
@@ -29,6 +29,23 @@ st.subheader("Ask the Book")
 conversation.set_model("gpt-4o-mini")
 conversation.set_temperature(.1)
 
+# Reuse the sample prompts generated for earlier sessions for up to a day
+@st.cache_resource
+def response_cache():
+    return ResponseCache(ttl=24 * 60 * 60, path=os.path.join(current_dir, "response_cache.sqlite"))
+
+
+conversation.set_response_cache(response_cache())
+
+
+# Answer rephrasings of questions already asked by any user of this server from memory
+@st.cache_resource
+def semantic_cache():
+    return SemanticCache(ttl=24 * 60 * 60)
+
+
+conversation.set_semantic_cache(semantic_cache())
+
 # Set  assistant ID if using specific assistant functionality
 
 ASSISTANT_ID = "asst_LBdQmnU4xdzxRhZ822zNZk4q";
@@ -51,15 +51,14 @@ if st.button("Ask"):
         # Build the conversation history as a single string for context
         conversation_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in st.session_state.conversation])
 
-        # Get assistant's response using the entire conversation as context
-        response = conversation_instance.ask_question(st.session_state.instructions, conversation_history)
+        # Stream assistant's response using the entire conversation as context
+        st.write("Response:")
+        response = st.write_stream(
+            conversation_instance.ask_question_stream(st.session_state.instructions, conversation_history))
 
         # Append assistant's response to conversation history
         st.session_state.conversation.append({"role": "assistant", "content": response})
 
-        # Display assistant's response
-        st.text_area("Response:", response, height=200)
-
 
 # Display conversation history
 st.write("Conversation History:")
@@ -12,7 +12,7 @@ current_dir = os.path.dirname(__file__)
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
 
-from PeopleCodeOpenAI import OpenAI_Conversation
+from PeopleCodeOpenAI import OpenAI_Conversation, AudioCache
 
 # Load API key from environment variable
 api_key = os.getenv("OPENAI_API_KEY")
@@ -23,6 +23,13 @@ if not api_key:
 # Initialize OpenAI_Conversation instance
 conversation_instance = OpenAI_Conversation(api_key=api_key)
 
+# Keep synthesized speech on disk so reruns replay it instead of calling the TTS API again
+@st.cache_resource
+def audio_cache():
+    return AudioCache(os.path.join(current_dir, "tts_cache"))
+
+conversation_instance.set_audio_cache(audio_cache())
+
 # Streamlit App
 st.title("TTS ChatApp")
 
@@ -44,22 +51,27 @@ if 'instructions' not in st.session_state:
 # Instructions input
 st.session_state.instructions = st.text_area("System Prompt:", st.session_state.instructions)
 
+def ask_and_speak(prompt):
+    """Streams the answer to a prompt and plays each sentence as soon as its audio is ready."""
+    st.write("Response:")
+    sentences = []
+    answer_stream = conversation_instance.ask_question_stream(st.session_state.instructions, prompt)
+    for sentence, audio in conversation_instance.speak_stream(answer_stream):
+        sentences.append(sentence)
+        st.write(sentence)
+        if audio:
+            st.audio(audio)
+    return " ".join(sentences)
+
 # User prompt input
 user_prompt = st.text_input("Enter your prompt:")
 
 if st.button("Ask"):
     if user_prompt:
         try:
-            response = conversation_instance.ask_question(st.session_state.instructions, user_prompt)
-            # Assuming response is a string
+            response = ask_and_speak(user_prompt)
             st.session_state.conversation.append({"role": "user", "content": user_prompt})
             st.session_state.conversation.append({"role": "assistant", "content": response})
-
-            # Display response
-            st.text_area("Response:", response, height=200)
-            speech_file_path = conversation_instance.text_to_speech(response)
-            if speech_file_path:
-                st.audio(speech_file_path)
         except Exception as e:
             st.error(f"An error occurred: {e}")
 
@@ -91,14 +103,9 @@ if st.session_state.generated_prompt:
         st.audio(speech_file_path)
     if st.button("Ask Generated Prompt"):
         try:
-            response = conversation_instance.ask_question(st.session_state.instructions, st.session_state.generated_prompt)
+            response = ask_and_speak(st.session_state.generated_prompt)
             st.session_state.conversation.append({"role": "user", "content": st.session_state.generated_prompt})
             st.session_state.conversation.append({"role": "assistant", "content": response})
-
-            st.text_area("Response:", response, height=200)
-            speech_file_path = conversation_instance.text_to_speech(response)
-            if speech_file_path:
-                st.audio(speech_file_path)
             st.session_state.generated_prompt = ""
         except Exception as e:
             st.error(f"An error occurred: {e}")
@@ -137,14 +144,9 @@ if 'followup_questions' in st.session_state and st.session_state.followup_questi
         try:
             selected_idx = int(followup_choice.split()[1]) - 1
             selected_followup = st.session_state.followup_questions[selected_idx]
-            followup_response = conversation_instance.ask_question(st.session_state.instructions, selected_followup)
+            followup_response = ask_and_speak(selected_followup)
             st.session_state.conversation.append({"role": "user", "content": selected_followup})
             st.session_state.conversation.append({"role": "assistant", "content": followup_response})
-
-            st.text_area("Response:", followup_response, height=200)
-            speech_file_path = conversation_instance.text_to_speech(followup_response)
-            if speech_file_path:
-                st.audio(speech_file_path)
         except Exception as e:
             st.error(f"An error occurred: {e}")
 
@@ -11,7 +11,7 @@ current_dir = os.path.dirname(__file__)
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
 
-from PeopleCodeOpenAI import OpenAI_Conversation
+from PeopleCodeOpenAI import OpenAI_Conversation, SemanticCache
 
 # Define context and system prompt
 context = (
@@ -32,6 +32,15 @@ if not api_key:
 # Initialize OpenAI_Conversation instance
 conversation_instance = OpenAI_Conversation(api_key=api_key)
 
+
+# Answer rephrasings of questions already asked by any user of this server from memory
+@st.cache_resource
+def semantic_cache():
+    return SemanticCache()
+
+
+conversation_instance.set_semantic_cache(semantic_cache())
+
 # Initialize session state variables
 if 'conversation' not in st.session_state:
     st.session_state.conversation = []
@@ -108,7 +117,9 @@ with col2:
 
 
 def update_conversation(prompt):
-    response = conversation_instance.ask_question(system_prompt, prompt)
+    # Stream the response so the first words appear while the rest is still being generated
+    st.write("Response:")
+    response = st.write_stream(conversation_instance.ask_question_stream(system_prompt, prompt))
     st.session_state.latest_question = prompt
     st.session_state.latest_answer = response
     st.session_state.conversation.append({"role": "user", "content": prompt})
@@ -123,8 +134,9 @@ if ask_custom and user_prompt:
     update_conversation(user_prompt)
 
 if st.session_state.latest_answer:
-    # Display response
-    st.text_area("Response:", st.session_state.latest_answer, height=200)
+    # Display response, unless it was just streamed above
+    if not (ask_custom and user_prompt):
+        st.text_area("Response:", st.session_state.latest_answer, height=200)
     speech_file_path = conversation_instance.text_to_speech(st.session_state.latest_answer, "nova")
     if speech_file_path:
         st.audio(speech_file_path)
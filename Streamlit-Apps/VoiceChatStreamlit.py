@@ -2,7 +2,6 @@
 # This Streamlit app allows users to interact with OpenAI's language model. Users can talk
 # and get responses, similar to a conversation.
 
-import tempfile
 import streamlit as st
 import sys
 import os
@@ -13,7 +12,7 @@ parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
 
 from streamlit_mic_recorder import mic_recorder
-from PeopleCodeOpenAI import OpenAI_Conversation
+from PeopleCodeOpenAI import OpenAI_Conversation, VoiceSession
 
 # Initialize OpenAI_Conversation
 api_key = os.getenv('OPENAI_API_KEY')
@@ -33,31 +32,25 @@ conversation_manager.set_model(selected_model)
 
 instructions = "You are a helpful assistant"
 
+# The voice session overlaps transcription, the streamed answer and TTS
+voice_session = VoiceSession(conversation_manager, instructions)
+
 
 def callback():
     if st.session_state.get('my_recorder_output'):
         audio_bytes = st.session_state.my_recorder_output['bytes']
         st.audio(audio_bytes)
 
-        # Save audio bytes to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio_file:
-            temp_audio_file.write(audio_bytes)
-            temp_audio_file_path = temp_audio_file.name
-
-        try:
-            # Perform speech recognition
-            transcribed_text = conversation_manager.speech_recognition(temp_audio_file_path)
-
-            # Get response from OpenAI model
-            response = conversation_manager.ask_question(instructions, transcribed_text)
-
-            # Convert response to speech
-            answer_audio = conversation_manager.text_to_speech(response)
-            st.write("Response:")
-            st.audio(answer_audio)
-        finally:
-            # Clean up the temporary file
-            os.remove(temp_audio_file_path)
+        # Transcribe, answer and speak the answer sentence by sentence
+        st.write("Response:")
+        for sentence, answer_audio in voice_session.respond(audio_bytes):
+            if answer_audio:
+                st.audio(answer_audio)
+
+        metrics = voice_session.last_metrics
+        if metrics["first_audio"] is not None:
+            st.caption(f"First audio after {metrics['first_audio']:.1f}s "
+                       f"(transcription {metrics['stt']:.1f}s, first token {metrics['chat_first_token']:.1f}s)")
 
 
 # Ensure 'my_recorder_output' is initialized in session state
@@ -0,0 +1,2 @@
+# peoplecode
+# The subsystems PeopleCodeOpenAI is built from. Apps import their public names from PeopleCodeOpenAI.
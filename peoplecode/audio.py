@@ -0,0 +1,179 @@
+# audio.py
+# Audio helpers for speech recognition: upload naming, WAV splitting and transcript stitching.
+
+import io
+import os
+import re
+import wave
+import numpy as np
+
+from .constants import AUDIO_SIGNATURES, SILENCE_SEARCH_SECONDS, SILENCE_WINDOW_SECONDS, STITCH_MAX_OVERLAP_WORDS
+
+
+def _audio_filename(data):
+    """Names in-memory audio after its format, detected from the file signature, so the API can decode it."""
+    for signature, extension in AUDIO_SIGNATURES:
+        if data[:len(signature)] == signature:
+            return f"audio.{extension}"
+    if data[4:8] == b"ftyp":
+        return "audio.m4a"
+    return "audio.wav"
+
+
+class _BufferReader(io.RawIOBase):
+    """Read-only file object over a buffer, so uploads stream from it without copying it whole."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = (0, self._position, len(self._view))[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        chunk = self._view[self._position:end].tobytes()
+        self._position += len(chunk)
+        return chunk
+
+    def readinto(self, target):
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+
+def _is_audio_buffer(audio):
+    """Returns whether audio is in-memory audio: bytes, a bytearray or a memoryview."""
+    return isinstance(audio, (bytes, bytearray, memoryview))
+
+
+def _audio_upload(audio):
+    """
+    Prepares in-memory audio for upload without copying it.
+
+    Args:
+        audio: The audio bytes, a bytearray or memoryview, or a readable binary file object.
+
+    Returns:
+        A (filename, content) tuple for the upload.
+    """
+    if isinstance(audio, bytes):
+        return _audio_filename(audio), audio
+    if _is_audio_buffer(audio):
+        view = memoryview(audio).cast("B")
+        return _audio_filename(view), _BufferReader(view)
+    name = getattr(audio, "name", None)
+    if isinstance(name, str) and os.path.splitext(name)[1]:
+        return os.path.basename(name), audio
+    if getattr(audio, "seekable", lambda: False)():
+        start = audio.tell()
+        header = audio.read(12)
+        audio.seek(start)
+        return _audio_filename(header), audio
+    # A pipe or network body cannot be rewound after sniffing its format, so it is read whole
+    data = audio.read()
+    return _audio_filename(data), data
+
+
+def _read_audio(audio):
+    """Returns the bytes of audio given as a path, a buffer or a binary file object."""
+    if _is_audio_buffer(audio):
+        return bytes(audio)
+    if hasattr(audio, "read"):
+        return audio.read()
+    with open(audio, "rb") as audio_file:
+        return audio_file.read()
+
+
+def _split_wav(data, chunk_seconds, overlap_seconds):
+    """
+    Splits a WAV recording into overlapping chunks, cutting at the quietest moment near each boundary.
+
+    Args:
+        data: The WAV file bytes.
+        chunk_seconds: The longest chunk in seconds.
+        overlap_seconds: Seconds of audio repeated at the start of the next chunk.
+
+    Returns:
+        A list of WAV file bytes, or None if data is not a WAV file.
+    """
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            params = wav.getparams()
+            frames = wav.readframes(params.nframes)
+    except (wave.Error, EOFError):
+        return None
+    frame_size = params.sampwidth * params.nchannels
+    total = len(frames) // frame_size
+    chunk = int(chunk_seconds * params.framerate)
+    overlap = int(overlap_seconds * params.framerate)
+    if total <= chunk:
+        return [data]
+    window = max(1, int(SILENCE_WINDOW_SECONDS * params.framerate))
+    loudness = _window_loudness(frames[:total * frame_size], params, window)
+    chunks = []
+    start = 0
+    while True:
+        end = min(start + chunk, total)
+        if end < total and loudness is not None:
+            first = max(start + overlap + window, end - int(SILENCE_SEARCH_SECONDS * params.framerate)) // window
+            last = end // window
+            if last > first:
+                end = (first + int(np.argmin(loudness[first:last]))) * window + window // 2
+        chunks.append(_wav_bytes(params, frames[start * frame_size:end * frame_size]))
+        if end >= total:
+            return chunks
+        start = max(end - overlap, start + 1)
+
+
+def _window_loudness(frames, params, window):
+    """Returns the RMS loudness of each window of samples, or None for unsupported sample widths."""
+    dtypes = {1: np.uint8, 2: np.int16, 4: np.int32}
+    if params.sampwidth not in dtypes:
+        return None
+    samples = np.frombuffer(frames, dtypes[params.sampwidth]).astype(np.float32)
+    if params.sampwidth == 1:
+        samples -= 128
+    samples = samples.reshape(-1, params.nchannels).mean(axis=1)
+    count = len(samples) // window
+    return np.sqrt(np.mean(np.square(samples[:count * window].reshape(count, window)), axis=1))
+
+
+def _wav_bytes(params, frames):
+    """Builds a WAV file from raw frames."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(params.nchannels)
+        wav.setsampwidth(params.sampwidth)
+        wav.setframerate(params.framerate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def _stitch_transcripts(texts):
+    """Joins the transcripts of overlapping chunks, dropping the words each chunk repeats from the previous one."""
+    def normalize(word):
+        return re.sub(r"\W", "", word.lower())
+
+    words = []
+    for text in texts:
+        new_words = text.split()
+        repeated = 0
+        for count in range(min(len(words), len(new_words), STITCH_MAX_OVERLAP_WORDS), 0, -1):
+            if [normalize(word) for word in words[-count:]] == [normalize(word) for word in new_words[:count]]:
+                repeated = count
+                break
+        words.extend(new_words[repeated:])
+    return " ".join(words)
@@ -0,0 +1,167 @@
+# batch.py
+# Jobs that answer many questions through the OpenAI Batch API.
+
+import json
+import time
+from pathlib import Path
+
+from .constants import BATCH_TERMINAL_STATUSES, DEFAULT_BATCH_POLL_INTERVAL
+from .caches import _atomic_write
+
+
+class BatchJob:
+    """
+    Offline job that runs many generate_sample_prompts and generate_list requests through the Batch API.
+
+    The job state (requests, batch and file IDs, status and parsed results) is saved to a JSON file
+    after every step, so a job can be resumed from another process by creating a BatchJob with the
+    same state_path.
+    """
+
+    def __init__(self, conversation, state_path):
+        """
+        Initializes the job, resuming it if state_path already exists.
+
+        Args:
+            conversation: The OpenAI_Conversation whose client, model and temperature are used.
+            state_path: Path of the JSON file holding the job state.
+        """
+        self._conversation = conversation
+        self._state_path = Path(state_path)
+        if self._state_path.exists():
+            self._state = json.loads(self._state_path.read_text())
+        else:
+            self._state = {"requests": [], "batch_id": None, "input_file_id": None, "status": None,
+                           "output_file_id": None, "error_file_id": None, "results": None}
+
+    @property
+    def status(self):
+        """The last known batch status, or None if the job has not been submitted."""
+        return self._state["status"]
+
+    def add_sample_prompts(self, context, num_samples, max_words, custom_id=None):
+        """
+        Adds a generate_sample_prompts request to the job.
+
+        Args:
+            context: The context for generating prompts.
+            num_samples: The number of prompts to generate.
+            max_words: The maximum number of words per prompt.
+            custom_id: The ID the result is returned under. Generated if None.
+
+        Returns:
+            The request's custom_id.
+        """
+        instructions = self._conversation._sample_prompts_instructions(num_samples, max_words)
+        messages = [{"role": "system", "content": instructions}, {"role": "user", "content": context}]
+        return self._add_request("lines", messages, custom_id)
+
+    def add_list(self, list_description, num_items, max_words_per_item, custom_id=None):
+        """
+        Adds a generate_list request to the job.
+
+        Args:
+            list_description: A description of the list to be generated.
+            num_items: The number of items to generate.
+            max_words_per_item: The maximum number of words per item.
+            custom_id: The ID the result is returned under. Generated if None.
+
+        Returns:
+            The request's custom_id.
+        """
+        instructions = self._conversation._list_instructions(list_description, num_items, max_words_per_item)
+        return self._add_request("list", [{"role": "system", "content": instructions}], custom_id)
+
+    def submit(self):
+        """Uploads the requests as a JSONL file and creates the batch. Does nothing if already submitted."""
+        if self._state["batch_id"]:
+            return
+        if not self._state["requests"]:
+            raise ValueError("The batch job has no requests.")
+        client = self._conversation._client
+        lines = [json.dumps({"custom_id": request["custom_id"], "method": "POST", "url": "/v1/chat/completions",
+                             "body": request["body"]}) for request in self._state["requests"]]
+        if not self._state["input_file_id"]:
+            input_file = client.files.create(file=("batch_input.jsonl", "\n".join(lines).encode("utf-8")),
+                                             purpose="batch")
+            self._state["input_file_id"] = input_file.id
+            self._save()
+        batch = client.batches.create(input_file_id=self._state["input_file_id"], endpoint="/v1/chat/completions",
+                                      completion_window="24h")
+        self._update(batch)
+
+    def poll(self):
+        """Refreshes the batch status from the API and returns it."""
+        if not self._state["batch_id"]:
+            raise ValueError("The batch job has not been submitted.")
+        if self._state["status"] not in BATCH_TERMINAL_STATUSES:
+            self._update(self._conversation._client.batches.retrieve(self._state["batch_id"]))
+        return self._state["status"]
+
+    def wait(self, poll_interval=DEFAULT_BATCH_POLL_INTERVAL, timeout=None):
+        """
+        Submits the job if needed, waits for the batch to finish and returns its results.
+
+        Args:
+            poll_interval: Seconds between status checks.
+            timeout: Seconds to wait before giving up, or None to wait until the batch finishes.
+
+        Returns:
+            The results, as returned by results().
+        """
+        self.submit()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() not in BATCH_TERMINAL_STATUSES:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Batch {self._state['batch_id']} is still {self._state['status']}.")
+            time.sleep(poll_interval)
+        return self.results()
+
+    def results(self):
+        """
+        Downloads and parses the batch output.
+
+        Returns:
+            A dict mapping each custom_id to its list of prompts or items, or to None if the request failed.
+        """
+        if self._state["results"] is not None:
+            return self._state["results"]
+        if self._state["status"] not in BATCH_TERMINAL_STATUSES:
+            raise ValueError("The batch job has not finished.")
+        kinds = {request["custom_id"]: request["kind"] for request in self._state["requests"]}
+        results = dict.fromkeys(kinds)
+        if self._state["output_file_id"]:
+            content = self._conversation._client.files.content(self._state["output_file_id"]).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    continue
+                text = response["body"]["choices"][0]["message"]["content"]
+                parse = self._conversation._parse_lines if kinds[record["custom_id"]] == "lines" else self._conversation._parse_list
+                results[record["custom_id"]] = parse(text)
+        self._state["results"] = results
+        self._save()
+        return results
+
+    def _add_request(self, kind, messages, custom_id):
+        if self._state["batch_id"]:
+            raise ValueError("Requests cannot be added after the batch job has been submitted.")
+        custom_id = custom_id or f"request-{len(self._state['requests']) + 1}"
+        if any(request["custom_id"] == custom_id for request in self._state["requests"]):
+            raise ValueError(f"Duplicate custom_id '{custom_id}'.")
+        body = {"model": self._conversation._model, "messages": messages,
+                "temperature": self._conversation._temperature}
+        self._state["requests"].append({"custom_id": custom_id, "kind": kind, "body": body})
+        self._save()
+        return custom_id
+
+    def _update(self, batch):
+        self._state.update(batch_id=batch.id, status=batch.status, output_file_id=batch.output_file_id,
+                           error_file_id=batch.error_file_id)
+        self._save()
+
+    def _save(self):
+        _atomic_write(self._state_path, json.dumps(self._state, indent=2))
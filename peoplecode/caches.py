@@ -0,0 +1,742 @@
+# caches.py
+# Caches used by the conversations: responses, semantic matches, embeddings, synthesized speech,
+# generated images and file metadata.
+
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+from .constants import (DEFAULT_AUDIO_CACHE_BYTES, DEFAULT_AUDIO_CHUNK_SIZE, DEFAULT_EMBEDDING_MODEL,
+                        DEFAULT_SIMILARITY_THRESHOLD, IMAGE_SIGNATURES, LSH_BITS, LSH_TABLES)
+
+
+class ResponseCache:
+    """
+    Cache for model responses with an in-memory LRU and an optional on-disk SQLite store.
+
+    Entries are keyed on everything that determines a response (model, temperature, instructions,
+    messages and assistant ID), so only repeated identical requests are served from the cache.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, path=None, max_disk_entries=10000):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries: The maximum number of responses kept in memory.
+            ttl: Seconds after which a response expires, or None to keep responses until evicted.
+            path: Path of the SQLite database file, or None for a memory-only cache.
+            max_disk_entries: The maximum number of responses kept in the database.
+        """
+        if max_entries < 1 or max_disk_entries < 1:
+            raise ValueError("Cache sizes must be at least 1.")
+        self._max_entries = max_entries
+        self._max_disk_entries = max_disk_entries
+        self._ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model, temperature, instructions, messages, assistant_id=None, response_format=None):
+        """Builds the cache key for a request."""
+        request = [model, temperature, instructions, messages, assistant_id]
+        if response_format is not None:
+            request.append(response_format)
+        request = json.dumps(request, sort_keys=True)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Looks up a response.
+
+        Args:
+            key: A key from make_key.
+
+        Returns:
+            The cached response, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[1], now):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expired(row[1], now):
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                elif row is not None:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    entry = row
+                    self._remember(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(entry[0])
+
+    def set(self, key, value):
+        """
+        Stores a response.
+
+        Args:
+            key: A key from make_key.
+            value: A JSON-serializable response.
+        """
+        now = time.time()
+        entry = (json.dumps(value), now)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                                 (key, entry[0], now, now))
+                self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                                 "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self._max_disk_entries,))
+                self._db.commit()
+
+    def clear(self):
+        """Removes every response from memory and disk and resets the counters."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dict with the hit and miss counts and the number of stored responses."""
+        with self._lock:
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self._db else 0
+            return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory),
+                    "disk_entries": disk_entries}
+
+    def _expired(self, created, now):
+        return self._ttl is not None and now - created > self._ttl
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+
+class SemanticCache:
+    """
+    Cache of answers looked up by the meaning of a question rather than its exact text.
+
+    Questions are embedded and compared by cosine similarity with the questions already answered in
+    the same namespace (instructions, model and assistant). The most similar stored question at or
+    above the threshold returns its answer. Each namespace keeps its vectors in a NumPy matrix that
+    is scanned in full, or, with approximate=True, only where a question shares a random-hyperplane
+    hash bucket with the stored ones, which is faster for large caches but may miss a close match.
+    """
+
+    def __init__(self, threshold=DEFAULT_SIMILARITY_THRESHOLD, max_entries=1024, ttl=None, approximate=False,
+                 embedding_model=DEFAULT_EMBEDDING_MODEL):
+        """
+        Initializes the cache.
+
+        Args:
+            threshold: The lowest cosine similarity at which a stored answer is returned.
+            max_entries: The maximum number of answers kept across all namespaces. The least
+                recently used answer is evicted first.
+            ttl: Seconds after which an answer expires, or None to keep answers until evicted.
+            approximate: Whether lookups use the hash index instead of scanning every vector.
+            embedding_model: The model questions are embedded with.
+        """
+        if max_entries < 1:
+            raise ValueError("Cache size must be at least 1.")
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._approximate = approximate
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_namespace(instructions, model, assistant_id=None):
+        """Builds the namespace of the questions answered with the same instructions, model and assistant."""
+        return hashlib.sha256(json.dumps([instructions, model, assistant_id]).encode("utf-8")).hexdigest()
+
+    def get(self, namespace, vector):
+        """
+        Looks up the answer to the stored question most similar to a question.
+
+        Args:
+            namespace: A namespace from make_namespace.
+            vector: The question's embedding.
+
+        Returns:
+            The stored answer, or None if no stored question is similar enough.
+        """
+        with self._lock:
+            index = self._indexes.get(namespace)
+            match = index.search(vector) if index is not None else None
+            now = time.monotonic()
+            if match is not None and self._ttl is not None and now - index.entries[match[0]]["created"] > self._ttl:
+                index.remove(match[0])
+                match = None
+            if match is None or match[1] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = index.entries[match[0]]
+            entry["used"] = now
+            return entry["answer"]
+
+    def set(self, namespace, vector, question, answer):
+        """
+        Stores the answer to a question, then evicts the least recently used answers while the cache is over its size.
+
+        Args:
+            namespace: A namespace from make_namespace.
+            vector: The question's embedding.
+            question: The question text.
+            answer: The answer to return for similar questions.
+        """
+        if not answer:
+            return
+        with self._lock:
+            if namespace not in self._indexes:
+                self._indexes[namespace] = _VectorIndex(len(vector), self._approximate)
+            now = time.monotonic()
+            self._indexes[namespace].add(vector, {"question": question, "answer": answer, "created": now, "used": now})
+            while sum(len(index) for index in self._indexes.values()) > self._max_entries:
+                oldest = min(((index.least_recently_used(), name) for name, index in self._indexes.items() if len(index)),
+                             key=lambda item: item[0][1])
+                (row, _), name = oldest
+                self._indexes[name].remove(row)
+
+    def clear(self, namespace=None):
+        """Removes every answer, or only those of one namespace, and resets the counters when clearing everything."""
+        with self._lock:
+            if namespace is not None:
+                self._indexes.pop(namespace, None)
+                return
+            self._indexes.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dict with the hit and miss counts, the hit rate, and the number of answers and namespaces."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "entries": sum(len(index) for index in self._indexes.values()),
+                    "namespaces": sum(1 for index in self._indexes.values() if len(index))}
+
+
+class _VectorIndex:
+    """
+    Growable matrix of unit vectors with their entries, searched by cosine similarity.
+
+    With approximate search, every vector is also filed under LSH_TABLES hashes built from the signs
+    of LSH_BITS random projections. Similar vectors tend to share a hash, so a search only scores the
+    vectors sharing at least one hash with the query.
+    """
+
+    def __init__(self, dimensions, approximate=False):
+        self._vectors = np.empty((16, dimensions), dtype=np.float32)
+        self.entries = []
+        self._planes = None
+        if approximate:
+            self._planes = np.random.default_rng().standard_normal((LSH_TABLES * LSH_BITS, dimensions)).astype(np.float32)
+            self._buckets = [{} for _ in range(LSH_TABLES)]
+            self._hashes = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, vector, entry):
+        vector = self._normalize(vector)
+        row = len(self.entries)
+        if row == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.empty_like(self._vectors)])
+        self._vectors[row] = vector
+        self.entries.append(entry)
+        if self._planes is not None:
+            hashes = self._hash(vector)
+            self._hashes.append(hashes)
+            for table, value in enumerate(hashes):
+                self._buckets[table].setdefault(value, set()).add(row)
+
+    def search(self, vector):
+        """Returns (row, similarity) of the most similar stored vector, or None if there is none to compare."""
+        if not self.entries:
+            return None
+        vector = self._normalize(vector)
+        if self._planes is None:
+            similarities = self._vectors[:len(self.entries)] @ vector
+            row = int(np.argmax(similarities))
+            return row, float(similarities[row])
+        rows = set()
+        for table, value in enumerate(self._hash(vector)):
+            rows |= self._buckets[table].get(value, set())
+        if not rows:
+            return None
+        rows = np.fromiter(rows, dtype=np.intp)
+        similarities = self._vectors[rows] @ vector
+        best = int(np.argmax(similarities))
+        return int(rows[best]), float(similarities[best])
+
+    def least_recently_used(self):
+        """Returns (row, last use) of the entry used longest ago."""
+        row = min(range(len(self.entries)), key=lambda index: self.entries[index]["used"])
+        return row, self.entries[row]["used"]
+
+    def remove(self, row):
+        """Removes an entry by moving the last entry into its row."""
+        last = len(self.entries) - 1
+        if self._planes is not None:
+            self._unfile(row)
+            if row != last:
+                self._unfile(last)
+                self._hashes[row] = self._hashes[last]
+                for table, value in enumerate(self._hashes[row]):
+                    self._buckets[table].setdefault(value, set()).add(row)
+            self._hashes.pop()
+        self._vectors[row] = self._vectors[last]
+        self.entries[row] = self.entries[last]
+        self.entries.pop()
+
+    def _unfile(self, row):
+        for table, value in enumerate(self._hashes[row]):
+            bucket = self._buckets[table].get(value)
+            if bucket is not None:
+                bucket.discard(row)
+                if not bucket:
+                    del self._buckets[table][value]
+
+    def _hash(self, vector):
+        bits = (self._planes @ vector > 0).reshape(LSH_TABLES, LSH_BITS)
+        return (bits @ (1 << np.arange(LSH_BITS))).tolist()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class EmbeddingCache:
+    """
+    On-disk SQLite store of embedding vectors, keyed by a hash of the model and the text.
+
+    Vectors are stored as raw float32 bytes, so a text is embedded once per model however many times
+    it is indexed or searched for, across runs.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the store, creating it if the file does not exist.
+
+        Args:
+            path: Path of the SQLite database file.
+        """
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, model):
+        """Builds the key of a text's embedding."""
+        return hashlib.sha256(json.dumps([model, text]).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Looks up several vectors.
+
+        Args:
+            keys: Keys from make_key.
+
+        Returns:
+            A dict mapping each stored key to its vector. Keys that are not stored are left out.
+        """
+        unique = list(dict.fromkeys(keys))
+        vectors = {}
+        with self._lock:
+            # Stay under SQLite's limit on the number of parameters in one statement
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                                        chunk).fetchall()
+                vectors.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+            self.hits += len(vectors)
+            self.misses += len(unique) - len(vectors)
+        return vectors
+
+    def set_many(self, vectors):
+        """
+        Stores several vectors.
+
+        Args:
+            vectors: A dict mapping keys from make_key to vectors.
+        """
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                 [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()])
+            self._db.commit()
+
+    def clear(self):
+        """Removes every vector and resets the counters."""
+        with self._lock:
+            self._db.execute("DELETE FROM embeddings")
+            self._db.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dict with the hit and miss counts and the number of stored vectors."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class AudioCache:
+    """
+    On-disk, size-bounded LRU store for synthesized speech, addressed by a hash of its inputs.
+
+    Each clip is one file named after the SHA-256 of (text, voice, model, format). Files are read
+    through a memory map, and a file's modification time records its last use, so the LRU order
+    survives restarts and is shared by processes using the same directory.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_AUDIO_CACHE_BYTES):
+        """
+        Initializes the cache, indexing any clips already in the directory.
+
+        Args:
+            directory: The directory holding the audio files. Created if missing.
+            max_bytes: The maximum total size of the stored audio.
+        """
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = {}
+        self.hits = 0
+        self.misses = 0
+        for path in self._directory.glob("*.audio"):
+            stat = path.stat()
+            self._index[path.stem] = (stat.st_size, stat.st_mtime)
+
+    @staticmethod
+    def make_key(text, voice, model, response_format):
+        """Builds the content address of a clip."""
+        return hashlib.sha256(json.dumps([text, voice, model, response_format]).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns a clip's bytes, or None on a miss."""
+        chunks = self.iter_chunks(key)
+        return None if chunks is None else b"".join(chunks)
+
+    def iter_chunks(self, key, chunk_size=DEFAULT_AUDIO_CHUNK_SIZE):
+        """
+        Looks up a clip and returns an iterator over its bytes, read through a memory map.
+
+        Args:
+            key: A key from make_key.
+            chunk_size: The size in bytes of the yielded chunks.
+
+        Returns:
+            An iterator of byte chunks, or None on a miss.
+        """
+        path = self._path(key)
+        with self._lock:
+            # Map the clip under the lock, so a concurrent put that evicts it cannot delete it mid-read
+            mapped = self._map(path) if key in self._index else None
+            if mapped is None:
+                self._index.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            os.utime(path, (now, now))
+            self._index[key] = (self._index[key][0], now)
+        return self._read(mapped, chunk_size)
+
+    def put(self, key, data):
+        """Stores a clip, then evicts the least recently used clips while the store is over its size bound."""
+        if not data:
+            return
+        path = self._path(key)
+        _atomic_write(path, data)
+        with self._lock:
+            self._index[key] = (len(data), time.time())
+            total = sum(size for size, _ in self._index.values())
+            for old_key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if total <= self._max_bytes or old_key == key:
+                    break
+                self._path(old_key).unlink(missing_ok=True)
+                del self._index[old_key]
+                total -= size
+
+    def clear(self):
+        """Deletes every clip and resets the counters."""
+        with self._lock:
+            for key in self._index:
+                self._path(key).unlink(missing_ok=True)
+            self._index.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dict with the hit and miss counts, the number of clips and their total size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._index),
+                    "bytes": sum(size for size, _ in self._index.values())}
+
+    def _path(self, key):
+        return self._directory / f"{key}.audio"
+
+    @staticmethod
+    def _map(path):
+        # The map stays readable after the file is closed or deleted
+        try:
+            with open(path, "rb") as audio_file:
+                return mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _read(mapped, chunk_size):
+        with mapped:
+            for start in range(0, len(mapped), chunk_size):
+                yield mapped[start:start + chunk_size]
+
+
+class ImageStore:
+    """
+    Content-addressed local store for generated images, indexed by the request that produced them.
+
+    Each image is one file named after the SHA-256 of its bytes, so identical images are stored once.
+    An index.json file maps each (prompt, size, quality, model) request to its variants in order, each
+    recording its image's hash and file, so repeating a request reads the images from disk instead of
+    generating them again. Variants with identical bytes stay separate variants that share one file.
+    """
+
+    def __init__(self, directory):
+        """
+        Initializes the store, loading the index of any images already in the directory.
+
+        Args:
+            directory: The directory holding the images and the index. Created if missing.
+        """
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._index_path = self._directory / "index.json"
+        self._lock = threading.Lock()
+        self._index = json.loads(self._index_path.read_text()) if self._index_path.exists() else {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt, size, quality, model):
+        """Builds the key of an image request."""
+        return hashlib.sha256(json.dumps([prompt, size, quality, model]).encode("utf-8")).hexdigest()
+
+    def get(self, key, n=1):
+        """
+        Looks up the stored images of a request.
+
+        Args:
+            key: A key from make_key.
+            n: The number of variants wanted.
+
+        Returns:
+            A list of the paths of up to n stored variants. Missing variants count as misses.
+        """
+        with self._lock:
+            paths = [self._directory / variant["file"] for variant in self._index.get(key, [])]
+            paths = [path for path in paths if path.exists()][:n]
+            self.hits += len(paths)
+            self.misses += n - len(paths)
+        return paths
+
+    def put(self, key, data):
+        """Stores an image as a new variant of a request and returns its path."""
+        return self.put_stream(key, [data])
+
+    def put_stream(self, key, chunks):
+        """
+        Streams an image into the store as a new variant of a request, hashing it as it is written.
+
+        Args:
+            key: A key from make_key.
+            chunks: An iterable of the image's byte chunks, such as a download's iter_bytes().
+
+        Returns:
+            The path of the stored image.
+        """
+        writer = _ImageWriter(self, key)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.discard()
+            raise
+        return writer.commit()
+
+    def clear(self):
+        """Deletes every image and the index, and resets the counters."""
+        with self._lock:
+            for path in self._directory.iterdir():
+                if path.suffix[1:] in dict(IMAGE_SIGNATURES).values() or path == self._index_path:
+                    path.unlink(missing_ok=True)
+            self._index.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dict with the hit and miss counts, and the number of requests and distinct images stored."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "requests": len(self._index),
+                    "images": len({variant["sha256"] for variants in self._index.values() for variant in variants})}
+
+    def _add(self, key, digest, name):
+        with self._lock:
+            self._index.setdefault(key, []).append({"sha256": digest, "file": name})
+            _atomic_write(self._index_path, json.dumps(self._index))
+        return self._directory / name
+
+
+class _ImageWriter:
+    """Writes one image into an ImageStore chunk by chunk, naming it after its hash once complete."""
+
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+        self._hash = hashlib.sha256()
+        self._header = b""
+        self._temporary_path = store._directory / f"{key}.{threading.get_ident()}.{id(self)}.tmp"
+        self._file = open(self._temporary_path, "wb")
+
+    def write(self, chunk):
+        if len(self._header) < 8:
+            self._header += chunk[:8]
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        extension = next((extension for signature, extension in IMAGE_SIGNATURES
+                          if self._header.startswith(signature)), "png")
+        digest = self._hash.hexdigest()
+        name = f"{digest}.{extension}"
+        os.replace(self._temporary_path, self._store._directory / name)
+        return self._store._add(self._key, digest, name)
+
+    def discard(self):
+        self._file.close()
+        self._temporary_path.unlink(missing_ok=True)
+
+
+class FileMetadataCache:
+    """
+    Cache of uploaded files' metadata, used to name the files an assistant cites.
+
+    File metadata never changes after upload, so entries are kept until cleared. With a path, the
+    cache is loaded from and saved to a JSON file, so the names are not retrieved again on every run.
+    """
+
+    def __init__(self, path=None):
+        """
+        Initializes the cache.
+
+        Args:
+            path: Path of the JSON file to keep the metadata in, or None for a memory-only cache.
+        """
+        self._path = Path(path) if path is not None else None
+        self._files = json.loads(self._path.read_text()) if self._path is not None and self._path.exists() else {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, file_ids):
+        """
+        Looks up several files.
+
+        Args:
+            file_ids: The file IDs.
+
+        Returns:
+            A dict mapping each cached file ID to its metadata. IDs that are not cached are left out.
+        """
+        with self._lock:
+            files = {file_id: self._files[file_id] for file_id in file_ids if file_id in self._files}
+            self.hits += len(files)
+            self.misses += len(set(file_ids)) - len(files)
+        return files
+
+    def set_many(self, files):
+        """
+        Stores the metadata of several files.
+
+        Args:
+            files: A dict mapping file IDs to dicts with the file's 'filename', 'bytes', 'purpose' and 'created_at'.
+        """
+        if not files:
+            return
+        with self._lock:
+            self._files.update(files)
+            if self._path is not None:
+                _atomic_write(self._path, json.dumps(self._files))
+
+    def clear(self):
+        """Removes every entry from memory and disk and resets the counters."""
+        with self._lock:
+            self._files.clear()
+            if self._path is not None and self._path.exists():
+                self._path.unlink()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dict with the hit and miss counts and the number of cached files."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._files)}
+
+
+# Shared by every conversation that has no cache of its own, since file IDs are unique across accounts
+_file_cache = FileMetadataCache()
+
+
+def _atomic_write(path, data):
+    """
+    Writes text or bytes to a file through a temporary file, so a crash never leaves it half-written.
+
+    The temporary file is named after the writing thread, so concurrent writers never share one.
+    """
+    path = Path(path)
+    temporary_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    if isinstance(data, str):
+        temporary_path.write_text(data, encoding="utf-8")
+    else:
+        temporary_path.write_bytes(data)
+    os.replace(temporary_path, path)
@@ -0,0 +1,131 @@
+# clients.py
+# Connection pool settings and the OpenAI clients shared by conversations.
+
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+from .constants import (DEFAULT_KEEPALIVE_EXPIRY, DEFAULT_MAX_CONNECTIONS, DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                        DEFAULT_REQUEST_TIMEOUT)
+from .scheduling import RequestScheduler, _AsyncSchedulingTransport, _SchedulingTransport
+
+
+_pool_settings = {"max_connections": DEFAULT_MAX_CONNECTIONS,
+                  "max_keepalive_connections": DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                  "keepalive_expiry": DEFAULT_KEEPALIVE_EXPIRY, "http2": False}
+_shared_clients = {}
+_shared_async_clients = weakref.WeakKeyDictionary()
+_shared_clients_lock = threading.Lock()
+_request_scheduler = RequestScheduler()
+
+
+def configure_client_pool(max_connections=DEFAULT_MAX_CONNECTIONS,
+                          max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                          keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY, http2=False):
+    """
+    Sets the connection pool used by shared clients created from now on.
+
+    Args:
+        max_connections: The maximum number of open connections per client.
+        max_keepalive_connections: The maximum number of idle connections kept open for reuse.
+        keepalive_expiry: Seconds an idle connection is kept open.
+        http2: Whether to use HTTP/2. Requires the h2 package (pip install httpx[http2]).
+    """
+    with _shared_clients_lock:
+        _pool_settings.update(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                              keepalive_expiry=keepalive_expiry, http2=http2)
+
+
+def set_request_scheduler(scheduler):
+    """
+    Sets the RequestScheduler used by clients created from now on.
+
+    Args:
+        scheduler: The scheduler that paces and retries requests.
+    """
+    global _request_scheduler
+    _request_scheduler = scheduler
+
+
+def get_request_scheduler():
+    """Returns the RequestScheduler used by new clients."""
+    return _request_scheduler
+
+
+def _pool_options():
+    """Returns the httpx transport options for the configured connection pool."""
+    limits = httpx.Limits(max_connections=_pool_settings["max_connections"],
+                          max_keepalive_connections=_pool_settings["max_keepalive_connections"],
+                          keepalive_expiry=_pool_settings["keepalive_expiry"])
+    return {"limits": limits, "http2": _pool_settings["http2"]}
+
+
+def _new_client(api_key, base_url=None):
+    """Creates an OpenAI client whose requests go through the request scheduler."""
+    # The scheduler does the retrying, so the SDK's own retries are turned off
+    http_client = DefaultHttpxClient(transport=_SchedulingTransport(_request_scheduler, **_pool_options()))
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0,
+                  timeout=DEFAULT_REQUEST_TIMEOUT)
+
+
+def _new_async_client(api_key, base_url=None):
+    """Creates an AsyncOpenAI client whose requests go through the request scheduler."""
+    http_client = DefaultAsyncHttpxClient(transport=_AsyncSchedulingTransport(_request_scheduler, **_pool_options()))
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0,
+                       timeout=DEFAULT_REQUEST_TIMEOUT)
+
+
+def get_shared_client(api_key, base_url=None):
+    """
+    Returns the process-wide OpenAI client for an API key and base URL, creating it on first use.
+
+    Sharing one client keeps its connections alive across conversations, so later requests
+    skip the TCP and TLS handshakes.
+
+    Args:
+        api_key: The API key for OpenAI.
+        base_url: The API base URL, or None for the OPENAI_BASE_URL environment variable or the default.
+
+    Returns:
+        An OpenAI client.
+    """
+    key = (api_key, base_url or os.environ.get("OPENAI_BASE_URL"))
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            _shared_clients[key] = _new_client(api_key, key[1])
+        return _shared_clients[key]
+
+
+def get_shared_async_client(api_key, base_url=None):
+    """
+    Returns the AsyncOpenAI client shared within the running event loop for an API key and base URL.
+
+    Async connections belong to the event loop that opened them, so each loop gets its own client.
+    Must be called from a coroutine.
+
+    Args:
+        api_key: The API key for OpenAI.
+        base_url: The API base URL, or None for the OPENAI_BASE_URL environment variable or the default.
+
+    Returns:
+        An AsyncOpenAI client.
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url or os.environ.get("OPENAI_BASE_URL"))
+    with _shared_clients_lock:
+        clients = _shared_async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = _new_async_client(api_key, key[1])
+        return clients[key]
+
+
+def close_shared_clients():
+    """Closes the shared synchronous clients and forgets all shared clients."""
+    with _shared_clients_lock:
+        for client in _shared_clients.values():
+            client.close()
+        _shared_clients.clear()
+        _shared_async_clients.clear()
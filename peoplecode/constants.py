@@ -0,0 +1,65 @@
+# constants.py
+# Default settings and limits shared by the PeopleCodeOpenAI modules.
+
+import re
+import httpx
+
+DEFAULT_MODEL = "gpt-4"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_THREAD_TTL = 3600
+MESSAGE_TOKEN_OVERHEAD = 4
+SUMMARY_MAX_WORDS = 150
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_POLL_INTERVAL = 60
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 60
+DEFAULT_REQUEST_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+OTEL_ATTRIBUTES = (("gen_ai.request.model", "model"), ("gen_ai.usage.input_tokens", "prompt_tokens"),
+                   ("gen_ai.usage.output_tokens", "completion_tokens"), ("http.response.status_code", "status"),
+                   ("error.type", "error"), ("peoplecode.time_to_first_token", "time_to_first_token"),
+                   ("peoplecode.retries", "retries"), ("peoplecode.cache_hit", "cache_hit"))
+# Marks the first generated text in a chat completion or assistant run event stream
+FIRST_TOKEN_PATTERN = re.compile(rb'"content":\s*"[^"]|event: thread\.message\.delta')
+USAGE_PATTERN = re.compile(rb'"usage":\s*')
+DEFAULT_VOICE = "alloy"
+DEFAULT_TTS_MODEL = "tts-1"
+DEFAULT_AUDIO_CHUNK_SIZE = 16384
+DEFAULT_TTS_CONCURRENCY = 4
+DEFAULT_VOICE_METRICS_TURNS = 100
+DEFAULT_AUDIO_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_IMAGE_MODEL = "dall-e-3"
+DEFAULT_IMAGE_SIZE = "1024x1024"
+DEFAULT_IMAGE_QUALITY = "standard"
+DEFAULT_IMAGE_CONCURRENCY = 4
+IMAGE_OUTPUTS = ("url", "bytes", "path")
+IMAGE_SIGNATURES = ((b"\x89PNG", "png"), (b"\xff\xd8\xff", "jpg"), (b"GIF8", "gif"))
+DEFAULT_CHUNK_SECONDS = 60
+DEFAULT_CHUNK_OVERLAP_SECONDS = 2
+SILENCE_WINDOW_SECONDS = 0.1
+SILENCE_SEARCH_SECONDS = 10
+STITCH_MAX_OVERLAP_WORDS = 30
+AUDIO_SIGNATURES = ((b"RIFF", "wav"), (b"ID3", "mp3"), (b"\xff\xfb", "mp3"), (b"\xff\xf3", "mp3"),
+                    (b"OggS", "ogg"), (b"fLaC", "flac"), (b"\x1a\x45\xdf\xa3", "webm"))
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+EMBEDDING_MAX_INPUTS = 2048
+EMBEDDING_MAX_BATCH_TOKENS = 300000
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+DEFAULT_RAG_CHUNK_WORDS = 300
+DEFAULT_RAG_OVERLAP_WORDS = 50
+DEFAULT_RAG_TOP_K = 4
+LSH_TABLES = 8
+LSH_BITS = 8
+STRUCTURED_MAX_ITEMS = 100
+# Models known to reject json_schema response formats, so they are never probed with one
+STRUCTURED_UNSUPPORTED_MODELS = ("gpt-3.5-turbo", "gpt-4", "gpt-4-turbo")
+FOLLOWUPS_MARKER = "FOLLOW-UP QUESTIONS"
+LIST_MARKER = re.compile(r'^\s*(?:[-*\u2022]|\(?\d+[.):]|[A-Za-z][.)])\s+')
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+|\n+')
+BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
@@ -0,0 +1,90 @@
+# history.py
+# Conversation history kept under a token budget.
+
+from .constants import DEFAULT_MODEL, MESSAGE_TOKEN_OVERHEAD
+from .tokens import count_tokens
+
+
+class ConversationHistory:
+    """
+    Conversation history that keeps a running token count and stays under a token budget.
+
+    Each message is tokenized once, when it is appended. When the budget is exceeded the oldest
+    messages are dropped; they are kept aside for summarization if summarize is enabled.
+    """
+
+    def __init__(self, max_tokens=None, summarize=False, model=DEFAULT_MODEL):
+        """
+        Initializes the history.
+
+        Args:
+            max_tokens: The token budget for the history, or None for no limit.
+            summarize: Whether dropped messages are kept so they can be summarized.
+            model: The model whose tokenizer is used for counting.
+        """
+        if max_tokens is not None and max_tokens < 1:
+            raise ValueError("Token budget must be at least 1.")
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.model = model
+        self.messages = []
+        self.summary = None
+        self._message_tokens = []
+        self._summary_tokens = 0
+        self._total_tokens = 0
+        self._dropped = []
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    @property
+    def total_tokens(self):
+        """The tokens in the kept messages and the summary."""
+        return self._total_tokens + self._summary_tokens
+
+    def append(self, message):
+        """Adds a message, then drops the oldest messages while the history is over budget."""
+        tokens = count_tokens(message["content"], self.model) + MESSAGE_TOKEN_OVERHEAD
+        self.messages.append(message)
+        self._message_tokens.append(tokens)
+        self._total_tokens += tokens
+        self._trim()
+
+    def set_summary(self, summary):
+        """Replaces the summary of the dropped messages."""
+        self.summary = summary
+        self._summary_tokens = count_tokens(summary, self.model) + MESSAGE_TOKEN_OVERHEAD if summary else 0
+        self._trim()
+
+    def take_dropped(self):
+        """Returns the messages dropped since the last call, oldest first, and forgets them."""
+        dropped, self._dropped = self._dropped, []
+        return dropped
+
+    def for_request(self):
+        """Returns the messages to send to the model, starting with the summary if there is one."""
+        if not self.summary:
+            return list(self.messages)
+        return [{"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}] + self.messages
+
+    def clear(self):
+        """Removes all messages and the summary."""
+        self.messages.clear()
+        self._message_tokens.clear()
+        self._total_tokens = 0
+        self._dropped = []
+        self.set_summary(None)
+
+    def _trim(self):
+        # The newest message is always kept, even if it alone exceeds the budget
+        while self.max_tokens is not None and self.total_tokens > self.max_tokens and len(self.messages) > 1:
+            message = self.messages.pop(0)
+            self._total_tokens -= self._message_tokens.pop(0)
+            if self.summarize:
+                self._dropped.append(message)
@@ -0,0 +1,191 @@
+# retrieval.py
+# Local document index that grounds answers in passages of the user's documents.
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+import numpy as np
+
+from .constants import DEFAULT_RAG_CHUNK_WORDS, DEFAULT_RAG_OVERLAP_WORDS, DEFAULT_RAG_TOP_K
+from .caches import _atomic_write
+
+
+class DocumentIndex:
+    """
+    Local vector index of document passages, searched to ground answers in the documents.
+
+    Documents are split into overlapping passages whose unit-length embeddings are appended to a
+    raw float32 file. The file is memory-mapped for search, so opening an index does not read the
+    vectors into memory. Passage texts and sources are kept in a JSON metadata file. A search scores
+    every passage with one matrix-vector product and returns the top k.
+
+    Removing passages writes the remaining vectors to a file of the next generation, which the
+    metadata names. The metadata is saved last, so a crash between the two writes leaves the
+    previous file and metadata in place.
+    """
+
+    def __init__(self, directory, chunk_words=DEFAULT_RAG_CHUNK_WORDS, overlap_words=DEFAULT_RAG_OVERLAP_WORDS):
+        """
+        Opens the index in a directory, creating an empty one if the directory has none.
+
+        Args:
+            directory: The directory holding the vectors file and metadata.json. Created if missing.
+            chunk_words: The maximum number of words per passage.
+            overlap_words: The number of words each passage repeats from the end of the previous one.
+        """
+        if chunk_words < 1 or not 0 <= overlap_words < chunk_words:
+            raise ValueError("chunk_words must be positive and overlap_words must be between 0 and chunk_words - 1.")
+        self._chunk_words = chunk_words
+        self._overlap_words = overlap_words
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._metadata_path = self._directory / "metadata.json"
+        self._lock = threading.Lock()
+        if self._metadata_path.exists():
+            self._metadata = json.loads(self._metadata_path.read_text())
+        else:
+            self._metadata = {"embedding_model": None, "dimensions": None, "sources": {}, "passages": [],
+                              "generation": 0}
+        # Drop vectors files of generations whose metadata was never saved
+        for path in self._directory.glob("vectors*.f32"):
+            if path != self._vectors_path():
+                path.unlink(missing_ok=True)
+        self._vectors = None
+        self._map()
+
+    def __len__(self):
+        return len(self._metadata["passages"])
+
+    @property
+    def embedding_model(self):
+        """The model the passages were embedded with, or None if the index is empty."""
+        return self._metadata["embedding_model"]
+
+    def is_current(self, source, digest):
+        """Returns whether a document is indexed with the given content hash."""
+        with self._lock:
+            return self._metadata["sources"].get(source) == digest
+
+    def split(self, text):
+        """Splits a document's text into the passages this index stores."""
+        return _split_passages(text, self._chunk_words, self._overlap_words)
+
+    def add(self, source, digest, passages, vectors, embedding_model):
+        """
+        Stores a document's passages and embeddings, replacing any earlier version of the document.
+
+        Args:
+            source: The document's name, such as its path.
+            digest: The hash of the document's content.
+            passages: The passage texts.
+            vectors: The passages' embeddings, one row per passage.
+            embedding_model: The model the embeddings come from.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(passages), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        with self._lock:
+            metadata = self._metadata
+            if metadata["embedding_model"] not in (None, embedding_model) or \
+                    metadata["dimensions"] not in (None, vectors.shape[1]):
+                raise ValueError(f"The index holds {metadata['embedding_model']} embeddings.")
+            retired = None
+            try:
+                if source in metadata["sources"]:
+                    retired = self._remove(source)
+                metadata["embedding_model"], metadata["dimensions"] = embedding_model, vectors.shape[1]
+                # The file cannot be resized while it is mapped on Windows
+                self._vectors = None
+                with open(self._vectors_path(), "ab") as vectors_file:
+                    # Drop rows left behind by a write that did not reach the metadata
+                    vectors_file.truncate(len(metadata["passages"]) * metadata["dimensions"] * 4)
+                    vectors_file.write(np.ascontiguousarray(vectors).tobytes())
+                metadata["passages"].extend({"source": source, "text": text} for text in passages)
+                metadata["sources"][source] = digest
+                self._save()
+                if retired is not None:
+                    retired.unlink(missing_ok=True)
+            finally:
+                self._map()
+
+    def remove(self, source):
+        """Removes a document's passages from the index."""
+        with self._lock:
+            if source in self._metadata["sources"]:
+                try:
+                    retired = self._remove(source)
+                    self._save()
+                    retired.unlink(missing_ok=True)
+                finally:
+                    self._map()
+
+    def search(self, vector, top_k=DEFAULT_RAG_TOP_K):
+        """
+        Finds the passages most similar to a query embedding.
+
+        Args:
+            vector: The query's embedding.
+            top_k: The number of passages to return.
+
+        Returns:
+            A list of up to top_k dicts with the passage 'text', its 'source' and its cosine 'score', best first.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        # Score under the lock, so the map is never read while add or remove replaces the file under it
+        with self._lock:
+            if self._vectors is None or top_k < 1:
+                return []
+            scores = self._vectors @ query
+            passages = self._metadata["passages"]
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{"text": passages[row]["text"], "source": passages[row]["source"], "score": float(scores[row])}
+                for row in top]
+
+    def _remove(self, source):
+        """Writes the vectors without a source's passages to the next generation's file and returns the retired file."""
+        keep = [row for row, passage in enumerate(self._metadata["passages"]) if passage["source"] != source]
+        remaining = np.array(self._vectors[keep]) if self._vectors is not None else np.empty((0, 0), np.float32)
+        # Release the map, so the retired file can be deleted on Windows once the metadata is saved
+        self._vectors = None
+        retired = self._vectors_path()
+        self._metadata["generation"] = self._metadata.get("generation", 0) + 1
+        _atomic_write(self._vectors_path(), remaining.tobytes())
+        self._metadata["passages"] = [self._metadata["passages"][row] for row in keep]
+        del self._metadata["sources"][source]
+        return retired
+
+    def _save(self):
+        _atomic_write(self._metadata_path, json.dumps(self._metadata))
+
+    def _vectors_path(self):
+        # Indexes written before generations were recorded keep their vectors in vectors.f32
+        generation = self._metadata.get("generation", 0)
+        return self._directory / (f"vectors.{generation}.f32" if generation else "vectors.f32")
+
+    def _map(self):
+        count, dimensions = len(self._metadata["passages"]), self._metadata["dimensions"]
+        self._vectors = None
+        if count:
+            self._vectors = np.memmap(self._vectors_path(), dtype=np.float32, mode="r", shape=(count, dimensions))
+
+
+def _split_passages(text, chunk_words, overlap_words):
+    """Splits text into passages of up to chunk_words words, each repeating the last overlap_words of the previous one."""
+    words = text.split()
+    return [" ".join(words[start:start + chunk_words])
+            for start in range(0, max(len(words) - overlap_words, 1), chunk_words - overlap_words)
+            if words[start:start + chunk_words]]
+
+
+def _read_documents(documents):
+    """Returns (source, text, digest) for documents given as file paths or (source, text) tuples."""
+    for document in documents:
+        if isinstance(document, tuple):
+            source, text = document
+        else:
+            source, text = str(document), Path(document).read_text(encoding="utf-8")
+        yield source, text, hashlib.sha256(text.encode("utf-8")).hexdigest()
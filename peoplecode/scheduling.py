@@ -0,0 +1,223 @@
+# scheduling.py
+# Client-side rate limiting and retries, applied to every API request by an httpx transport.
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+import httpx
+
+from . import telemetry
+from .constants import DEFAULT_BACKOFF_BASE, DEFAULT_BACKOFF_MAX, DEFAULT_MAX_RETRIES, RETRY_STATUS_CODES
+from .telemetry import _AsyncRecordingStream, _CallRecorder, _RecordingStream
+
+
+class RequestScheduler:
+    """
+    Paces API requests per model and retries failed ones with jittered exponential backoff.
+
+    Budgets come from the x-ratelimit-* headers of earlier responses and, optionally, from
+    requests- and tokens-per-minute limits set per model. A request that would exceed a budget
+    waits until the budget resets instead of being sent and rejected with a 429.
+    """
+
+    def __init__(self, limits=None, max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_max=DEFAULT_BACKOFF_MAX):
+        """
+        Initializes the scheduler.
+
+        Args:
+            limits: Optional dict mapping a model name to a (requests_per_minute, tokens_per_minute) tuple.
+                    Either value may be None.
+            max_retries: How often a request is retried after a 429, a 5xx or a connection error.
+            backoff_base: Seconds of the first backoff; each retry doubles it.
+            backoff_max: The longest backoff in seconds.
+        """
+        self.limits = dict(limits or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def delay(self, model, tokens):
+        """
+        Reserves budget for a request if it is available now.
+
+        Args:
+            model: The request's model, or None for requests without one.
+            tokens: The estimated tokens of the request.
+
+        Returns:
+            0 if the request may be sent now, otherwise the seconds to wait before asking again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(model)
+            window = state["window"]
+            while window and now - window[0][0] >= 60:
+                window.popleft()
+            wait = 0.0
+            if state["requests_remaining"] is not None and state["requests_remaining"] < 1:
+                wait = max(wait, state["requests_reset_at"] - now)
+            if state["tokens_remaining"] is not None and state["tokens_remaining"] < tokens:
+                wait = max(wait, state["tokens_reset_at"] - now)
+            requests_per_minute, tokens_per_minute = self.limits.get(model, (None, None))
+            if requests_per_minute is not None and len(window) >= requests_per_minute:
+                wait = max(wait, window[-requests_per_minute][0] + 60 - now)
+            if tokens_per_minute is not None:
+                used = sum(entry[1] for entry in window)
+                for sent_at, sent_tokens in window:
+                    if used + tokens <= tokens_per_minute:
+                        break
+                    used -= sent_tokens
+                    wait = max(wait, sent_at + 60 - now)
+            if wait > 0:
+                return wait
+            window.append((now, tokens))
+            if state["requests_remaining"] is not None:
+                state["requests_remaining"] -= 1
+            if state["tokens_remaining"] is not None:
+                state["tokens_remaining"] -= tokens
+            return 0
+
+    def update(self, model, headers):
+        """Updates a model's budget from the x-ratelimit-* headers of a response."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(model)
+            for kind in ("requests", "tokens"):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is not None and remaining.isdigit():
+                    state[f"{kind}_remaining"] = int(remaining)
+                    state[f"{kind}_reset_at"] = now + _parse_duration(headers.get(f"x-ratelimit-reset-{kind}", "0s"))
+
+    def backoff(self, attempt, headers=None):
+        """
+        Returns the seconds to wait before retrying.
+
+        Honors the server's retry-after headers when present and otherwise uses full-jitter
+        exponential backoff, so many clients retrying at once do not stay in step.
+
+        Args:
+            attempt: The number of the retry, starting at 0.
+            headers: The headers of the failed response, if there was one.
+        """
+        if headers is not None:
+            if headers.get("retry-after-ms", "").replace(".", "", 1).isdigit():
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after", "").replace(".", "", 1).isdigit():
+                return float(headers["retry-after"])
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _state(self, model):
+        if model not in self._models:
+            self._models[model] = {"requests_remaining": None, "requests_reset_at": 0.0,
+                                   "tokens_remaining": None, "tokens_reset_at": 0.0, "window": deque()}
+        return self._models[model]
+
+
+def _parse_duration(text):
+    """Parses a rate-limit reset duration such as '6m0s', '1.5s' or '20ms' into seconds."""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(value) * units[unit] for value, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", text))
+
+
+def _request_budget(request):
+    """Returns the (model, estimated tokens) of an API request, estimating four characters per token."""
+    if request.headers.get("content-type", "").startswith("application/json") and request.content:
+        try:
+            body = json.loads(request.content)
+        except ValueError:
+            return None, 0
+        if isinstance(body, dict):
+            prompt = json.dumps(body.get("messages") or body.get("input") or "")
+            return body.get("model"), len(prompt) // 4 + (body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+    return None, 0
+
+
+class _SchedulingTransport(httpx.BaseTransport):
+    """httpx transport that sends every request through a RequestScheduler."""
+
+    def __init__(self, scheduler, **transport_options):
+        self._scheduler = scheduler
+        self._transport = httpx.HTTPTransport(**transport_options)
+
+    def handle_request(self, request):
+        model, tokens = _request_budget(request)
+        started = time.perf_counter() if telemetry._telemetry_sinks else None
+        attempt = 0
+        while True:
+            wait = self._scheduler.delay(model, tokens)
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                if attempt >= self._scheduler.max_retries:
+                    if started is not None:
+                        _CallRecorder(request, model, started, attempt).fail(e)
+                    raise
+                time.sleep(self._scheduler.backoff(attempt))
+                attempt += 1
+                continue
+            self._scheduler.update(model, response.headers)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self._scheduler.max_retries:
+                if started is not None:
+                    recorder = _CallRecorder(request, model, started, attempt)
+                    recorder.watch(response)
+                    response.stream = _RecordingStream(response.stream, recorder)
+                return response
+            response.read()
+            response.close()
+            time.sleep(self._scheduler.backoff(attempt, response.headers))
+            attempt += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class _AsyncSchedulingTransport(httpx.AsyncBaseTransport):
+    """Async httpx transport that sends every request through a RequestScheduler."""
+
+    def __init__(self, scheduler, **transport_options):
+        self._scheduler = scheduler
+        self._transport = httpx.AsyncHTTPTransport(**transport_options)
+
+    async def handle_async_request(self, request):
+        model, tokens = _request_budget(request)
+        started = time.perf_counter() if telemetry._telemetry_sinks else None
+        attempt = 0
+        while True:
+            wait = self._scheduler.delay(model, tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt >= self._scheduler.max_retries:
+                    if started is not None:
+                        _CallRecorder(request, model, started, attempt).fail(e)
+                    raise
+                await asyncio.sleep(self._scheduler.backoff(attempt))
+                attempt += 1
+                continue
+            self._scheduler.update(model, response.headers)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self._scheduler.max_retries:
+                if started is not None:
+                    recorder = _CallRecorder(request, model, started, attempt)
+                    recorder.watch(response)
+                    response.stream = _AsyncRecordingStream(response.stream, recorder)
+                return response
+            await response.aread()
+            await response.aclose()
+            await asyncio.sleep(self._scheduler.backoff(attempt, response.headers))
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,305 @@
+# telemetry.py
+# Per-call telemetry: the sinks that receive call records and the wrappers that time and parse API calls.
+
+import bisect
+import json
+import re
+import threading
+import time
+import httpx
+
+from .constants import DEFAULT_LATENCY_BUCKETS, FIRST_TOKEN_PATTERN, OTEL_ATTRIBUTES, USAGE_PATTERN
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+
+_telemetry_sinks = []
+_telemetry_lock = threading.Lock()
+
+
+class TelemetryHistograms:
+    """
+    In-memory telemetry sink with latency histograms and call, token and retry counters.
+
+    Calls are grouped by operation and model. Latencies are counted in fixed buckets, so recording
+    a call takes constant time and memory stays the same however many calls are made.
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        """
+        Initializes the sink.
+
+        Args:
+            buckets: The upper bounds in seconds of the latency buckets. Longer calls go in an overflow bucket.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        """Adds a call record to the histograms and counters."""
+        with self._lock:
+            key = (call["operation"], call["model"])
+            if key not in self._series:
+                self._series[key] = {"calls": 0, "errors": 0, "retries": 0, "cache_hits": 0, "prompt_tokens": 0,
+                                     "completion_tokens": 0, "wall_time": [0] * (len(self.buckets) + 1),
+                                     "time_to_first_token": [0] * (len(self.buckets) + 1)}
+            series = self._series[key]
+            series["calls"] += 1
+            series["errors"] += call["error"] is not None
+            series["cache_hits"] += call["cache_hit"]
+            for counter in ("retries", "prompt_tokens", "completion_tokens"):
+                series[counter] += call[counter] or 0
+            for metric in ("wall_time", "time_to_first_token"):
+                if call[metric] is not None:
+                    series[metric][bisect.bisect_left(self.buckets, call[metric])] += 1
+
+    def stats(self):
+        """Returns a dict mapping each (operation, model) to its counters and the bucket counts of its latencies."""
+        with self._lock:
+            return {key: {name: list(value) if isinstance(value, list) else value for name, value in series.items()}
+                    for key, series in self._series.items()}
+
+    def percentile(self, metric, q, operation=None, model=None):
+        """
+        Estimates a latency percentile as the upper bound of the bucket it falls in.
+
+        Args:
+            metric: 'wall_time' or 'time_to_first_token'.
+            q: The percentile, from 0 to 100.
+            operation: Only count calls of this operation, default is every operation.
+            model: Only count calls to this model, default is every model.
+
+        Returns:
+            The estimate in seconds, infinity if it falls in the overflow bucket, or None without data.
+        """
+        with self._lock:
+            counts = [sum(column) for column in zip(*(series[metric] for (name, series_model), series in self._series.items()
+                                                      if operation in (None, name) and model in (None, series_model)))]
+        total = sum(counts)
+        if not total:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= total * q / 100:
+                return bound
+
+    def clear(self):
+        """Removes every recorded call."""
+        with self._lock:
+            self._series.clear()
+
+
+class JsonlTelemetrySink:
+    """Telemetry sink that appends each call record to a file as one line of JSON."""
+
+    def __init__(self, path):
+        """
+        Opens the file for appending, creating it if it does not exist.
+
+        Args:
+            path: Path of the JSONL file.
+        """
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        """Writes a call record as a line of JSON."""
+        line = json.dumps(call) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        """Closes the file."""
+        with self._lock:
+            self._file.close()
+
+
+class OpenTelemetrySink:
+    """
+    Telemetry sink that exports each call as an OpenTelemetry span.
+
+    Spans are named after the operation and carry the call's timing, and attributes named after
+    the OpenTelemetry GenAI conventions where one exists. Exporting them is left to the tracer
+    provider the app configures.
+    """
+
+    def __init__(self, tracer=None):
+        """
+        Initializes the sink.
+
+        Args:
+            tracer: The tracer that creates the spans, default is this module's tracer from the
+                    global tracer provider, which needs the opentelemetry-api package.
+        """
+        if tracer is None:
+            if otel_trace is None:
+                raise ImportError("OpenTelemetrySink needs the opentelemetry-api package or a tracer.")
+            tracer = otel_trace.get_tracer(__name__)
+        self._tracer = tracer
+
+    def record(self, call):
+        """Creates and ends a span covering the call."""
+        start = int(call["started_at"] * 1e9)
+        attributes = {name: call[key] for name, key in OTEL_ATTRIBUTES if call[key] is not None}
+        span = self._tracer.start_span(call["operation"], start_time=start, attributes=attributes)
+        span.end(end_time=start + int((call["wall_time"] or 0) * 1e9))
+
+
+def add_telemetry_sink(sink):
+    """
+    Starts sending a record of every API call and cache hit to a sink.
+
+    A record is a dict with the call's 'operation' (such as 'POST /v1/chat/completions', or the
+    cache's name for a cache hit), 'model', 'started_at' (epoch seconds), 'wall_time' and
+    'time_to_first_token' (seconds), 'prompt_tokens', 'completion_tokens', HTTP 'status', 'retries',
+    'cache_hit' and 'error'. Values that do not apply or are unknown are None. Streamed calls are
+    recorded when their stream is closed.
+
+    While no sink is set, calls are neither timed nor parsed: each one costs a single check of the
+    empty sink list.
+
+    Args:
+        sink: An object with a record(call) method, such as TelemetryHistograms, JsonlTelemetrySink
+              or OpenTelemetrySink.
+    """
+    global _telemetry_sinks
+    with _telemetry_lock:
+        # Replace the list rather than changing it, so requests read it without taking the lock
+        _telemetry_sinks = _telemetry_sinks + [sink]
+
+
+def remove_telemetry_sink(sink):
+    """Stops sending records to a sink added with add_telemetry_sink."""
+    global _telemetry_sinks
+    with _telemetry_lock:
+        _telemetry_sinks = [other for other in _telemetry_sinks if other is not sink]
+
+
+def _emit_call(call):
+    """Sends a call record to every telemetry sink."""
+    for sink in _telemetry_sinks:
+        try:
+            sink.record(call)
+        except Exception as e:
+            print(f"Error recording telemetry: {e}")
+
+
+def _call_record(operation, model, started_at, cache_hit=False):
+    return {"operation": operation, "model": model, "started_at": started_at, "wall_time": None,
+            "time_to_first_token": None, "prompt_tokens": None, "completion_tokens": None, "status": None,
+            "retries": None, "cache_hit": cache_hit, "error": None}
+
+
+def _record_cache_hit(cache, model, hit=True):
+    """Sends a record of a request answered from a cache, or of a cache miss if hit is False, to the telemetry sinks."""
+    call = _call_record(cache, model, time.time(), cache_hit=hit)
+    call["wall_time"] = 0.0
+    _emit_call(call)
+
+
+def _operation_name(request):
+    """Returns the method and path of a request, with the IDs in the path replaced by {id}."""
+    segments = ["{id}" if re.search(r"\d", segment) and not re.fullmatch(r"v\d+", segment) else segment
+                for segment in request.url.path.split("/")]
+    return f"{request.method} {'/'.join(segments)}"
+
+
+def _parse_usage(body):
+    """Returns the (prompt, completion) tokens of the last usage object in a response body, or (None, None)."""
+    for match in reversed(list(USAGE_PATTERN.finditer(body))):
+        try:
+            usage, _ = json.JSONDecoder().raw_decode(body[match.end():].decode("utf-8", "replace"))
+        except ValueError:
+            continue
+        if isinstance(usage, dict):
+            return usage.get("prompt_tokens", usage.get("input_tokens")), \
+                usage.get("completion_tokens", usage.get("output_tokens"))
+    return None, None
+
+
+class _CallRecorder:
+    """Watches a response body as it is read and sends the call's record to the telemetry sinks when it is closed."""
+
+    def __init__(self, request, model, started, retries):
+        self._started = started
+        self.call = _call_record(_operation_name(request), model, time.time() - (time.perf_counter() - started))
+        self.call["retries"] = retries
+        self._streamed = False
+        self._body = None
+
+    def fail(self, error):
+        self.call["error"] = type(error).__name__
+        self.finish()
+
+    def watch(self, response):
+        """Records a response's status and starts collecting its body if it is JSON or an event stream."""
+        self.call["status"] = response.status_code
+        if response.status_code >= 400:
+            self.call["error"] = f"HTTP {response.status_code}"
+        content_type = response.headers.get("content-type", "")
+        self._streamed = content_type.startswith("text/event-stream")
+        if self._streamed or content_type.startswith("application/json"):
+            self._body = []
+
+    def observe(self, chunk):
+        if self._streamed and self.call["time_to_first_token"] is None and FIRST_TOKEN_PATTERN.search(chunk):
+            self.call["time_to_first_token"] = time.perf_counter() - self._started
+        if self._body is not None:
+            self._body.append(chunk)
+
+    def finish(self):
+        if self.call["wall_time"] is not None:
+            return
+        self.call["wall_time"] = time.perf_counter() - self._started
+        if self._body:
+            self.call["prompt_tokens"], self.call["completion_tokens"] = _parse_usage(b"".join(self._body))
+        _emit_call(self.call)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Response body stream that passes every chunk to a _CallRecorder."""
+
+    def __init__(self, stream, recorder):
+        self._stream = stream
+        self._recorder = recorder
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._recorder.observe(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._recorder.finish()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    """Async response body stream that passes every chunk to a _CallRecorder."""
+
+    def __init__(self, stream, recorder):
+        self._stream = stream
+        self._recorder = recorder
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._recorder.observe(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._recorder.finish()
+
+
+_telemetry_sinks = []
+
+
+_telemetry_lock = threading.Lock()
@@ -0,0 +1,60 @@
+# tokens.py
+# Token counting with tiktoken, or an estimate when tiktoken is not installed.
+
+from .constants import DEFAULT_MODEL
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    """
+    Counts the tokens in a text.
+
+    Uses tiktoken when it is installed and otherwise estimates four characters per token.
+
+    Args:
+        text: The text to count.
+        model: The model whose tokenizer to use.
+
+    Returns:
+        The number of tokens.
+    """
+    if tiktoken is None:
+        return (len(text) + 3) // 4
+    return len(_encoding_for_model(model).encode(text))
+
+
+def _truncate_tokens(text, max_tokens, model=DEFAULT_MODEL):
+    """
+    Cuts a text to at most max_tokens tokens.
+
+    Without tiktoken, the text is cut at four characters per token, the estimate count_tokens uses.
+
+    Returns:
+        A (text, tokens) tuple with the possibly shortened text and its token count.
+    """
+    if tiktoken is None:
+        text = text[:max_tokens * 4]
+        return text, count_tokens(text, model)
+    encoding = _encoding_for_model(model)
+    tokens = encoding.encode(text)
+    if len(tokens) > max_tokens:
+        tokens = tokens[:max_tokens]
+        text = encoding.decode(tokens)
+    return text, len(tokens)
+
+
+_encodings = {}
+
+
+def _encoding_for_model(model):
+    """Returns the tiktoken encoding for a model, falling back to cl100k_base for unknown models."""
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
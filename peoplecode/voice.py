@@ -0,0 +1,166 @@
+# voice.py
+# Spoken conversations that start speaking an answer while it is still being generated.
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .constants import DEFAULT_TTS_CONCURRENCY, DEFAULT_VOICE_METRICS_TURNS
+from .audio import _is_audio_buffer
+
+
+class VoiceSession:
+    """
+    Voice loop on top of an OpenAI_Conversation that answers spoken questions with speech.
+
+    The three stages overlap instead of running one after another: audio segments are transcribed
+    as they arrive, the reply is streamed from the chat model, and each finished sentence is sent
+    to the TTS model while later sentences are still being generated. Starting a new turn or calling
+    cancel() stops the turn in flight (barge-in).
+    """
+
+    def __init__(self, conversation, instructions, voice=None, assistant_id=None,
+                 concurrency=DEFAULT_TTS_CONCURRENCY):
+        """
+        Initializes the session.
+
+        Args:
+            conversation: The OpenAI_Conversation used for every stage. Its history holds the dialogue.
+            instructions: Instructions for the model.
+            voice: The TTS voice to use.
+            assistant_id: The assistant ID to use, if any.
+            concurrency: The maximum number of transcription or TTS requests in flight at once.
+        """
+        self._conversation = conversation
+        self._instructions = instructions
+        self._voice = voice
+        self._assistant_id = assistant_id
+        self._concurrency = concurrency
+        self._lock = threading.Lock()
+        self._turn = None
+        self.metrics = deque(maxlen=DEFAULT_VOICE_METRICS_TURNS)
+
+    @property
+    def last_metrics(self):
+        """The latency metrics of the most recent turn, or None if there has been no turn."""
+        return self.metrics[-1] if self.metrics else None
+
+    def respond(self, audio):
+        """
+        Answers a spoken question, yielding the spoken reply sentence by sentence.
+
+        Any turn still in flight is cancelled first. Latencies of the turn are recorded in a dict
+        appended to metrics, with these keys (seconds, None if the stage did not finish):
+            transcript: The transcribed question.
+            stt: From the end of the audio input to the transcript.
+            chat_first_token: From the transcript to the first piece of the reply.
+            chat: From the transcript to the end of the reply.
+            tts: Synthesis time of each yielded sentence, in order.
+            first_audio: From the end of the audio input to the first audio being ready.
+            total: From the end of the audio input to the end of the turn.
+            cancelled: Whether the turn was cut short.
+
+        Args:
+            audio: The recorded question as a path, bytes, a buffer or a binary file object, or an
+                iterable of such recorded segments, which are transcribed while later ones are recorded.
+
+        Yields:
+            (sentence, audio) tuples in order. audio is None if the sentence could not be converted.
+        """
+        self.cancel()
+        turn = {"cancelled": threading.Event(), "pending": queue.Queue(), "finished": False,
+                "metrics": dict.fromkeys(("transcript", "stt", "chat_first_token", "chat", "first_audio", "total"))}
+        turn["metrics"].update(tts=[], cancelled=False)
+        with self._lock:
+            self._turn = turn
+        self.metrics.append(turn["metrics"])
+        executor = ThreadPoolExecutor(max_workers=self._concurrency)
+        threading.Thread(target=self._produce, args=(audio, turn, executor), daemon=True).start()
+        try:
+            while (item := turn["pending"].get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                sentence, future = item
+                speech, seconds = future.result()
+                if turn["cancelled"].is_set():
+                    break
+                turn["metrics"]["tts"].append(seconds)
+                if turn["metrics"]["first_audio"] is None:
+                    turn["metrics"]["first_audio"] = self._elapsed(turn)
+                yield sentence, speech
+            else:
+                turn["finished"] = True
+        finally:
+            if not turn["finished"]:
+                turn["metrics"]["cancelled"] = True
+            turn["cancelled"].set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            if "heard" in turn:
+                turn["metrics"]["total"] = self._elapsed(turn)
+
+    def cancel(self):
+        """Stops the turn in flight, if any: its pending transcription, chat and TTS work is dropped."""
+        with self._lock:
+            turn, self._turn = self._turn, None
+        if turn is not None and not turn["cancelled"].is_set():
+            turn["metrics"]["cancelled"] = True
+            turn["cancelled"].set()
+            # Wake respond() if it is waiting for the next sentence
+            turn["pending"].put(None)
+
+    def _produce(self, audio, turn, executor):
+        """Runs the transcription and chat stages of a turn, queueing each sentence's TTS as soon as it is complete."""
+        cancelled, pending, metrics = turn["cancelled"], turn["pending"], turn["metrics"]
+        try:
+            question = self._transcribe(audio, turn, executor)
+            metrics["transcript"], metrics["stt"] = question, self._elapsed(turn)
+            if cancelled.is_set():
+                return
+            chat_started = time.perf_counter()
+            stream = self._conversation.ask_question_stream(self._instructions, question, self._assistant_id)
+            buffer = ""
+            try:
+                for chunk in stream:
+                    if cancelled.is_set():
+                        return
+                    if metrics["chat_first_token"] is None:
+                        metrics["chat_first_token"] = time.perf_counter() - chat_started
+                    sentences, buffer = self._conversation._complete_sentences(buffer + chunk)
+                    for sentence in sentences:
+                        pending.put((sentence, executor.submit(self._speak, sentence)))
+            finally:
+                stream.close()
+            metrics["chat"] = time.perf_counter() - chat_started
+            if buffer.strip() and not cancelled.is_set():
+                pending.put((buffer.strip(), executor.submit(self._speak, buffer.strip())))
+        except Exception as e:
+            if not cancelled.is_set():
+                pending.put(e)
+        finally:
+            pending.put(None)
+
+    def _transcribe(self, audio, turn, executor):
+        """Transcribes a recording, or each recorded segment as it arrives, and returns the question."""
+        if isinstance(audio, (str, os.PathLike)) or _is_audio_buffer(audio) or hasattr(audio, "read"):
+            turn["heard"] = time.perf_counter()
+            return self._conversation.speech_recognition(audio)
+        futures = []
+        for segment in audio:
+            if turn["cancelled"].is_set():
+                break
+            futures.append(executor.submit(self._conversation.speech_recognition, segment))
+        turn["heard"] = time.perf_counter()
+        return " ".join(text.strip() for text in (future.result() for future in futures) if text and text.strip())
+
+    def _speak(self, sentence):
+        """Synthesizes one sentence and returns its audio with the seconds it took."""
+        started = time.perf_counter()
+        speech = self._conversation.text_to_speech(sentence, self._voice)
+        return speech, time.perf_counter() - started
+
+    @staticmethod
+    def _elapsed(turn):
+        return time.perf_counter() - turn["heard"]
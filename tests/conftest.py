@@ -0,0 +1,21 @@
+# conftest.py
+# Lets the tests import the library and the mock server from the repository checkout, and serves the mock API.
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "Benchmarks")]
+
+from MockOpenAIServer import MockOpenAIServer  # noqa: E402
+
+
+@pytest.fixture
+def mock_server():
+    """A MockOpenAIServer without simulated latency."""
+    server = MockOpenAIServer(first_token_delay=0, token_delay=0, poll_after_ms=10, batch_delay=0,
+                              embedding_delay=0).start()
+    yield server
+    server.stop()
@@ -0,0 +1,65 @@
+# test_audio.py
+# Tests for splitting long recordings into chunks and stitching their transcripts back together.
+
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from peoplecode.audio import _split_wav, _stitch_transcripts
+
+RATE = 16000
+
+
+def _wav(*segments):
+    """Builds a mono 16-bit WAV from (seconds, loud) segments: a tone if loud, otherwise silence."""
+    samples = []
+    for seconds, loud in segments:
+        times = np.arange(int(seconds * RATE)) / RATE
+        samples.append((np.sin(2 * np.pi * 440 * times) * 8000 * loud).astype(np.int16))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(np.concatenate(samples).tobytes())
+    return buffer.getvalue()
+
+
+def _seconds(data):
+    with wave.open(io.BytesIO(data)) as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def test_split_wav_cuts_in_silence():
+    data = _wav((2.5, True), (0.5, False), (3.0, True))
+    chunks = _split_wav(data, chunk_seconds=4, overlap_seconds=0.5)
+
+    assert len(chunks) == 2
+    cut = _seconds(chunks[0])
+    assert 2.5 <= cut <= 3.0
+    # The second chunk repeats the overlap before the cut and runs to the end
+    assert _seconds(chunks[1]) == pytest.approx(6.0 - (cut - 0.5), abs=1 / RATE)
+
+
+def test_split_wav_cuts_long_recordings_at_the_chunk_length():
+    chunks = _split_wav(_wav((10.0, True)), chunk_seconds=4, overlap_seconds=1)
+
+    assert all(_seconds(chunk) <= 4 for chunk in chunks)
+    assert sum(_seconds(chunk) for chunk in chunks) - (len(chunks) - 1) * 1 == pytest.approx(10.0, abs=0.01)
+
+
+def test_split_wav_keeps_short_recordings_and_rejects_other_formats():
+    data = _wav((1.0, True))
+    assert _split_wav(data, chunk_seconds=4, overlap_seconds=1) == [data]
+    assert _split_wav(b"ID3 not a wav", chunk_seconds=4, overlap_seconds=1) is None
+
+
+def test_stitch_transcripts_drops_repeated_overlap():
+    texts = ["hello world how are", "How are you today", "today, I am fine."]
+    assert _stitch_transcripts(texts) == "hello world how are you today I am fine."
+
+
+def test_stitch_transcripts_keeps_chunks_without_overlap():
+    assert _stitch_transcripts(["one two", "three four", ""]) == "one two three four"
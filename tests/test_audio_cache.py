@@ -0,0 +1,25 @@
+# test_audio_cache.py
+# Tests for the on-disk LRU store of synthesized speech.
+
+from peoplecode.caches import AudioCache
+
+
+def test_hit_survives_eviction_while_streaming(tmp_path):
+    cache = AudioCache(tmp_path, max_bytes=10)
+    cache.put("first", b"123456")
+    chunks = cache.iter_chunks("first", chunk_size=4)
+    # Storing a second clip evicts the first before its chunks are read
+    cache.put("second", b"abcdefgh")
+
+    assert list(chunks) == [b"1234", b"56"]
+    assert cache.get("first") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": 8}
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = AudioCache(tmp_path)
+    cache.put("clip", b"audio")
+    (tmp_path / "clip.audio").unlink()
+
+    assert cache.iter_chunks("clip") is None
+    assert cache.stats()["misses"] == 1
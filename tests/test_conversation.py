@@ -0,0 +1,43 @@
+# test_conversation.py
+# Tests for reply parsing and history handling in the conversation classes, against the mock server.
+
+import json
+
+from PeopleCodeOpenAI import MESSAGE_TOKEN_OVERHEAD, OpenAI_Conversation, _BaseConversation, count_tokens
+
+ANSWER = "A fairly long answer about the civil rights movement."
+
+
+def test_parse_items_reads_structured_replies():
+    reply = json.dumps({"item_1": "First", "item_2": "Second", "item_3": "Third"})
+    assert _BaseConversation._parse_items(reply, 2) == ["First", "Second"]
+    assert _BaseConversation._parse_items(json.dumps({"items": ["a", "b", 3]}), 5) == ["a", "b", "3"]
+    assert _BaseConversation._parse_items(json.dumps(["x", {"nested": 1}, "y"]), 5) == ["x", "y"]
+
+
+def test_parse_items_cleans_plain_text_lists():
+    reply = "Here are some questions:\n1. What is SNCC?\n- \"Who was Ella Baker?\"\n\n2) What is SNCC?\n* Why?"
+    assert _BaseConversation._parse_items(reply, 5) == ["What is SNCC?", "Who was Ella Baker?", "Why?"]
+
+
+def test_parse_items_splits_on_percent_markers():
+    assert _BaseConversation._parse_items("one%%two\n%% three %%", 5) == ["one", "two", "three"]
+    assert _BaseConversation._parse_items(None, 3) == []
+
+
+def test_dropped_history_is_summarized_before_the_next_question(mock_server):
+    mock_server.reply = lambda body: "SUMMARY" if "Summarize" in body["messages"][0]["content"] else ANSWER
+    conversation = OpenAI_Conversation("test-key", base_url=mock_server.base_url)
+    # Room for one answer and the summary, but not for two answers
+    budget = 2 * (count_tokens(ANSWER) + MESSAGE_TOKEN_OVERHEAD) - 1
+    conversation.set_history_budget(budget, summarize=True)
+
+    conversation.ask_question("Be brief.", "Who was Ella Baker?")
+    conversation.ask_question("Be brief.", "What did SNCC do?")
+    conversation.ask_question("Be brief.", "Who founded it?")
+
+    history = conversation._prev_conversation
+    assert history.summary == "SUMMARY"
+    assert history.total_tokens <= budget
+    assert history.messages == [{"role": "assistant", "content": ANSWER}]
+    assert history.for_request()[0]["content"] == "Summary of the earlier conversation: SUMMARY"
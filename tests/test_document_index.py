@@ -0,0 +1,96 @@
+# test_document_index.py
+# Tests for the local vector index behind add_documents and search_documents.
+
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from peoplecode.retrieval import DocumentIndex
+
+
+def _vectors(*rows):
+    return np.array(rows, dtype=np.float32)
+
+
+def _build(directory):
+    index = DocumentIndex(directory, chunk_words=4, overlap_words=1)
+    index.add("a.txt", "a1", ["alpha passage"], _vectors([1, 0, 0]), "test-embedding")
+    index.add("b.txt", "b1", ["beta passage"], _vectors([0, 1, 0]), "test-embedding")
+    return index
+
+
+def test_add_and_search(tmp_path):
+    index = _build(tmp_path)
+
+    assert len(index) == 2
+    assert index.embedding_model == "test-embedding"
+    assert index.is_current("a.txt", "a1") and not index.is_current("a.txt", "a2")
+    hits = index.search([0.1, 1, 0], top_k=1)
+    assert [(hit["source"], hit["text"]) for hit in hits] == [("b.txt", "beta passage")]
+    assert hits[0]["score"] == pytest.approx(1 / np.sqrt(1.01))
+
+
+def test_add_replaces_an_earlier_version(tmp_path):
+    index = _build(tmp_path)
+    index.add("a.txt", "a2", ["gamma passage", "delta passage"], _vectors([0, 0, 1], [1, 1, 0]), "test-embedding")
+
+    assert len(index) == 3
+    assert index.is_current("a.txt", "a2")
+    assert [hit["text"] for hit in index.search([1, 0, 0.1], top_k=3)] == ["delta passage", "gamma passage",
+                                                                           "beta passage"]
+    index.remove("b.txt")
+    assert [hit["text"] for hit in index.search([0, 1, 0], top_k=3)] == ["delta passage", "gamma passage"]
+
+
+def test_reopen_keeps_passages_and_vectors(tmp_path):
+    index = _build(tmp_path)
+    index.add("a.txt", "a2", ["gamma passage"], _vectors([0, 0, 1]), "test-embedding")
+
+    reopened = DocumentIndex(tmp_path, chunk_words=4, overlap_words=1)
+    assert len(reopened) == 2
+    assert reopened.is_current("a.txt", "a2")
+    assert [hit["text"] for hit in reopened.search([0, 0, 1], top_k=2)] == ["gamma passage", "beta passage"]
+
+
+def test_rejects_other_embeddings(tmp_path):
+    index = _build(tmp_path)
+    with pytest.raises(ValueError):
+        index.add("c.txt", "c1", ["passage"], _vectors([1, 0, 0]), "other-embedding")
+    with pytest.raises(ValueError):
+        index.add("c.txt", "c1", ["passage"], _vectors([1, 0]), "test-embedding")
+
+
+def test_split_overlaps_passages(tmp_path):
+    index = DocumentIndex(tmp_path, chunk_words=4, overlap_words=1)
+    assert index.split("one two three four five six seven") == ["one two three four", "four five six seven"]
+    with pytest.raises(ValueError):
+        DocumentIndex(tmp_path, chunk_words=4, overlap_words=4)
+
+
+def test_crash_between_vectors_and_metadata_keeps_previous_index(tmp_path):
+    _build(tmp_path)
+    # Replace and remove documents in a child process that dies right before each metadata save
+    script = textwrap.dedent(f"""
+        import os, sys
+        sys.path[:0] = {sys.path!r}
+        import numpy as np
+        from peoplecode.retrieval import DocumentIndex
+        DocumentIndex._save = lambda self: os._exit(1)
+        index = DocumentIndex({str(tmp_path)!r}, chunk_words=4, overlap_words=1)
+        if sys.argv[1] == "replace":
+            index.add("a.txt", "a2", ["new alpha", "more alpha"], np.eye(2, 3, dtype=np.float32), "test-embedding")
+        else:
+            index.remove("a.txt")
+    """)
+    for action in ("replace", "remove"):
+        child = subprocess.run([sys.executable, "-c", script, action])
+        assert child.returncode == 1
+
+        index = DocumentIndex(tmp_path, chunk_words=4, overlap_words=1)
+        assert len(index) == 2
+        assert index.is_current("a.txt", "a1")
+        assert [hit["text"] for hit in index.search([1, 0, 0], top_k=2)] == ["alpha passage", "beta passage"]
+    assert sorted(path.name for path in tmp_path.glob("vectors*.f32")) == ["vectors.f32"]
@@ -0,0 +1,67 @@
+# test_history.py
+# Tests for the token-budgeted conversation history.
+
+import pytest
+
+from peoplecode.constants import MESSAGE_TOKEN_OVERHEAD
+from peoplecode.history import ConversationHistory
+from peoplecode.tokens import count_tokens
+
+
+def _message(text):
+    return {"role": "assistant", "content": text}
+
+
+def _tokens(text):
+    return count_tokens(text) + MESSAGE_TOKEN_OVERHEAD
+
+
+def test_trim_drops_oldest_messages_over_budget():
+    texts = ["first answer here", "second answer here", "third answer here"]
+    history = ConversationHistory(max_tokens=_tokens(texts[1]) + _tokens(texts[2]), summarize=True)
+    for text in texts:
+        history.append(_message(text))
+
+    assert [message["content"] for message in history] == texts[1:]
+    assert history.total_tokens == _tokens(texts[1]) + _tokens(texts[2])
+    assert history.take_dropped() == [_message(texts[0])]
+    assert history.take_dropped() == []
+
+
+def test_summary_counts_toward_the_budget():
+    texts = ["first answer here", "second answer here"]
+    history = ConversationHistory(max_tokens=_tokens(texts[0]) + _tokens(texts[1]), summarize=True)
+    for text in texts:
+        history.append(_message(text))
+    assert len(history) == 2
+
+    history.set_summary("They talked about answers.")
+
+    assert [message["content"] for message in history] == texts[1:]
+    assert history.total_tokens == _tokens(texts[1]) + _tokens("They talked about answers.")
+    assert history.for_request()[0] == {"role": "system",
+                                        "content": "Summary of the earlier conversation: They talked about answers."}
+
+
+def test_newest_message_is_kept_over_budget():
+    history = ConversationHistory(max_tokens=1)
+    history.append(_message("an answer far longer than the budget"))
+    history.append(_message("another answer far longer than the budget"))
+
+    assert [message["content"] for message in history] == ["another answer far longer than the budget"]
+    # Without summarize, dropped messages are not kept
+    assert history.take_dropped() == []
+
+
+def test_clear_resets_messages_and_summary():
+    history = ConversationHistory(max_tokens=100, summarize=True)
+    history.append(_message("an answer"))
+    history.set_summary("A summary.")
+    history.clear()
+
+    assert len(history) == 0 and history.summary is None and history.total_tokens == 0
+
+
+def test_budget_must_be_positive():
+    with pytest.raises(ValueError):
+        ConversationHistory(max_tokens=0)
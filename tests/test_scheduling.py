@@ -0,0 +1,126 @@
+# test_scheduling.py
+# Tests for the request scheduler and the httpx transports that send requests through it.
+
+import asyncio
+import random
+import time
+
+import httpx
+import pytest
+
+from peoplecode import scheduling
+from peoplecode.scheduling import (RequestScheduler, _AsyncSchedulingTransport, _SchedulingTransport,
+                                   _parse_duration)
+
+CHAT_REQUEST = {"model": "gpt-4", "messages": [{"role": "user", "content": "Hello"}]}
+
+
+class _Clock:
+    """Stands in for the time module, so rate-limit windows can be tested without waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(scheduling, "time", clock)
+    return clock
+
+
+def test_retries_429_after_retry_after(mock_server):
+    mock_server.fail_next(2, headers={"retry-after-ms": "100"})
+    started = time.perf_counter()
+    with httpx.Client(transport=_SchedulingTransport(RequestScheduler()), base_url=mock_server.base_url) as client:
+        response = client.post("/chat/completions", json=CHAT_REQUEST)
+
+    assert response.status_code == 200
+    assert mock_server.request_count == 3
+    assert time.perf_counter() - started >= 0.2
+
+
+def test_returns_last_failure_after_max_retries(mock_server):
+    mock_server.fail_next(3, status=503, headers={"retry-after": "0"})
+    transport = _SchedulingTransport(RequestScheduler(max_retries=1))
+    with httpx.Client(transport=transport, base_url=mock_server.base_url) as client:
+        response = client.post("/chat/completions", json=CHAT_REQUEST)
+
+    assert response.status_code == 503
+    assert mock_server.request_count == 2
+
+
+def test_async_transport_retries_429(mock_server):
+    mock_server.fail_next(headers={"retry-after-ms": "50"})
+
+    async def post():
+        transport = _AsyncSchedulingTransport(RequestScheduler())
+        async with httpx.AsyncClient(transport=transport, base_url=mock_server.base_url) as client:
+            return await client.post("/chat/completions", json=CHAT_REQUEST)
+
+    assert asyncio.run(post()).status_code == 200
+    assert mock_server.request_count == 2
+
+
+def test_requests_per_minute_window(clock):
+    scheduler = RequestScheduler(limits={"gpt-4": (2, None)})
+    assert scheduler.delay("gpt-4", 10) == 0
+    clock.now += 20
+    assert scheduler.delay("gpt-4", 10) == 0
+    assert scheduler.delay("gpt-4", 10) == pytest.approx(40)
+    # Other models have their own window
+    assert scheduler.delay("gpt-4o", 10) == 0
+
+    clock.now += 40
+    assert scheduler.delay("gpt-4", 10) == 0
+
+
+def test_tokens_per_minute_window(clock):
+    scheduler = RequestScheduler(limits={"gpt-4": (None, 100)})
+    assert scheduler.delay("gpt-4", 60) == 0
+    clock.now += 30
+    assert scheduler.delay("gpt-4", 30) == 0
+    assert scheduler.delay("gpt-4", 30) == pytest.approx(30)
+
+    clock.now += 30
+    assert scheduler.delay("gpt-4", 30) == 0
+
+
+def test_rate_limit_headers_set_the_budget(clock):
+    scheduler = RequestScheduler()
+    scheduler.update("gpt-4", {"x-ratelimit-remaining-requests": "1", "x-ratelimit-reset-requests": "1.5s",
+                               "x-ratelimit-remaining-tokens": "500", "x-ratelimit-reset-tokens": "6m0s"})
+    assert scheduler.delay("gpt-4", 100) == 0
+    assert scheduler.delay("gpt-4", 100) == pytest.approx(1.5)
+
+    clock.now += 1.5
+    scheduler.update("gpt-4", {"x-ratelimit-remaining-requests": "10"})
+    assert scheduler.delay("gpt-4", 1000) == pytest.approx(358.5)
+
+
+def test_backoff_honours_retry_after_headers():
+    scheduler = RequestScheduler()
+    assert scheduler.backoff(3, {"retry-after-ms": "250"}) == 0.25
+    assert scheduler.backoff(3, {"retry-after": "2"}) == 2.0
+
+
+def test_backoff_is_jittered_and_capped():
+    random.seed(0)
+    scheduler = RequestScheduler(backoff_base=0.5, backoff_max=4.0)
+    first = [scheduler.backoff(0) for _ in range(200)]
+    late = [scheduler.backoff(10) for _ in range(200)]
+
+    assert all(0 <= delay <= 0.5 for delay in first)
+    assert all(0 <= delay <= 4.0 for delay in late)
+    assert len(set(first)) == len(first)
+    assert max(late) > 2.0
+
+
+def test_parse_duration():
+    assert _parse_duration("6m0s") == 360
+    assert _parse_duration("1.5s") == 1.5
+    assert _parse_duration("20ms") == pytest.approx(0.02)
+    assert _parse_duration("1h2m") == 3720
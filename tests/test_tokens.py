@@ -0,0 +1,16 @@
+# test_tokens.py
+# Tests for token counting and the token limits applied before requests are sent.
+
+from peoplecode.constants import EMBEDDING_MAX_INPUT_TOKENS
+from peoplecode.tokens import _truncate_tokens, count_tokens
+
+
+def test_truncate_tokens_cuts_oversized_text():
+    text, tokens = _truncate_tokens("word " * 20000, EMBEDDING_MAX_INPUT_TOKENS, "text-embedding-3-small")
+
+    assert tokens == count_tokens(text, "text-embedding-3-small") <= EMBEDDING_MAX_INPUT_TOKENS
+    assert text.startswith("word word")
+
+
+def test_truncate_tokens_keeps_short_text():
+    assert _truncate_tokens("a short question", 100) == ("a short question", count_tokens("a short question"))